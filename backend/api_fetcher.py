@@ -0,0 +1,244 @@
+import json
+import logging
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+RECORD_KEYS = ("data", "results", "items", "records", "rows", "value")
+NEXT_URL_KEYS = ("next", "next_url", "nextUrl", "next_page_url", "@odata.nextLink")
+CURSOR_KEYS = ("next_cursor", "nextCursor", "cursor", "next_page_token", "nextPageToken", "continuation")
+NESTED_KEYS = ("meta", "pagination", "paging", "links", "_links")
+
+
+# ---------- Helpers ----------
+def with_params(url: str, **params) -> str:
+    parsed = urllib.parse.urlparse(url)
+    query = dict(urllib.parse.parse_qsl(parsed.query))
+    query.update({k: str(v) for k, v in params.items()})
+    return urllib.parse.urlunparse(parsed._replace(query=urllib.parse.urlencode(query)))
+
+
+def is_ndjson(url: str, content_type: str = "") -> bool:
+    path = urllib.parse.urlparse(url).path
+    return path.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type or "jsonl" in content_type
+
+
+def extract_records(body):
+    """Find the list of records in a JSON page: the body itself or its data/results/items/... list.
+
+    A dict of equal-length lists is column-oriented ({"a": [1, 2], "b": [3, 4]})
+    and becomes one record per position, scalars repeated, as pd.DataFrame(body) would.
+    """
+    if isinstance(body, list):
+        return body
+    if isinstance(body, dict):
+        for key in RECORD_KEYS:
+            if isinstance(body.get(key), list):
+                return body[key]
+        lists = {k: v for k, v in body.items() if isinstance(v, list)}
+        if len(lists) == 1:
+            return next(iter(lists.values()))
+        if len(lists) > 1 and len({len(v) for v in lists.values()}) == 1:
+            columns = [k for k, v in body.items() if not isinstance(v, dict)]  # body order, as pd.DataFrame keeps it
+            return [{k: row[k] if k in lists else body[k] for k in columns}
+                    for row in (dict(zip(lists, values)) for values in zip(*lists.values()))]
+        return [body]
+    return []
+
+
+def _find_next(body: dict, url: str, cursor_param: str):
+    """Next page URL from a body-level next link or cursor, looking one level into meta/pagination."""
+    scopes = [body] + [body[k] for k in NESTED_KEYS if isinstance(body.get(k), dict)]
+    for scope in scopes:
+        for key in NEXT_URL_KEYS:
+            value = scope.get(key)
+            if isinstance(value, dict):
+                value = value.get("href")
+            if isinstance(value, str) and value:
+                return urllib.parse.urljoin(url, value)
+        for key in CURSOR_KEYS:
+            value = scope.get(key)
+            if value not in (None, "", False):
+                return with_params(url, **{cursor_param: value})
+    return None
+
+
+# ---------- Fetcher ----------
+class JsonApiFetcher:
+    """Fetch a JSON API page by page and yield records as DataFrame batches.
+
+    Pagination is followed through a Link: rel="next" header, a next URL or
+    cursor in the body, or explicit offset/limit paging (pagination="offset").
+    Cursor and link pages are prefetched one ahead while the current page is
+    being converted; offset pages are fetched `prefetch` at a time. NDJSON and,
+    when ijson is installed, bare JSON arrays are parsed incrementally, so
+    memory stays around one batch of `batch_rows` records.
+    """
+
+    def __init__(self, session, batch_rows=50_000, pagination="auto", page_size=1000,
+                 offset_param="offset", limit_param="limit", cursor_param="cursor",
+                 prefetch=4, timeout=15, max_pages=10_000):
+        self.session = session
+        self.batch_rows = batch_rows
+        self.pagination = pagination
+        self.page_size = page_size
+        self.offset_param = offset_param
+        self.limit_param = limit_param
+        self.cursor_param = cursor_param
+        self.prefetch = max(1, prefetch)
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.pages = 0
+
+    # ---------- Page Fetching ----------
+    def _get(self, url, stream=False):
+        response = self.session.get(url, timeout=self.timeout, stream=stream, headers={"Accept": "application/json"})
+        response.raise_for_status()
+        return response
+
+    def _fetch_page(self, url):
+        """Fetch one page fully: (records, next_url)."""
+        response = self._get(url)
+        body = response.json()
+        next_url = response.links.get("next", {}).get("url")
+        if next_url:
+            next_url = urllib.parse.urljoin(url, next_url)
+        elif isinstance(body, dict):
+            next_url = _find_next(body, url, self.cursor_param)
+        return extract_records(body), next_url
+
+    # ---------- Record Streams ----------
+    def _iter_ndjson(self, response):
+        self.pages += 1
+        for line in response.iter_lines():
+            if line.strip():
+                yield json.loads(line)
+
+    def _iter_linked_pages(self, url):
+        """Follow next links/cursors, fetching page N+1 while page N is consumed."""
+        seen = set()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch") as executor:
+            pending = executor.submit(self._fetch_page, url)
+            while pending is not None:
+                records, next_url = pending.result()
+                self.pages += 1
+                seen.add(url)
+                if not records:
+                    next_url = None  # empty page ends the stream even if a cursor is echoed
+                if next_url in seen:
+                    next_url = None
+                elif next_url and self._at_page_cap(url):
+                    next_url = None
+                pending = executor.submit(self._fetch_page, next_url) if next_url else None
+                url = next_url
+                yield from records
+
+    def _at_page_cap(self, url) -> bool:
+        if self.max_pages and self.pages >= self.max_pages:
+            logger.warning("stopped paging %s after max_pages=%d; later pages were not fetched", url, self.max_pages)
+            return True
+        return False
+
+    def _iter_offset_pages(self, url):
+        """Offset/limit paging with `prefetch` pages in flight; stops at the first short or empty page,
+        at a page identical to the previous one (an API that ignores the offset) or at max_pages."""
+        with ThreadPoolExecutor(max_workers=self.prefetch, thread_name_prefix="prefetch") as executor:
+            next_offset = 0
+            inflight = []
+            previous = None
+            done = False
+            while not done:
+                while len(inflight) < self.prefetch and not (self.max_pages and self.pages + len(inflight) >= self.max_pages):
+                    page_url = with_params(url, **{self.offset_param: next_offset, self.limit_param: self.page_size})
+                    inflight.append(executor.submit(self._fetch_page, page_url))
+                    next_offset += self.page_size
+                if not inflight:
+                    self._at_page_cap(url)
+                    break
+                records, _ = inflight.pop(0).result()
+                self.pages += 1
+                if records and records == previous:
+                    logger.warning("%s returned the same page for offset %s; the API ignores %r",
+                                   url, (self.pages - 1) * self.page_size, self.offset_param)
+                    break
+                yield from records
+                previous = records
+                if len(records) < self.page_size:
+                    done = True
+            for future in inflight:
+                future.cancel()
+
+    def iter_records(self, url):
+        if self.pagination == "offset":
+            yield from self._iter_offset_pages(url)
+            return
+        if is_ndjson(url):
+            yield from self._iter_ndjson(self._get(url, stream=True))
+            return
+        response = self._get(url, stream=True)
+        content_type = response.headers.get("Content-Type", "")
+        if is_ndjson(url, content_type):
+            yield from self._iter_ndjson(response)
+            return
+        if IJSON_AVAILABLE and "next" not in response.links:
+            # Peek the first byte: only a bare array can be streamed item by item
+            response.raw.decode_content = True
+            first = response.raw.read(1)
+            while first.isspace():
+                first = response.raw.read(1)
+            if first == b"[":
+                self.pages += 1
+                yield from ijson.items(_prefixed(first, response.raw), "item", use_float=True)
+                return
+            body = json.loads(first + response.raw.read())
+        else:
+            body = response.json()
+        # Paged API: hand the first page to the prefetching loop's bookkeeping
+        next_url = response.links.get("next", {}).get("url")
+        if next_url:
+            next_url = urllib.parse.urljoin(url, next_url)
+        elif isinstance(body, dict):
+            next_url = _find_next(body, url, self.cursor_param)
+        records = extract_records(body)
+        self.pages += 1
+        yield from records
+        if next_url and records and not self._at_page_cap(url):
+            yield from self._iter_linked_pages(next_url)
+
+    def iter_batches(self, url):
+        """Yield DataFrames of at most `batch_rows` records."""
+        batch = []
+        for record in self.iter_records(url):
+            batch.append(record)
+            if len(batch) >= self.batch_rows:
+                yield pd.DataFrame.from_records(batch) if isinstance(batch[0], dict) else pd.DataFrame(batch)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch) if isinstance(batch[0], dict) else pd.DataFrame(batch)
+
+
+class _prefixed:
+    """File-like that replays already-consumed leading bytes before the rest of a stream."""
+
+    def __init__(self, prefix: bytes, raw):
+        self._prefix = prefix
+        self._raw = raw
+
+    def read(self, size=-1):
+        if size == 0:  # ijson probes read(0) to detect bytes vs str
+            return b""
+        if self._prefix:
+            head, self._prefix = self._prefix, b""
+            if size is None or size < 0:
+                return head + self._raw.read()
+            return head + self._raw.read(max(size - len(head), 0))
+        return self._raw.read(size)
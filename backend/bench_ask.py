@@ -0,0 +1,680 @@
+"""Offline benchmark of the /ask pipeline: no Snowflake or OpenAI account needed.
+
+Usage: python bench_ask.py [--engine duckdb|sqlite] [--scale 0.05] [--requests 40]
+                           [--concurrency 4] [--llm-ms 400] [--stages ask,ask_stream,run_query,chart,insights,loader]
+                           [--warm-caches] [--loader-backend write_pandas|copy]
+                           [--out result.json] [--compare baseline.json]
+
+Snowflake is replaced through the pool's connect= hook by a local DuckDB (or
+SQLite) database filled with generated data: every table and column listed in
+metadata.txt, at `--scale` times its documented row count, from a fixed seed.
+OpenAI is replaced by a stub that answers a fixed question set with canned SQL
+after `--llm-ms` of simulated latency.
+
+Each stage is driven `--requests` times at `--concurrency`. The output gives
+p50/p95/p99 latency and throughput per stage. For `ask`, it also breaks the
+time down by sub-stage: generate_sql, query, summary, chart and insights.
+For `ask_stream`, it also reports the time to the first event.
+By default the SQL, result and chart caches are disabled, so each call pays
+for the whole pipeline. With --out, the numbers are written as JSON tagged
+with the git commit. --compare prints the change against such a file, so
+runs can be compared across commits. --loader-backend copy runs the loader
+stage through the stage-and-COPY backend with a local directory as the stage.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+import loader
+import server
+from bulk_copy import BulkCopyWriter, LocalStage
+from chart_cache import ChartCache
+from pool import SnowflakePool
+from result_cache import ResultCache
+from schema_index import SchemaIndex, count_tokens
+from sql_cache import SqlCache
+
+# question -> SQL the stub LLM answers with (portable across Snowflake, DuckDB and SQLite)
+QUESTIONS = {
+    "Total sales by store geo": (
+        "SELECT s.GEO, SUM(t.TOTAL_AMOUNT) AS TOTAL_SALES FROM HACKATHON.RAW.TRANSACTIONS t "
+        "JOIN HACKATHON.RAW.STORES s ON t.STORE_ID = s.STORE_ID GROUP BY s.GEO ORDER BY TOTAL_SALES DESC"),
+    "Top 10 products by revenue": (
+        "SELECT p.PRODUCT_NAME, SUM(tl.LINE_AMOUNT) AS REVENUE FROM HACKATHON.RAW.TRANSACTION_LINES tl "
+        "JOIN HACKATHON.RAW.PRODUCTS p ON tl.PRODUCT_ID = p.PRODUCT_ID "
+        "GROUP BY p.PRODUCT_NAME ORDER BY REVENUE DESC LIMIT 10"),
+    "How many VIP customers are there?": (
+        "SELECT COUNT(*) AS VIP_CUSTOMERS FROM HACKATHON.RAW.DIM_CUSTOMERS "
+        "WHERE VIP_STATUS = 'VIP' AND IS_CURRENT = 1"),
+    "Monthly transaction count": (
+        "SELECT SUBSTR(TXN_DATE, 1, 7) AS TXN_MONTH, COUNT(*) AS TXN_COUNT FROM HACKATHON.RAW.TRANSACTIONS "
+        "GROUP BY SUBSTR(TXN_DATE, 1, 7) ORDER BY TXN_MONTH"),
+    "Payments by method": (
+        "SELECT PAYMENT_METHOD, COUNT(*) AS PAYMENTS, SUM(AMOUNT) AS TOTAL_AMOUNT FROM HACKATHON.RAW.FINANCE_ENTRIES "
+        "WHERE EVENT_TYPE = 'payment' GROUP BY PAYMENT_METHOD ORDER BY TOTAL_AMOUNT DESC"),
+    "Current price of every product": (
+        "SELECT PRODUCT_ID, PRICE, CURRENCY FROM HACKATHON.RAW.PRODUCT_PRICES WHERE IS_CURRENT = 1 ORDER BY PRODUCT_ID"),
+    "List recent transactions": (
+        "SELECT * FROM HACKATHON.RAW.TRANSACTIONS ORDER BY TXN_DATE DESC LIMIT 5000"),
+    "Points balance distribution": (
+        "SELECT POINTS_BALANCE, COUNT(*) AS FREQUENCY FROM HACKATHON.RAW.LOYALTY_LEDGER "
+        "GROUP BY POINTS_BALANCE ORDER BY POINTS_BALANCE LIMIT 200"),
+}
+CATEGORIES = {
+    "STATUS": ["COMPLETED", "REFUNDED", "CANCELLED"],
+    "PAYMENT_METHOD": ["card", "cash", "gift_card", "mobile"],
+    "EVENT_TYPE": ["payment", "refund", "earn", "redeem"],
+    "GEO": ["NORTH", "SOUTH", "EAST", "WEST", "CENTRAL", "ONLINE"],
+    "CATEGORY": ["Apparel", "Electronics", "Grocery", "Home", "Toys", "Beauty"],
+    "VIP_STATUS": ["VIP", "REGULAR"],
+    "CURRENCY": ["USD", "CAD", "EUR"],
+    "COUNTRY": ["US", "CA", "UK", "DE"],
+}
+
+
+# ---------- Local Warehouse ----------
+def generate_table(table: str, columns: list, rows: int, rng, row_counts: dict) -> pd.DataFrame:
+    """Synthetic rows for one metadata.txt table: ids, foreign keys in range, dates as TEXT, categoricals."""
+    data = {}
+    days = np.datetime64("2022-01-01") + rng.integers(0, 3 * 365, rows).astype("timedelta64[D]")
+    for i, (col, dtype) in enumerate(columns):
+        if i == 0 and col.endswith("_ID"):
+            data[col] = np.arange(1, rows + 1)
+        elif col.endswith("_ID"):
+            parent = {"TXN_ID": "TRANSACTIONS", "SCD_ID": "DIM_CUSTOMERS"}.get(col, col[:-3] + "S")
+            size = row_counts.get(parent) or row_counts.get("DIM_" + parent) or max(rows // 10, 1)
+            data[col] = rng.integers(1, size + 1, rows)
+        elif col in CATEGORIES:
+            data[col] = rng.choice(CATEGORIES[col], rows)
+        elif col.endswith("_DATE"):
+            data[col] = np.datetime_as_string(days + rng.integers(0, 30, rows).astype("timedelta64[D]"))
+        elif col.startswith("IS_"):
+            data[col] = (rng.random(rows) < 0.8).astype(np.int64)
+        elif dtype == "FLOAT":
+            data[col] = rng.gamma(2.0, 40.0, rows).round(2)
+        elif dtype == "NUMBER":
+            data[col] = rng.integers(0, 5000, rows)
+        else:
+            data[col] = np.char.add(f"{col.lower()}_", rng.integers(0, max(rows // 4, 1), rows).astype(str))
+    return pd.DataFrame(data)
+
+
+class LocalWarehouse:
+    """A DuckDB or SQLite database standing in for HACKATHON.RAW behind the connector API."""
+
+    def __init__(self, engine: str = "duckdb"):
+        self.engine = engine
+        self.queries = 0
+        self._lock = threading.Lock()
+        if engine == "duckdb":
+            self._db = duckdb.connect(":memory:")
+            self._db.execute("ATTACH ':memory:' AS HACKATHON")
+            self._db.execute("CREATE SCHEMA HACKATHON.RAW")
+            self._db.execute("USE HACKATHON.RAW")
+        else:
+            self._uri = f"file:bench_{uuid.uuid4().hex}?mode=memory&cache=shared"
+            self._db = sqlite3.connect(self._uri, uri=True, check_same_thread=False)  # keeps the shared db alive
+
+    def connect(self, **_):
+        if self.engine == "duckdb":
+            raw = self._db.cursor()
+            raw.execute("USE HACKATHON.RAW")
+        else:
+            raw = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        return FakeConnection(self, raw)
+
+    def load(self, table: str, df: pd.DataFrame, overwrite: bool = True, raw=None):
+        if self.engine == "duckdb":
+            raw = raw or self._db.cursor()
+            raw.register("_bench_src", df)
+            try:
+                if overwrite:
+                    raw.execute(f'CREATE OR REPLACE TABLE HACKATHON.RAW."{table}" AS SELECT * FROM _bench_src')
+                else:
+                    raw.execute(f'CREATE TABLE IF NOT EXISTS HACKATHON.RAW."{table}" AS SELECT * FROM _bench_src LIMIT 0')
+                    raw.execute(f'INSERT INTO HACKATHON.RAW."{table}" SELECT * FROM _bench_src')
+            finally:
+                raw.unregister("_bench_src")
+        else:
+            with self._lock:
+                df.to_sql(table, raw or self._db, if_exists="replace" if overwrite else "append", index=False)
+
+    def populate(self, metadata: str, scale: float, seed: int):
+        index = SchemaIndex(metadata)
+        rng = np.random.default_rng(seed)
+        counts = {t: max(1, int(n * scale)) for t, n in index.row_counts.items()}
+        for table, columns in sorted(index.columns.items()):
+            self.load(table, generate_table(table, columns, counts.get(table, 1000), rng, counts))
+        return counts
+
+
+class FakeCursor:
+    """Enough of the Snowflake cursor API for server.py and loader.py, with their Snowflake-only statements mapped."""
+
+    _LIKE_RE = re.compile(r"CREATE TABLE IF NOT EXISTS (\S+) LIKE (\S+)", re.IGNORECASE)
+    _SWAP_RE = re.compile(r"ALTER TABLE (\S+) SWAP WITH (\S+)", re.IGNORECASE)
+    _EXPLAIN_RE = re.compile(r"EXPLAIN USING JSON\s+(.+)", re.IGNORECASE | re.DOTALL)
+    # Local plans say nothing about Snowflake bytes: report none, so the preflight always passes
+    _PLAN = json.dumps({"GlobalStats": {"partitionsTotal": 1, "partitionsAssigned": 1, "bytesAssigned": 0},
+                        "Operations": []})
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.connection = conn
+        self._cur = conn.raw.cursor() if conn.warehouse.engine == "sqlite" else conn.raw
+        self.description = None
+        self.sfqid = None
+
+    def _local(self, sql: str) -> str:
+        if self._conn.warehouse.engine == "sqlite":
+            sql = re.sub(r"\bHACKATHON\.RAW\.", "", sql, flags=re.IGNORECASE)
+        return sql.replace("%s", "?")
+
+    def execute(self, sql, params=None):
+        self._conn.warehouse.queries += 1
+        self.sfqid = str(uuid.uuid4())
+        if sql.strip().upper() == "SELECT CURRENT_VERSION()":
+            sql = "SELECT 'bench-" + self._conn.warehouse.engine + "'"
+        explain = self._EXPLAIN_RE.match(sql.strip())
+        if explain:
+            self._cur.execute(self._local("EXPLAIN " + explain.group(1)))  # still fails on SQL that does not compile
+            sql, params = "SELECT %s", (self._PLAN,)
+        like, swap = self._LIKE_RE.match(sql.strip()), self._SWAP_RE.match(sql.strip())
+        if like:
+            sql = f"CREATE TABLE IF NOT EXISTS {like.group(1)} AS SELECT * FROM {like.group(2)} LIMIT 0"
+        elif swap:
+            return self._swap(swap.group(1), swap.group(2))
+        if self._conn.warehouse.engine == "sqlite" and not sql.lstrip().upper().startswith("SELECT"):
+            with self._conn.warehouse._lock:  # shared-cache SQLite fails writers that collide instead of waiting
+                self._cur.execute(self._local(sql), tuple(params or ()))
+        else:
+            self._cur.execute(self._local(sql), tuple(params or ()))
+        self.description = self._cur.description
+        return self
+
+    def execute_async(self, sql, params=None):
+        """Runs to completion here; the query is finished by the time its status is polled."""
+        return self.execute(sql, params)
+
+    def get_results_from_sfqid(self, sfqid):
+        return self
+
+    def _swap(self, a: str, b: str):
+        """SWAP WITH as three renames: a -> tmp, b -> a, tmp -> b."""
+        schema, name_a = a.rsplit(".", 1) if "." in a else ("", a)
+        name_b = b.rsplit(".", 1)[-1]
+        tmp = f"{name_a}__SWAP"
+        with self._conn.warehouse._lock:
+            for src, dst in ((a, tmp), (b, name_a), (f"{schema}.{tmp}" if schema else tmp, name_b)):
+                self._cur.execute(self._local(f"ALTER TABLE {src} RENAME TO {dst}"))
+        self.description = None
+        return self
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cur.fetchmany(size)
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def fetch_arrow_batches(self):
+        if self._conn.warehouse.engine != "duckdb":
+            raise NotImplementedError("Arrow results need the duckdb engine")
+        import pyarrow as pa
+        reader = self._cur.fetch_record_batch(100_000)
+        return (pa.Table.from_batches([batch]) for batch in reader)
+
+    def fetch_arrow_all(self):
+        if self._conn.warehouse.engine != "duckdb":
+            import pyarrow as pa
+            columns = [c[0] for c in self.description]
+            return pa.Table.from_pandas(pd.DataFrame(self._cur.fetchall(), columns=columns), preserve_index=False)
+        return (getattr(self._cur, "to_arrow_table", None) or self._cur.fetch_arrow_table)()
+
+    def close(self):
+        if self._conn.warehouse.engine == "sqlite":
+            self._cur.close()
+
+
+class FakeConnection:
+    def __init__(self, warehouse: LocalWarehouse, raw):
+        self.warehouse = warehouse
+        self.raw = raw
+        self._closed = False
+
+    def cursor(self, *_):
+        return FakeCursor(self)
+
+    def get_query_status_throw_if_error(self, sfqid):
+        return "SUCCESS"
+
+    @staticmethod
+    def is_still_running(status):
+        return False
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self):
+        self._closed = True
+        self.raw.close()
+
+
+def fake_write_pandas(conn, df, table_name, overwrite=False, auto_create_table=False, quote_identifiers=True, **_):
+    """loader.write_pandas stand-in: writes the frame into the local warehouse."""
+    conn.warehouse.load(table_name.upper(), df, overwrite=overwrite, raw=conn.raw)
+    return True, 1, len(df), None
+
+
+# ---------- Stub LLM ----------
+class StubLLM:
+    """OpenAI client stand-in: canned SQL per question after a fixed latency (plus up to 20% jitter)."""
+
+    def __init__(self, latency_ms: float, seed: int = 0, is_async: bool = False):
+        self.latency = latency_ms / 1000
+        self.is_async = is_async
+        self._rng = np.random.default_rng(seed)
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def _reply(self, messages):
+        prompt = "\n".join(m["content"] for m in messages)
+        question = re.search(r"Question:\n(.+?)\n", messages[-1]["content"])
+        if question:
+            sql = QUESTIONS.get(question.group(1).strip(), "SELECT 1 AS ONE")
+            content = f"SQL:\n{sql}\n\nEXPLANATION:\nCanned answer for the benchmark."
+        else:
+            content = "Stub summary of the result."
+        usage = types.SimpleNamespace(prompt_tokens=count_tokens(prompt),
+                                      prompt_tokens_details=types.SimpleNamespace(cached_tokens=0))
+        message = types.SimpleNamespace(content=content)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+    def _delay(self):
+        return self.latency * (1 + 0.2 * self._rng.random())
+
+    def create(self, model=None, messages=(), stream=False, **_):
+        if self.is_async:
+            return self._astream(messages) if stream else self._acreate(messages)
+        time.sleep(self._delay())
+        return self._reply(messages)
+
+    async def _acreate(self, messages):
+        await asyncio.sleep(self._delay())
+        return self._reply(messages)
+
+    async def _astream(self, messages):
+        """stream=True: the first token after a quarter of the latency, the rest spread over the remainder."""
+        delay = self._delay()
+        words = re.findall(r"\S+\s*", self._reply(messages).choices[0].message.content)
+
+        async def chunks():
+            await asyncio.sleep(delay / 4)
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(delay * 3 / 4 / max(len(words) - 1, 1))
+                delta = types.SimpleNamespace(content=word)
+                yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)])
+        return chunks()
+
+
+# ---------- Measurement ----------
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, ok: bool = True):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+            if not ok:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def timed(self, stage: str, fn):
+        """Wrap a sync or async callable so every call is recorded under `stage`."""
+        if asyncio.iscoroutinefunction(fn):
+            async def wrapper(*a, **k):
+                start = time.perf_counter()
+                try:
+                    return await fn(*a, **k)
+                finally:
+                    self.add(stage, time.perf_counter() - start)
+        else:
+            def wrapper(*a, **k):
+                start = time.perf_counter()
+                try:
+                    return fn(*a, **k)
+                finally:
+                    self.add(stage, time.perf_counter() - start)
+        return wrapper
+
+    def summary(self, stage: str, wall: float = None) -> dict:
+        ms = np.array(self.samples.get(stage, [])) * 1000
+        if not len(ms):
+            return {}
+        out = {
+            "n": int(len(ms)),
+            "errors": self.errors.get(stage, 0),
+            "mean_ms": round(float(ms.mean()), 2),
+            "p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "p95_ms": round(float(np.percentile(ms, 95)), 2),
+            "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        }
+        if wall:
+            out["wall_s"] = round(wall, 3)
+            out["throughput_rps"] = round(len(ms) / wall, 2)
+        return out
+
+
+def drive_sync(recorder, stage, fn, args_list, concurrency):
+    def one(args):
+        start = time.perf_counter()
+        ok = True
+        try:
+            ok = fn(*args) is not False
+        except Exception:
+            ok = False
+        recorder.add(stage, time.perf_counter() - start, ok)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, args_list))
+    return time.perf_counter() - start
+
+
+def drive_async(recorder, stage, fn, args_list, concurrency):
+    async def main():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one(args):
+            async with slots:
+                start = time.perf_counter()
+                ok = True
+                try:
+                    await fn(*args)
+                except Exception:
+                    ok = False
+                recorder.add(stage, time.perf_counter() - start, ok)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(args) for args in args_list))
+        return time.perf_counter() - start
+
+    return asyncio.run(main())
+
+
+# ---------- Stages ----------
+def stage_ask(recorder, questions, args):
+    patched = {
+        "generate_sql": "ask.generate_sql", "run_query_cached": "ask.query", "generate_ai_summary": "ask.summary",
+        "create_advanced_chart": "ask.chart", "generate_insights": "ask.insights",
+    }
+    originals = {name: getattr(server, name) for name in patched}
+    for name, stage in patched.items():
+        setattr(server, name, recorder.timed(stage, originals[name]))
+
+    async def one(question):
+        req = server.AskRequest(question=question, include_summary=True, include_chart=args.chart,
+                                chart_size="preview")
+        return await server.ask(req, accept=None)
+
+    try:
+        return drive_async(recorder, "ask", one, [(q,) for q in questions], args.concurrency)
+    finally:
+        for name, fn in originals.items():
+            setattr(server, name, fn)
+
+
+def stage_ask_stream(recorder, questions, args):
+    """/ask/stream: time to the first event (the SQL) and to the last."""
+    async def one(question):
+        req = server.AskRequest(question=question, include_summary=True, include_chart=args.chart,
+                                chart_size="preview")
+        start = time.perf_counter()
+        first = None
+        async for event in server.ask_events(req):
+            first = first or time.perf_counter() - start
+            if event.startswith("event: error"):
+                raise RuntimeError(event)
+        recorder.add("ask_stream.first_event", first)
+    return drive_async(recorder, "ask_stream", one, [(q,) for q in questions], args.concurrency)
+
+
+def stage_run_query(recorder, questions, args):
+    def one(question):
+        conn = loader.sf_pool.acquire()
+        try:
+            return server.run_query(conn, QUESTIONS[question])
+        finally:
+            loader.sf_pool.release(conn)
+    return drive_sync(recorder, "run_query", one, [(q,) for q in questions], args.concurrency)
+
+
+def _results(questions):
+    """One query result per distinct question, reused as chart/insights input."""
+    results = {}
+    with loader.sf_pool.connection() as conn:
+        for q in dict.fromkeys(questions):
+            results[q] = server.run_query(conn, QUESTIONS[q])
+    return results
+
+
+def stage_chart(recorder, questions, args):
+    results = _results(questions)
+
+    async def one(question):
+        r = results[question]
+        if not r["rows"]:
+            return True
+        return await server.create_advanced_chart(r["columns"], r["rows"], "auto", "matplotlib", question, "preview", "png")
+    return drive_async(recorder, "chart", one, [(q,) for q in questions], args.concurrency)
+
+
+def stage_insights(recorder, questions, args):
+    results = _results(questions)
+    return drive_sync(recorder, "insights", lambda q: server.generate_insights(results[q]["columns"], results[q]["rows"]),
+                      [(q,) for q in questions], args.concurrency)
+
+
+def stage_loader(recorder, questions, args):
+    rng = np.random.default_rng(args.seed)
+    index = SchemaIndex(server.get_system_prompt())
+    frame = generate_table("TRANSACTIONS", index.columns["TRANSACTIONS"], args.loader_rows, rng, {})
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.loader_runs):
+            path = os.path.join(tmp, f"bench_load_{i}.csv")
+            frame.to_csv(path, index=False)
+            paths.append(path)
+
+        def one(path):
+            logs = loader.run_loader([path], streaming=args.loader_streaming, incremental={})
+            return not any("ERROR" in line for line in logs)
+        return drive_sync(recorder, "loader", one, [(p,) for p in paths], args.concurrency)
+
+
+STAGES = {
+    "ask": stage_ask,
+    "ask_stream": stage_ask_stream,
+    "run_query": stage_run_query,
+    "chart": stage_chart,
+    "insights": stage_insights,
+    "loader": stage_loader,
+}
+
+
+# ---------- Setup / Report ----------
+@contextlib.contextmanager
+def quiet_stdout():
+    """Silence request logging, including chart worker processes that inherit fd 1."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+
+def setup(args):
+    warehouse = LocalWarehouse(args.engine)
+    counts = warehouse.populate(server.get_system_prompt(), args.scale, args.seed)
+    loader.sf_pool.close_all()
+    loader.sf_pool = SnowflakePool(max_size=args.pool_size, wait_timeout=60, connect=warehouse.connect)
+    loader.write_pandas = fake_write_pandas
+    if args.loader_backend == "copy":
+        if args.engine != "duckdb":
+            raise SystemExit("--loader-backend copy needs the duckdb engine")
+        loader.copy_writer = BulkCopyWriter(LocalStage(tempfile.mkdtemp(prefix="bench_stage_")),
+                                            file_mb=args.copy_file_mb)
+    else:
+        loader.copy_writer = None
+    server.OPENAI_API_KEY = "sk-bench"
+    server._openai_client = StubLLM(args.llm_ms, args.seed)
+    server._async_openai_client = StubLLM(args.summary_ms, args.seed + 1, is_async=True)
+    if not args.warm_caches:
+        server.sql_cache = SqlCache(max_entries=0)
+        server.result_cache = ResultCache(max_bytes=0, table_version=loader.table_version)
+        server.chart_cache = ChartCache(max_bytes=0)
+    if loader.replica is not None:
+        if args.replica:
+            for table in sorted(loader.replica.tables):
+                with loader.sf_pool.connection() as conn:
+                    loader.replica.mirror_from(conn, table)
+        else:
+            loader.replica = None
+    return warehouse, counts
+
+
+def git_revision() -> dict:
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], capture_output=True, text=True, timeout=10).stdout.strip()
+        except Exception:
+            return ""
+    return {"commit": git("rev-parse", "HEAD") or "unknown", "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def print_report(report: dict, baseline: dict = None):
+    base = (baseline or {}).get("stages", {})
+    print(f"\n{'stage':<24} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}"
+          + ("   p50 vs base" if base else ""))
+    for stage, s in report["stages"].items():
+        rps = f"{s['throughput_rps']:.2f}" if "throughput_rps" in s else "-"
+        line = (f"{stage:<24} {s['n']:>5} {s['errors']:>4} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} "
+                f"{s['p99_ms']:>9.1f} {rps:>8}")
+        if stage in base and base[stage].get("p50_ms"):
+            line += f"   {(s['p50_ms'] / base[stage]['p50_ms'] - 1) * 100:+.1f}%"
+        print(line)
+    if baseline:
+        print(f"baseline: {baseline.get('git', {}).get('commit', '?')[:10]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=["duckdb", "sqlite"], default="duckdb" if DUCKDB_AVAILABLE else "sqlite")
+    parser.add_argument("--scale", type=float, default=0.05, help="fraction of metadata.txt row counts to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", default=",".join(STAGES))
+    parser.add_argument("--requests", type=int, default=40, help="calls per stage (questions are cycled)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--llm-ms", type=float, default=400, help="stub latency of the NL->SQL call")
+    parser.add_argument("--summary-ms", type=float, default=600, help="stub latency of the summary call")
+    parser.add_argument("--chart", action=argparse.BooleanOptionalAction, default=True, help="ask with include_chart")
+    parser.add_argument("--replica", action=argparse.BooleanOptionalAction, default=True, help="warm the DuckDB replica")
+    parser.add_argument("--warm-caches", action="store_true", help="keep the SQL/result/chart caches enabled")
+    parser.add_argument("--loader-rows", type=int, default=50_000)
+    parser.add_argument("--loader-runs", type=int, default=4)
+    parser.add_argument("--loader-streaming", action=argparse.BooleanOptionalAction, default=None)
+    parser.add_argument("--loader-backend", choices=["write_pandas", "copy"], default="write_pandas",
+                        help="copy: Parquet parts through a local directory stage and COPY INTO")
+    parser.add_argument("--copy-file-mb", type=int, default=64, help="target in-memory MB per Parquet part")
+    parser.add_argument("--out", help="write the report as JSON")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--verbose", action="store_true", help="keep the server's request logging")
+    args = parser.parse_args()
+    if args.engine == "duckdb" and not DUCKDB_AVAILABLE:
+        parser.error("duckdb is not installed; use --engine sqlite")
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {sorted(unknown)}")
+
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    start = time.perf_counter()
+    warehouse, counts = setup(args)
+    print(f"{args.engine} warehouse: {sum(counts.values())} rows in {len(counts)} tables "
+          f"(scale {args.scale}) in {time.perf_counter() - start:.1f}s")
+    questions = [list(QUESTIONS)[i % len(QUESTIONS)] for i in range(args.requests)]
+
+    recorder = Recorder()
+    walls = {}
+    try:
+        for stage in stages:
+            print(f"running {stage} ...", file=sys.stderr, flush=True)
+            with contextlib.nullcontext() if args.verbose else quiet_stdout():
+                walls[stage] = STAGES[stage](recorder, questions, args)
+    finally:
+        server.chart_renderer.shutdown()
+        loader.sf_pool.close_all()
+
+    report = {
+        "git": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "verbose")},
+        "stages": {},
+    }
+    for stage in stages:
+        report["stages"][stage] = recorder.summary(stage, walls[stage])
+        if stage in ("ask", "ask_stream"):
+            for sub in sorted(s for s in recorder.samples if s.startswith(f"{stage}.")):
+                report["stages"][sub] = recorder.summary(sub)
+    report["warehouse_queries"] = warehouse.queries
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.out}")
+    failed = sum(s.get("errors", 0) for s in report["stages"].values())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
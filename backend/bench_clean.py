@@ -0,0 +1,148 @@
+"""Golden check and benchmark for clean_data() against the original regex pipeline.
+
+Usage: python bench_clean.py [--rows 200000] [--workers 4]
+
+First runs a fixed set of tricky PHONE / text / DATE values through both
+implementations (followed by ensure_nulls, as run_loader does) and fails if
+any cell differs. The same values are then loaded as Arrow-backed columns,
+as Parquet uploads are, so the pyarrow.compute kernels are held to the same
+reference. Then times both on a synthetic frame and prints per-column
+timings for the compiled kernels.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from loader import PYARROW_AVAILABLE, clean_data, ensure_nulls
+
+
+def legacy_clean_data(df: pd.DataFrame) -> pd.DataFrame:
+    """The pre-kernel implementation, kept here as the reference."""
+    for col in df.columns:
+        col_upper = col.upper()
+        if "DATE" in col_upper:
+            df[col] = pd.to_datetime(df[col], errors="coerce", dayfirst=True).dt.strftime("%Y-%m-%d")
+        elif "PHONE" in col_upper:
+            df[col] = df[col].astype(str)
+            df[col] = df[col].str.replace(r"x\d+$", "", regex=True)
+            df[col] = df[col].str.replace(r"[^0-9+]", "", regex=True)
+            df[col] = df[col].str.replace(r"\+0", "+", regex=True)
+            df[col] = df[col].replace({"": None, "-": None})
+        elif df[col].dtype == "object":
+            df[col] = df[col].astype(str)
+            df[col] = df[col].str.strip()
+            df[col] = df[col].str.replace(r"\s+", " ", regex=True)
+            df[col] = df[col].str.replace(r"[\x00-\x1F\x7F]", "", regex=True)
+    return df
+
+
+GOLDEN = {
+    "PHONE": [
+        "+1 (555) 010-9999", "555.010.9999 x123", "+00 44 20 7946 0958", "x42", "-", "", "  ",
+        None, np.nan, "+0+0", "001-555-0100x7", "tel: 555 0100 ext. 9", "+44 0 20", "nan", "None",
+    ],
+    "NAME": [
+        "  Alice   Smith ", "Bob\tJones", "line\nbreak", "ctrl\x00char", "a \x00 b", "\x00 lead",
+        "tab\t\tgap", "unicode space", "　wide　", "NULL", " nan ", None, np.nan, "ok", "x\x1fy",
+    ],
+    "TXN_DATE": [
+        "01/02/2023", "2023-02-13", "13/02/2023", "not a date", None, np.nan, "2023-12-31", "31/12/2023",
+        "02/01/2023", "", "2020-02-29", "29/02/2021", "2024-01-01", "01-01-2024", "2024/06/30",
+    ],
+    "MIXED": [1, "two", 3.5, None, np.nan, " four ", "null", 6, "7", "eight  nine", 10, "", "\t", "x", "y"],
+    "AMOUNT": [1.5, np.nan, 2.0, 3.25, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 11.0, 12.0, 13.0, 14.0],
+}
+
+
+# Columns an Arrow table can hold (no mixed types); integer phones take the cast-to-string path
+ARROW_GOLDEN = {
+    "PHONE": GOLDEN["PHONE"],
+    "MOBILE_PHONE": [15550100, None, 4402079460958, 0, 7, 15550100, 1, None, 42, 999, 5, 6, 7, 8, 9],
+    "NAME": GOLDEN["NAME"],
+    "TXN_DATE": GOLDEN["TXN_DATE"],
+    "AMOUNT": GOLDEN["AMOUNT"],
+}
+
+
+def frames_equal(a: pd.DataFrame, b: pd.DataFrame):
+    for col in a.columns:
+        left, right = a[col].tolist(), b[col].tolist()
+        for i, (x, y) in enumerate(zip(left, right)):
+            if pd.isna(x) and pd.isna(y):
+                continue
+            if pd.isna(x) or pd.isna(y) or x != y:
+                return f"{col}[{i}]: legacy={x!r} kernels={y!r}"
+    return None
+
+
+def golden_check(workers: int):
+    legacy = ensure_nulls(legacy_clean_data(pd.DataFrame(GOLDEN)))
+    kernels = ensure_nulls(clean_data(pd.DataFrame(GOLDEN), max_workers=workers))
+    mismatch = frames_equal(legacy, kernels)
+    if mismatch:
+        raise SystemExit(f"GOLDEN MISMATCH {mismatch}")
+    print(f"golden: {len(GOLDEN)} columns x {len(GOLDEN['PHONE'])} rows identical")
+
+    if not PYARROW_AVAILABLE:
+        print("golden (Arrow-backed): skipped, pyarrow is not installed")
+        return
+    # Arrow-backed frame, built the way iter_source_chunks reads Parquet
+    import pyarrow as pa
+    objects = pd.DataFrame({col: pd.Series(values, dtype=object) for col, values in ARROW_GOLDEN.items()})
+    objects["AMOUNT"] = objects["AMOUNT"].astype(float)
+    arrow = pa.Table.from_pandas(objects, preserve_index=False).to_pandas(types_mapper=pd.ArrowDtype)
+    if not all(isinstance(dtype, pd.ArrowDtype) for dtype in arrow.dtypes):
+        raise SystemExit(f"ARROW GOLDEN not Arrow-backed: {dict(arrow.dtypes)}")
+    legacy = ensure_nulls(legacy_clean_data(objects.copy()))
+    kernels = ensure_nulls(clean_data(arrow, max_workers=workers))
+    mismatch = frames_equal(legacy, kernels)
+    if mismatch:
+        raise SystemExit(f"ARROW GOLDEN MISMATCH {mismatch}")
+    print(f"golden (Arrow-backed): {len(ARROW_GOLDEN)} columns x {len(arrow)} rows identical")
+
+
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    pick = lambda values: np.array(values, dtype=object)[rng.integers(0, len(values), rows)]
+    return pd.DataFrame({
+        "PHONE": pick(["+1 (555) 010-9999", "555.010.9999 x123", "+00 44 20 7946 0958", None]),
+        "ALT_PHONE": pick(["020 7946 0958", "-", "+0 1", np.nan]),
+        "FIRST_NAME": pick(["  Alice ", "Bob", "Carol  Ann", None]),
+        "ADDRESS": pick(["1 Main St", "22  Side\tRd", "Flat 3\n4 High St", "PO Box 9"]),
+        "CITY": pick(["Toronto", "London", " New  York ", "Paris"]),
+        "EFFECTIVE_START_DATE": pick(["01/02/2023", "2023-02-13", None, "13/02/2023"]),
+        "NOTES": np.array([f" note  {i}\t" for i in range(rows)], dtype=object),  # all distinct
+        "AMOUNT": rng.normal(100, 20, rows),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    golden_check(args.workers)
+
+    df = make_frame(args.rows)
+    start = time.perf_counter()
+    legacy = ensure_nulls(legacy_clean_data(df.copy()))
+    legacy_s = time.perf_counter() - start
+
+    timings = {}
+    start = time.perf_counter()
+    kernels = ensure_nulls(clean_data(df.copy(), max_workers=args.workers, timings=timings))
+    kernels_s = time.perf_counter() - start
+
+    mismatch = frames_equal(legacy, kernels)
+    if mismatch:
+        raise SystemExit(f"SYNTHETIC MISMATCH {mismatch}")
+    print(f"synthetic {df.shape}: legacy {legacy_s:.3f}s, kernels {kernels_s:.3f}s ({legacy_s / kernels_s:.1f}x)")
+    for col, seconds in sorted(timings.items(), key=lambda kv: -kv[1]):
+        print(f"  {col:<22} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
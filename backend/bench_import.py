@@ -0,0 +1,133 @@
+"""Import-time budget for server.py (cold start of an API worker).
+
+Usage: python bench_import.py [--runs 5] [--budget-ms 2000] [--top 15] [--warm-up]
+                              [--out result.json] [--compare baseline.json]
+
+Imports server.py `--runs` times, each in a fresh interpreter under
+`python -X importtime`, and reports the median total plus the slowest
+modules of the median run. Exits with status 1 when the median exceeds
+`--budget-ms`, or when a module that is meant to load lazily is imported
+eagerly: the OpenAI SDK, the Snowflake connector, matplotlib, seaborn,
+plotly or pandasai (each run also answers /chart-options, which must not
+import them either). With --warm-up, also times the start-up warm-up that
+loads those engines in the background. --out and --compare work like
+bench_ask.py, so a regression shows up as a diff between commits.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAZY_MODULES = ("openai", "snowflake.connector", "matplotlib", "seaborn", "plotly", "pandasai")
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+WARM_UP = """
+import time
+import server
+start = time.perf_counter()
+server.warm_up(server.ENGINES)
+print(time.perf_counter() - start)
+print(__import__("json").dumps({e.name: e.status() for e in server.ENGINES}))
+server.chart_renderer.shutdown()
+"""
+
+
+def import_once() -> tuple[float, list]:
+    """One cold `import server`: (total ms, [(module, self ms, cumulative ms, depth)])."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server; server.get_chart_options()"],
+                          cwd=HERE, capture_output=True, text=True, timeout=300)
+    if proc.returncode != 0:
+        raise SystemExit(f"import server failed:\n{proc.stderr[-2000:]}")
+    modules, total = [], None
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us, indent, name = int(m.group(1)), int(m.group(2)), len(m.group(3)), m.group(4)
+        modules.append((name, self_us / 1000, cumulative_us / 1000, (indent - 1) // 2))
+        if name == "server" and indent == 1:
+            total = cumulative_us / 1000
+    return total, modules
+
+
+def git_revision() -> dict:
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=HERE, capture_output=True, text=True, timeout=10).stdout.strip()
+        except Exception:
+            return ""
+    return {"commit": git("rev-parse", "HEAD") or "unknown", "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=2000, help="fail above this median import time")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--warm-up", action="store_true", help="also time the background engine warm-up")
+    parser.add_argument("--out", help="write the report as JSON")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    args = parser.parse_args()
+
+    runs = [import_once() for _ in range(max(1, args.runs))]
+    totals = [total for total, _ in runs]
+    median = statistics.median(totals)
+    _, modules = min(runs, key=lambda r: abs(r[0] - median))
+    loaded = {name for name, *_ in modules}
+    eager = sorted(m for m in LAZY_MODULES if m in loaded)
+
+    print(f"import server: median {median:.0f} ms, min {min(totals):.0f} ms, max {max(totals):.0f} ms "
+          f"({len(totals)} runs, budget {args.budget_ms:.0f} ms)")
+    print(f"\n{'module':<40} {'cumulative ms':>14} {'self ms':>9}")
+    top = sorted((m for m in modules if 1 <= m[3] <= 2), key=lambda m: -m[2])[:args.top]
+    for name, self_ms, cumulative_ms, depth in top:
+        print(f"{'  ' * (depth - 1) + name:<40} {cumulative_ms:>14.1f} {self_ms:>9.1f}")
+
+    report = {
+        "git": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "import_ms": {"median": round(median, 1), "min": round(min(totals), 1), "max": round(max(totals), 1)},
+        "budget_ms": args.budget_ms,
+        "modules": len(loaded),
+        "eager_lazy_modules": eager,
+        "top": [{"module": n, "cumulative_ms": round(c, 1), "self_ms": round(s, 1)} for n, s, c, _ in top],
+    }
+    if args.warm_up:
+        proc = subprocess.run([sys.executable, "-c", WARM_UP], cwd=HERE, capture_output=True, text=True, timeout=600)
+        lines = proc.stdout.strip().splitlines()
+        if proc.returncode == 0 and len(lines) >= 2:
+            report["warm_up_ms"] = round(float(lines[-2]) * 1000, 1)
+            report["engines"] = json.loads(lines[-1])
+            print(f"\nwarm-up {report['warm_up_ms']:.0f} ms: "
+                  + ", ".join(f"{name}={s['state']} ({s['load_ms']} ms)" for name, s in report["engines"].items()))
+        else:
+            print(f"\nwarm-up failed:\n{proc.stderr[-2000:]}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        base_median = base["import_ms"]["median"]
+        print(f"\nvs {base.get('git', {}).get('commit', '?')[:10]}: {base_median:.0f} ms -> {median:.0f} ms "
+              f"({(median / base_median - 1) * 100:+.1f}%)")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.out}")
+
+    failed = False
+    if eager:
+        print(f"FAIL: imported eagerly, should load lazily: {', '.join(eager)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: median import time {median:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark ensure_nulls() against the original per-cell applymap implementation.
+
+Usage: python bench_nulls.py [--rows 200000] [--repeat 3]
+
+Builds a wide frame (many mixed columns) and a long frame (few columns, many
+rows), checks both implementations null out the same cells, and prints
+cells/sec for each.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from loader import ensure_nulls, NULL_TOKENS
+
+
+def legacy_ensure_nulls(df: pd.DataFrame) -> pd.DataFrame:
+    """The pre-vectorization implementation, kept here as the baseline."""
+    df = df.where(pd.notnull(df), None)
+    cell_map = df.applymap if hasattr(df, "applymap") else df.map
+    return cell_map(lambda x: None if str(x).strip().lower() in ["nan", "nat", "none", "null"] else x)
+
+
+def make_frame(rows: int, text_cols: int, num_cols: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    words = np.array(["alpha", "beta", " gamma ", "delta", "North America", "x"] + [f" {t.upper()} " for t in NULL_TOKENS] + ["nullable"])
+    data = {}
+    for i in range(text_cols):
+        col = words[rng.integers(0, len(words), rows)].astype(object)
+        col[rng.random(rows) < 0.05] = None
+        data[f"TEXT_{i}"] = col
+    for i in range(num_cols):
+        col = rng.normal(100, 25, rows)
+        col[rng.random(rows) < 0.05] = np.nan
+        data[f"NUM_{i}"] = col
+    data["EVENT_DATE"] = pd.to_datetime("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, rows), unit="D")
+    return pd.DataFrame(data)
+
+
+def null_cells(df: pd.DataFrame) -> np.ndarray:
+    return df.isna().to_numpy()
+
+
+def bench(fn, df, repeat):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(df)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000, help="rows in the long frame (wide frame uses rows/10)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    shapes = {
+        "wide": make_frame(max(args.rows // 10, 1), text_cols=40, num_cols=20),
+        "long": make_frame(args.rows, text_cols=3, num_cols=2),
+    }
+    print(f"{'frame':<6} {'shape':>16} {'legacy cells/s':>16} {'vectorized cells/s':>20} {'speedup':>8}")
+    for name, df in shapes.items():
+        cells = df.shape[0] * df.shape[1]
+        legacy_s, legacy_out = bench(legacy_ensure_nulls, df, args.repeat)
+        new_s, new_out = bench(ensure_nulls, df, args.repeat)
+        if not np.array_equal(null_cells(legacy_out), null_cells(new_out)):
+            raise SystemExit(f"{name}: vectorized ensure_nulls disagrees with legacy null positions")
+        print(f"{name:<6} {str(df.shape):>16} {cells / legacy_s:>16,.0f} {cells / new_s:>20,.0f} {legacy_s / new_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
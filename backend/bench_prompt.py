@@ -0,0 +1,106 @@
+"""Compare the full metadata.txt prompt with the schema-aware compact prompt.
+
+Usage: python bench_prompt.py [--top-k 3] [--live]
+
+For a fixed question set, checks that retrieval picks every table the
+question needs (exit status 1 if any is missed) and prints the prompt tokens
+each mode sends. With --live, also asks the model for SQL in both modes, runs
+both statements on Snowflake and reports questions whose results differ,
+plus the LLM latency of each mode.
+"""
+import argparse
+import sys
+import time
+
+from schema_index import SchemaIndex, count_tokens
+
+# question -> tables a correct answer must read
+QUESTIONS = {
+    "Total sales by region": {"STORES", "TRANSACTIONS"},
+    "Top 10 products by revenue": {"PRODUCTS", "TRANSACTION_LINES"},
+    "How many VIP customers are there?": {"DIM_CUSTOMERS"},
+    "Average loyalty points balance per customer segment": {"DIM_CUSTOMERS", "LOYALTY_LEDGER"},
+    "Which stores had the most refunds?": {"STORES", "TRANSACTIONS"},
+    "Current price of each product": {"PRODUCTS", "PRODUCT_PRICES"},
+    "How many customers moved to a new city?": {"CUSTOMER_ADDRESSES"},
+    "Monthly sales trend": {"TRANSACTIONS"},
+    "Total payments and refunds in finance entries": {"FINANCE_ENTRIES"},
+    "Units sold per product category": {"PRODUCTS", "TRANSACTION_LINES"},
+    "Points redeemed by promo code": {"LOYALTY_LEDGER"},
+    "Number of active products": {"PRODUCTS"},
+}
+USER_TEMPLATE = "Question:\n{q}\n\nSQL:\n<your SQL>\n\nEXPLANATION:\n<your explanation>"
+
+
+def run_live(index, text):
+    import server
+
+    def ask(messages):
+        start = time.time()
+        response = server.get_openai_client().chat.completions.create(
+            model=server.OPENAI_MODEL, messages=messages, temperature=0)
+        elapsed = time.time() - start
+        reply = response.choices[0].message.content.replace("```sql", "").replace("```", "")
+        sql = reply.split("SQL:", 1)[-1].split("EXPLANATION:", 1)[0].strip()
+        return sql, elapsed
+
+    def result(sql):
+        with server.loader.sf_pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(sql)
+                return sorted(map(repr, cur.fetchmany(1000)))
+            except Exception as e:
+                return f"error: {e}"
+            finally:
+                cur.close()
+
+    mismatches, latency = 0, {"full": 0.0, "compact": 0.0}
+    for q in QUESTIONS:
+        user = {"role": "user", "content": USER_TEMPLATE.format(q=q)}
+        full_sql, t_full = ask([{"role": "system", "content": text}, user])
+        compact_messages, _ = index.build_messages(q, user["content"])
+        compact_sql, t_compact = ask(compact_messages)
+        latency["full"] += t_full
+        latency["compact"] += t_compact
+        if result(full_sql) != result(compact_sql):
+            mismatches += 1
+            print(f"DIFF  {q}\n  full:    {full_sql}\n  compact: {compact_sql}")
+    n = len(QUESTIONS)
+    print(f"llm latency avg: full {latency['full'] / n * 1000:.0f} ms, compact {latency['compact'] / n * 1000:.0f} ms")
+    print(f"result mismatches: {mismatches}/{n}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--metadata", default="metadata.txt")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--live", action="store_true", help="call the LLM and Snowflake in both modes")
+    args = parser.parse_args()
+
+    text = open(args.metadata, encoding="utf-8").read()
+    index = SchemaIndex(text, top_k=args.top_k)
+    full_tokens = count_tokens(text)
+    misses, compact_total = 0, 0
+    print(f"{'question':<55} {'tokens':>7}  tables")
+    for q, expected in QUESTIONS.items():
+        messages, stats = index.build_messages(q, USER_TEMPLATE.format(q=q))
+        tokens = stats["prefix_tokens"] + stats["schema_tokens"]
+        compact_total += tokens
+        missing = expected - set(stats["tables"])
+        misses += bool(missing)
+        flag = f"  MISSING {sorted(missing)}" if missing else ""
+        print(f"{q[:55]:<55} {tokens:>7}  {','.join(stats['tables'])}{flag}")
+    avg = compact_total / len(QUESTIONS)
+    print(f"\nfull prompt {full_tokens} tokens, compact avg {avg:.0f} tokens "
+          f"({1 - avg / full_tokens:.0%} fewer); static prefix {count_tokens(index.prefix)} tokens")
+    print(f"table recall: {len(QUESTIONS) - misses}/{len(QUESTIONS)}")
+    failed = misses > 0
+    if args.live:
+        failed = run_live(index, text) > 0 or failed
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
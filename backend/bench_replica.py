@@ -0,0 +1,80 @@
+"""Golden check and benchmark for the DuckDB replica's routing.
+
+Usage: python bench_replica.py [--rows 5000] [--queries 2000]
+
+Mirrors generated STORES and PRODUCTS frames into a DuckDBReplica and runs
+each GOLDEN query through it: queries marked "served" (fully qualified,
+unqualified, mixed, CTEs) must be answered locally with the expected rows,
+queries marked "miss" (tables that are not replicated, stale copies,
+Snowflake-only syntax) must fall back with ReplicaMiss. Fails on any wrong
+answer. Then times served queries per second.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from replica import DuckDBReplica, ReplicaMiss
+
+GOLDEN = [
+    ("SELECT COUNT(*) AS N FROM HACKATHON.RAW.STORES", "served"),
+    ("SELECT COUNT(*) AS N FROM stores", "served"),
+    ("select count(*) as n from Stores s where s.store_id >= 0", "served"),
+    ("SELECT COUNT(*) AS N FROM stores s JOIN HACKATHON.RAW.PRODUCTS p ON p.STORE_ID = s.STORE_ID", "served"),
+    ("WITH big AS (SELECT * FROM stores) SELECT COUNT(*) AS N FROM big", "served"),
+    ("SELECT COUNT(*) AS N FROM stores s, products p WHERE s.STORE_ID = p.STORE_ID", "served"),
+    ("SELECT COUNT(*) AS N FROM transactions", "miss"),
+    ("SELECT COUNT(*) AS N FROM stores s JOIN transactions t ON t.STORE_ID = s.STORE_ID", "miss"),
+    ("SELECT COUNT(*) AS N FROM OTHER.RAW.STORES", "miss"),
+    ("SELECT COUNT(*) AS N FROM stale_table", "miss"),
+    ("SELECT f.value FROM stores, LATERAL FLATTEN(input => PARSE_JSON('[1]')) f", "miss"),
+]
+
+
+def make_replica(rows: int) -> DuckDBReplica:
+    versions = {"STORES": 1, "PRODUCTS": 1, "STALE_TABLE": 2}
+    replica = DuckDBReplica(["STORES", "PRODUCTS", "STALE_TABLE"], table_version=lambda t: versions.get(t, 0))
+    rng = np.random.default_rng(0)
+    replica.mirror("STORES", pd.DataFrame({"STORE_ID": np.arange(rows), "GEO": rng.choice(["N", "S"], rows)}))
+    replica.mirror("PRODUCTS", pd.DataFrame({"PRODUCT_ID": np.arange(rows), "STORE_ID": np.arange(rows)}))
+    replica.mirror("STALE_TABLE", pd.DataFrame({"A": [1]}), version=1)  # older than the current version 2
+    return replica
+
+
+def golden_check(replica: DuckDBReplica, rows: int):
+    failures = []
+    for sql, expected in GOLDEN:
+        try:
+            columns, data, _, _ = replica.execute(sql)
+            got = "served"
+            if columns == ["N"] and data != [(rows,)]:
+                failures.append(f"{sql!r}: served {data}, expected [({rows},)]")
+        except ReplicaMiss:
+            got = "miss"
+        if got != expected:
+            failures.append(f"{sql!r}: expected {expected}, got {got}")
+    if failures:
+        raise SystemExit("GOLDEN MISMATCH\n  " + "\n  ".join(failures))
+    print(f"golden: {len(GOLDEN)} queries routed as expected")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    replica = make_replica(args.rows)
+    golden_check(replica, args.rows)
+    for name, sql in {"qualified": GOLDEN[0][0], "unqualified": GOLDEN[1][0], "join": GOLDEN[3][0]}.items():
+        start = time.perf_counter()
+        for _ in range(args.queries):
+            replica.execute(sql)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<12} {args.queries / elapsed:10.0f} queries/s")
+    print(replica.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark /ask result encodings: row JSON vs columnar JSON vs Arrow IPC.
+
+Usage: python bench_results.py [--rows 100000] [--cols 40] [--repeat 3]
+
+Builds a wide numeric result as the connector would hand it over (an Arrow
+table) and times each encoding end to end from that table: row JSON pays for
+Python rows plus AskResponse serialization, columnar JSON for per-column lists
+plus pydantic-core's encoder, Arrow IPC only for the IPC writer. Prints CPU
+time and payload size for each.
+"""
+import argparse
+import time
+
+import numpy as np
+import pyarrow as pa
+
+from result_format import table_rows, columnar_json, arrow_ipc_bytes, ARROW_COMPRESSION
+from server import AskResponse
+
+
+def make_table(rows: int, cols: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    data = {"ID": pa.array(np.arange(rows))}
+    for i in range(cols - 1):
+        data[f"METRIC_{i}"] = pa.array(rng.normal(100, 25, rows).round(2))
+    return pa.table(data)
+
+
+def response_for(table, rows):
+    return AskResponse(question="bench", sql="select 1", columns=table.column_names, rows=rows,
+                       rowcount=table.num_rows, elapsed_ms=0, response_text="bench")
+
+
+def encode_rows(table):
+    return response_for(table, table_rows(table)).model_dump_json().encode("utf-8")
+
+
+def encode_columnar(table):
+    return columnar_json(response_for(table, []).model_dump(mode="json"), table)
+
+
+def encode_arrow(table):
+    return arrow_ipc_bytes(table, response_for(table, []).model_dump(mode="json", exclude={"rows", "data"}))
+
+
+def bench(fn, table, repeat):
+    best = float("inf")
+    out = b""
+    for _ in range(repeat):
+        start = time.process_time()
+        out = fn(table)
+        best = min(best, time.process_time() - start)
+    return best, len(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--cols", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    table = make_table(args.rows, args.cols)
+    print(f"result {args.rows} rows x {args.cols} columns, Arrow compression {ARROW_COMPRESSION}")
+    print(f"{'format':<10} {'cpu ms':>10} {'payload MB':>12} {'vs rows':>9}")
+    base = None
+    for name, fn in (("rows", encode_rows), ("columnar", encode_columnar), ("arrow", encode_arrow)):
+        seconds, size = bench(fn, table, args.repeat)
+        base = base or (seconds, size)
+        print(f"{name:<10} {seconds * 1000:>10.1f} {size / 1e6:>12.2f} "
+              f"{base[0] / seconds:>5.1f}x/{base[1] / size:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
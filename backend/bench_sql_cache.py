@@ -0,0 +1,74 @@
+"""Golden check and benchmark for the near-duplicate tier of SqlCache.
+
+Usage: python bench_sql_cache.py [--entries 512] [--lookups 20000]
+
+First caches one question of each GOLDEN pair and looks the other one up:
+pairs marked "hit" are rephrasings that must share the cached SQL, pairs
+marked "miss" mean something else (negation, comparison, plural, literal)
+and must not. Fails on any wrong answer. Then times exact, semantic and
+missing lookups against a cache holding `--entries` questions.
+"""
+import argparse
+import time
+
+from sql_cache import SqlCache
+
+GOLDEN = [
+    ("show all transactions for customers who are loyalty members",
+     "show all transactions for customers who are not loyalty members", "miss"),
+    ("total sales by store", "total sales by stores", "miss"),
+    ("customers without a loyalty account", "customers with a loyalty account", "miss"),
+    ("orders except refunds", "orders excluding refunds", "miss"),
+    ("customers who never purchased online", "customers who purchased online", "miss"),
+    ("products priced above 100", "products priced below 100", "miss"),
+    ("top 10 products by revenue", "bottom 10 products by revenue", "miss"),
+    ("first purchase per customer", "last purchase per customer", "miss"),
+    ("stores with more than 5 refunds", "stores with less than 5 refunds", "miss"),
+    ("top 5 products by revenue", "top 10 products by revenue", "miss"),
+    ("sales in 'NORTH' region", "sales in 'SOUTH' region", "miss"),
+    ("Total sales by store geo", "total sales by store geo?", "hit"),
+    ("show me total sales by store geo", "what is the total sales by store geo", "hit"),
+    ("list the top 10 products by revenue", "top 10 products by revenue please", "hit"),
+]
+
+
+def golden_check():
+    failures = []
+    for cached, asked, expected in GOLDEN:
+        cache = SqlCache(similarity_threshold=0.5)  # low bar: only the meaning gate may refuse
+        cache.put(cached, "fp", f"SELECT '{cached}'", None)
+        got = "hit" if cache.get(asked, "fp") else "miss"
+        if got != expected:
+            failures.append(f"{asked!r} after {cached!r}: expected {expected}, got {got}")
+    if failures:
+        raise SystemExit("GOLDEN MISMATCH\n  " + "\n  ".join(failures))
+    print(f"golden: {len(GOLDEN)} question pairs answered as expected")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=512)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    args = parser.parse_args()
+
+    golden_check()
+
+    cache = SqlCache(max_entries=args.entries)
+    for i in range(args.entries):
+        cache.put(f"total sales for store {i} by month", "fp", f"SELECT {i}", None)
+    cases = {
+        "exact": "total sales for store 7 by month",
+        "semantic": "show total sales for store 7 by month",
+        "miss": "average basket size for store 7 by month",
+    }
+    for name, question in cases.items():
+        n = max(1, args.lookups // (100 if name != "exact" else 1))
+        start = time.perf_counter()
+        for _ in range(n):
+            cache.get(question, "fp")
+        print(f"{name:<9} {(time.perf_counter() - start) / n * 1e6:10.1f} us/lookup ({n} lookups)")
+    print(cache.stats())
+
+
+if __name__ == "__main__":
+    main()
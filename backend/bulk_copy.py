@@ -0,0 +1,277 @@
+import glob
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import metrics
+from metrics import LOADER_STAGE_SECONDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+PARQUET_FORMAT = "LOADER_PARQUET"
+
+
+# ---------- Stages ----------
+class SnowflakeStage:
+    """Named internal stage: PUT local Parquet files, COPY INTO a table, purge on load."""
+
+    def __init__(self, name: str, database: str, schema: str, put_parallel: int = 8):
+        self.database = database
+        self.schema = schema
+        self.name = name if "." in name else f"{database}.{schema}.{name}"
+        self.file_format = f"{database}.{schema}.{PARQUET_FORMAT}"
+        self.put_parallel = max(1, min(put_parallel, 99))  # PUT accepts 1..99 upload threads
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def ensure(self, cursor):
+        with self._lock:
+            if self._ready:
+                return
+            cursor.execute(f"CREATE FILE FORMAT IF NOT EXISTS {self.file_format} TYPE = PARQUET")
+            cursor.execute(f"CREATE STAGE IF NOT EXISTS {self.name} FILE_FORMAT = {self.file_format}")
+            self._ready = True
+
+    def put(self, cursor, directory: str, prefix: str) -> int:
+        """Upload every part in `directory` in one PUT; the connector spreads files over put_parallel threads."""
+        pattern = os.path.join(os.path.abspath(directory), "*.parquet").replace("\\", "/")
+        cursor.execute(
+            f"PUT 'file://{pattern}' @{self.name}/{prefix}/ "
+            f"PARALLEL = {self.put_parallel} AUTO_COMPRESS = FALSE OVERWRITE = TRUE"
+        )
+        rows = cursor.fetchall()
+        failed = [r for r in rows if len(r) > 6 and str(r[6]).upper() not in ("UPLOADED", "SKIPPED")]
+        if failed:
+            raise RuntimeError(f"PUT failed for {len(failed)} file(s): {failed[0]}")
+        return len(rows)
+
+    def create_table(self, cursor, target: str, prefix: str):
+        """(Re)create `target` with the column names and types of the staged Parquet files."""
+        cursor.execute(
+            f"CREATE OR REPLACE TABLE {target} USING TEMPLATE ("
+            f"SELECT ARRAY_AGG(OBJECT_CONSTRUCT(*)) WITHIN GROUP (ORDER BY ORDER_ID) "
+            f"FROM TABLE(INFER_SCHEMA(LOCATION => '@{self.name}/{prefix}/', FILE_FORMAT => '{self.file_format}')))"
+        )
+
+    def copy_into(self, cursor, target: str, prefix: str) -> list:
+        """COPY the staged parts into `target`; returns [(file, status, rows_loaded, errors_seen, first_error)]."""
+        cursor.execute(
+            f"COPY INTO {target} FROM @{self.name}/{prefix}/ "
+            f"FILE_FORMAT = (FORMAT_NAME = '{self.file_format}') "
+            f"MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE ON_ERROR = ABORT_STATEMENT PURGE = TRUE"
+        )
+        out = []
+        for row in cursor.fetchall():
+            if len(row) < 7:  # "Copy executed with 0 files processed."
+                continue
+            out.append((row[0], row[1], int(row[3] or 0), int(row[5] or 0), row[6]))
+        return out
+
+    def remove(self, cursor, prefix: str):
+        cursor.execute(f"REMOVE @{self.name}/{prefix}/")
+
+
+class LocalStage:
+    """Offline stand-in for a named stage: a directory plus DuckDB's read_parquet for COPY.
+
+    Works with any connection whose cursor runs DuckDB SQL, such as the
+    bench_ask.py warehouse, so the bulk loader can be exercised without Snowflake.
+    """
+
+    def __init__(self, directory: str, put_parallel: int = 8):
+        self.directory = directory
+        self.put_parallel = max(1, put_parallel)
+        self.name = f"file://{directory}"
+
+    def ensure(self, cursor):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _files(self, prefix: str) -> list:
+        return sorted(glob.glob(os.path.join(self.directory, prefix, "*.parquet")))
+
+    def put(self, cursor, directory: str, prefix: str) -> int:
+        target = os.path.join(self.directory, prefix)
+        os.makedirs(target, exist_ok=True)
+        files = sorted(glob.glob(os.path.join(directory, "*.parquet")))
+        with ThreadPoolExecutor(max_workers=self.put_parallel) as executor:
+            list(executor.map(lambda f: shutil.copy(f, target), files))
+        return len(files)
+
+    def _source(self, prefix: str) -> str:
+        return "read_parquet([" + ", ".join(f"'{f}'" for f in self._files(prefix)) + "])"
+
+    def create_table(self, cursor, target: str, prefix: str):
+        cursor.execute(f"CREATE OR REPLACE TABLE {target} AS SELECT * FROM {self._source(prefix)} LIMIT 0")
+
+    def copy_into(self, cursor, target: str, prefix: str) -> list:
+        out = []
+        for f in self._files(prefix):
+            cursor.execute(f"INSERT INTO {target} BY NAME SELECT * FROM read_parquet('{f}')")
+            out.append((os.path.basename(f), "LOADED", pq.ParquetFile(f).metadata.num_rows, 0, None))
+        self.remove(cursor, prefix)  # PURGE = TRUE
+        return out
+
+    def remove(self, cursor, prefix: str):
+        shutil.rmtree(os.path.join(self.directory, prefix), ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(os.path.join(self.directory, prefix)))  # the table's folder, once empty
+        except OSError:
+            pass
+
+
+# ---------- Writer ----------
+def scratch_table(table_name: str, kind: str) -> str:
+    """A staging/delta table name private to one load, so concurrent loads of a table never share one."""
+    return f"{table_name}__{kind}_{uuid.uuid4().hex[:8].upper()}"
+
+
+class BulkCopyWriter:
+    """Load frames through Parquet parts on a stage instead of write_pandas.
+
+    Incoming frames are coalesced into parts of about `file_mb` of in-memory data
+    and written as compressed Parquet on `write_workers` threads while later
+    frames are still being fetched and cleaned. All parts then go up in one
+    parallel PUT and into the table with one COPY INTO. The load targets
+    a private <TABLE>__STAGING_<id> table and is swapped in, so readers see the old contents until
+    the end. The COPY result gives the row count, so no COUNT(*) is needed.
+    """
+
+    def __init__(self, stage, file_mb: int = 64, write_workers: int = 4, compression: str = "zstd"):
+        self.stage = stage
+        self.file_bytes = max(1, file_mb) * 1024 * 1024
+        self.write_workers = max(1, write_workers)
+        self.compression = compression
+
+    def _rows_per_file(self, df: pd.DataFrame) -> int:
+        row_bytes = df.memory_usage(deep=True, index=False).sum() / max(len(df), 1)
+        return max(1000, int(self.file_bytes / max(row_bytes, 1)))
+
+    def _write_part(self, df: pd.DataFrame, path: str, schema):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if schema is not None and not table.schema.equals(schema):
+            try:
+                table = table.cast(schema)  # e.g. an all-null part inferred as null type
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                pass
+        pq.write_table(table, path, compression=self.compression)
+        return table.schema, table.num_rows
+
+    def write_parts(self, chunks, directory: str) -> tuple[int, int]:
+        """Coalesce frames into Parquet parts in `directory`; returns (files, rows)."""
+        buffered, buffered_rows, rows_per_file = [], 0, None
+        futures, files, rows, schema = [], 0, 0, None
+        lock = threading.Lock()
+
+        def submit(executor, frame):
+            nonlocal files
+            path = os.path.join(directory, f"part_{files:05d}.parquet")
+            files += 1
+            futures.append(executor.submit(write, frame, path))
+
+        def write(frame, path):
+            nonlocal schema
+            with metrics.span("parquet", LOADER_STAGE_SECONDS):
+                part_schema, n = self._write_part(frame, path, schema)
+            with lock:
+                schema = schema or part_schema
+            return n
+
+        with ThreadPoolExecutor(max_workers=self.write_workers, thread_name_prefix="parquet") as executor:
+            for df in chunks:
+                if df.empty:
+                    continue
+                rows_per_file = rows_per_file or self._rows_per_file(df)
+                buffered.append(df)
+                buffered_rows += len(df)
+                while buffered_rows >= rows_per_file:
+                    frame = pd.concat(buffered, ignore_index=True) if len(buffered) > 1 else buffered[0]
+                    submit(executor, frame.iloc[:rows_per_file])
+                    rest = frame.iloc[rows_per_file:]
+                    buffered, buffered_rows = ([rest], len(rest)) if len(rest) else ([], 0)
+                # Don't let finished-but-unwritten parts pile up in memory
+                while sum(not f.done() for f in futures) > 2 * self.write_workers:
+                    next(f for f in futures if not f.done()).result()
+            if buffered:
+                submit(executor, pd.concat(buffered, ignore_index=True) if len(buffered) > 1 else buffered[0])
+            for f in futures:
+                rows += f.result()
+        return files, rows
+
+    def load(self, conn, chunks, table_name: str, database: str, schema: str, results: list) -> int:
+        """Replace `table_name` with the rows of `chunks`; returns the number of rows loaded."""
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("The copy loader backend needs pyarrow")
+        staging = f"{database}.{schema}.{scratch_table(table_name, 'STAGING')}"
+        target = f"{database}.{schema}.{table_name}"
+        prefix = f"{table_name}/{uuid.uuid4().hex}"
+        start = time.perf_counter()
+        cursor = conn.cursor()
+        try:
+            self.stage.ensure(cursor)
+            with tempfile.TemporaryDirectory(prefix="copy_") as directory:
+                # Includes fetching and cleaning streamed chunks; the part writes themselves are the "parquet" spans
+                files, rows = self.write_parts(chunks, directory)
+                if rows == 0:
+                    results.append(f"WARNING: {table_name} produced no rows, target left unchanged")
+                    return 0
+                written = time.perf_counter()
+                with metrics.span("put", LOADER_STAGE_SECONDS):
+                    self.stage.put(cursor, directory, prefix)
+            uploaded = time.perf_counter()
+            with metrics.span("copy", LOADER_STAGE_SECONDS):
+                self.stage.create_table(cursor, staging, prefix)
+                copied = self.stage.copy_into(cursor, staging, prefix)
+                loaded = sum(r[2] for r in copied)
+                errors = [r for r in copied if r[3]]
+                if errors or loaded != rows:
+                    raise RuntimeError(
+                        f"COPY INTO {table_name} loaded {loaded} of {rows} rows"
+                        + (f"; first error in {errors[0][0]}: {errors[0][4]}" if errors else ""))
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {target} LIKE {staging}")
+                cursor.execute(f"ALTER TABLE {staging} SWAP WITH {target}")
+                cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        except Exception:
+            for cleanup in (lambda: cursor.execute(f"DROP TABLE IF EXISTS {staging}"),
+                            lambda: self.stage.remove(cursor, prefix)):
+                try:
+                    cleanup()
+                except Exception:
+                    pass
+            raise
+        finally:
+            cursor.close()
+        elapsed = time.perf_counter() - start
+        results.append(
+            f"SUCCESS: Copied {loaded} rows into {table_name} from {files} Parquet file(s) "
+            f"(parts {written - start:.1f}s, put {uploaded - written:.1f}s, "
+            f"copy {time.perf_counter() - uploaded:.1f}s)")
+        results.append(f"VERIFICATION: COPY INTO loaded {loaded} rows into {table_name} "
+                       f"({loaded / elapsed:,.0f} rows/s)")
+        return loaded
+
+
+def create_copy_writer(database: str, schema: str) -> BulkCopyWriter:
+    """The writer configured by LOADER_COPY_*; LOADER_COPY_STAGE=file:///dir selects the local stage."""
+    stage_name = os.getenv("LOADER_COPY_STAGE", "LOADER_STAGE")
+    put_parallel = int(os.getenv("LOADER_COPY_PUT_THREADS", "8"))
+    if stage_name.startswith("file://"):
+        stage = LocalStage(stage_name[len("file://"):], put_parallel)
+    else:
+        stage = SnowflakeStage(stage_name, database, schema, put_parallel)
+    return BulkCopyWriter(
+        stage,
+        file_mb=int(os.getenv("LOADER_COPY_FILE_MB", "64")),
+        write_workers=int(os.getenv("LOADER_COPY_WRITE_WORKERS", str(min(4, os.cpu_count() or 1)))),
+        compression=os.getenv("LOADER_COPY_COMPRESSION", "zstd"),
+    )
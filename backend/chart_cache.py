@@ -0,0 +1,75 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+CHART_MIME_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "svg": "image/svg+xml",
+}
+
+
+def chart_key(columns, rows, chart_type, engine, dpi, fmt) -> str:
+    """Content address of a rendered chart: same data + options -> same image."""
+    payload = json.dumps(
+        [list(columns), rows, chart_type, engine, dpi, fmt],
+        default=str, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ChartCache:
+    """LRU cache of rendered chart images bounded by total bytes."""
+
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> {"image", "mime_type", "meta"}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def peek(self, key: str):
+        """Lookup without touching hit/miss counters (used when serving /charts)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, image: bytes, fmt: str, meta: dict):
+        entry = {"image": image, "mime_type": CHART_MIME_TYPES.get(fmt, "application/octet-stream"), "meta": meta}
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key)["image"])
+            if len(image) > self.max_bytes:
+                return entry
+            self._entries[key] = entry
+            self._bytes += len(image)
+            while self._bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= len(old["image"])
+        return entry
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,317 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("chart_render")
+
+
+class ChartQueueFull(Exception):
+    """Raised when the render queue stays full for longer than queue_timeout."""
+
+
+# ---------- Worker Side ----------
+# matplotlib is only imported where charts are drawn: the render workers (preloaded by their
+# forkserver) or a caller rendering in-process; never as a side effect of importing this module
+MATPLOTLIB_MODULES = ["matplotlib.figure", "matplotlib.ticker"]
+
+def _warm_up_worker():
+    """Process initializer: reset rcParams and pay font-cache/backend setup once per worker."""
+    import matplotlib
+    from matplotlib.figure import Figure
+    matplotlib.use('Agg') # Use non-interactive backend
+    matplotlib.rcdefaults()
+    fig = Figure(figsize=(1, 1))
+    fig.subplots().bar([0], [1])
+    fig.savefig(io.BytesIO(), format='png')
+
+
+# ---------- Chart Helpers ----------
+def detect_optimal_chart_type(df: pd.DataFrame, columns: List[str]) -> str:
+    """Enhanced chart type detection with better categorical data handling"""
+    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
+   
+    logger.debug("[Chart Debug] Numeric cols: %s, Categorical cols: %s", numeric_cols, categorical_cols)
+   
+    # Check for revenue share or percentage data - perfect for bar charts
+    if len(columns) >= 2:
+        col_names = [col.lower() for col in columns]
+        if any('revenue' in col or 'share' in col or 'pct' in col or 'percent' in col for col in col_names):
+            if any('category' in col or 'product' in col or 'type' in col for col in col_names):
+                logger.debug("[Chart Debug] Detected revenue/category data - using bar chart")
+                return "bar"
+   
+    # Check for frequency/distribution data
+    if len(columns) == 2:
+        col1_lower = columns[0].lower()
+        col2_lower = columns[1].lower()
+        if any(word in col2_lower for word in ['frequency', 'count', 'freq']):
+            return "bar"
+        if any(word in col1_lower for word in ['balance', 'points', 'score']) and 'frequency' in col2_lower:
+            return "bar"
+   
+    # Time series detection
+    for col in columns:
+        if any(k in col.lower() for k in ['date', 'time', 'year', 'month', 'day']):
+            return "line"
+   
+    # If we have one categorical column and one or more numeric columns -> bar chart
+    if len(categorical_cols) >= 1 and len(numeric_cols) >= 1:
+        logger.debug("[Chart Debug] Categorical + numeric data - using bar chart")
+        return "bar"
+   
+    # Distribution analysis
+    if len(numeric_cols) == 1 and len(categorical_cols) == 0:
+        return "histogram"
+   
+    # Multiple numerics - but be careful about what's actually categorical
+    if len(numeric_cols) >= 3:
+        return "heatmap"
+    if len(numeric_cols) == 2:
+        # Check if one of the "numeric" columns is actually categorical (like product IDs)
+        for col in columns:
+            if any(word in col.lower() for word in ['category', 'product', 'type', 'name']):
+                return "bar"
+        return "scatter"
+   
+    return "bar" # Safe default for most business data
+
+
+# ---------- Matplotlib Engine ----------
+def create_enhanced_matplotlib_chart(columns, rows, chart_type, question, fmt="png", dpi=200):
+    """Improved matplotlib chart generation with better formatting.
+
+    Returns raw image bytes in `fmt` (png, webp or svg); callers decide whether to
+    cache, serve or base64-inline them.
+    """
+    if not rows or not columns:
+        logger.debug("[Chart Debug] No data provided")
+        return None
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import FuncFormatter
+  
+    try:
+        df = pd.DataFrame(rows, columns=columns)
+        logger.debug("[Chart Debug] DataFrame shape: %s, columns: %s", df.shape, columns)
+        
+        if chart_type == "auto":
+            chart_type = detect_optimal_chart_type(df, columns)
+            logger.debug("[Chart Debug] Auto-detected chart type: %s", chart_type)
+      
+        # IMPROVED: Larger figure size and better DPI
+        # Figure API (no pyplot): each render owns its figure, nothing global to leak
+        fig = Figure(figsize=(16, 10))  # Increased from (12, 8)
+        ax = fig.subplots()
+        fig.patch.set_facecolor('white')
+      
+        success = False
+      
+        if chart_type == "bar" and len(columns) >= 2:
+            try:
+                # Find categorical and numeric columns
+                categorical_col = columns[0]
+                numeric_col = columns[1]
+                
+                for col in columns:
+                    if df[col].dtype == 'object' or any(word in col.lower() for word in ['category', 'product', 'type', 'name', 'country']):
+                        categorical_col = col
+                        break
+               
+                for col in columns:
+                    if pd.api.types.is_numeric_dtype(df[col]) and col != categorical_col:
+                        numeric_col = col
+                        break
+               
+                categories = df[categorical_col].astype(str)
+                values = pd.to_numeric(df[numeric_col], errors='coerce')
+                
+                # Remove NaN values
+                mask = ~values.isna()
+                categories = categories[mask]
+                values = values[mask]
+                
+                # IMPROVED: Sort by values for better visualization
+                sorted_data = sorted(zip(categories, values), key=lambda x: x[1], reverse=True)
+                categories, values = zip(*sorted_data)
+                
+                # IMPROVED: Limit to top N categories if too many
+                if len(categories) > 20:
+                    categories = categories[:20]
+                    values = values[:20]
+                    logger.debug("[Chart Debug] Limited to top 20 categories")
+                
+                # Create bar chart with better spacing
+                x_positions = range(len(categories))
+                bars = ax.bar(x_positions, values, 
+                             color='steelblue', alpha=0.8,
+                             edgecolor='navy', linewidth=0.8,
+                             width=0.7)  # Slightly thinner bars
+               
+                # IMPROVED: Better axis formatting
+                ax.set_xlabel(categorical_col, fontsize=14, fontweight='bold', labelpad=10)
+                ax.set_ylabel(numeric_col, fontsize=14, fontweight='bold', labelpad=10)
+                ax.set_title(f"{numeric_col} by {categorical_col}", 
+                           fontsize=18, fontweight='bold', pad=25)
+               
+                # IMPROVED: Smart x-axis label rotation
+                ax.set_xticks(x_positions)
+                if len(categories) > 10 or max(len(str(cat)) for cat in categories) > 12:
+                    ax.set_xticklabels(categories, rotation=45, ha='right', fontsize=11)
+                    # Add more bottom margin for rotated labels
+                    fig.subplots_adjust(bottom=0.15)
+                else:
+                    ax.set_xticklabels(categories, fontsize=11)
+               
+                # IMPROVED: Better value labels on bars
+                max_val = max(values)
+                for i, (pos, val) in enumerate(zip(x_positions, values)):
+                    # Format large numbers
+                    if val >= 1_000_000:
+                        label = f"${val/1_000_000:.1f}M"
+                    elif val >= 1_000:
+                        label = f"${val/1_000:.0f}K"
+                    elif val >= 1:
+                        label = f"${val:,.0f}" if val > 100 else f"${val:.1f}"
+                    else:
+                        label = f"${val:.2f}"
+                    
+                    # Position labels better
+                    y_pos = val + max_val * 0.01
+                    ax.text(pos, y_pos, label, 
+                           ha='center', va='bottom', 
+                           fontweight='bold', fontsize=10,
+                           rotation=0 if len(str(label)) < 8 else 0)
+               
+                # IMPROVED: Better grid and styling
+                ax.grid(True, alpha=0.3, axis='y', linestyle='--')
+                ax.set_axisbelow(True)
+                
+                # IMPROVED: Y-axis formatting
+                if max(values) >= 1_000_000:
+                    ax.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'${x/1_000_000:.0f}M'))
+                elif max(values) >= 1_000:
+                    ax.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'${x/1_000:.0f}K'))
+                
+                # IMPROVED: Better margins and spacing
+                ax.margins(x=0.01, y=0.05)  # Small margins
+                
+                # Style improvements
+                ax.spines['top'].set_visible(False)
+                ax.spines['right'].set_visible(False)
+                ax.spines['left'].set_color('#CCCCCC')
+                ax.spines['bottom'].set_color('#CCCCCC')
+                
+                success = True
+                logger.debug("[Chart Debug] Improved bar chart created successfully")
+              
+            except Exception:
+                logger.exception("[Chart Debug] Bar chart error")
+      
+        # Other chart types remain similar but with improved sizing...
+        
+        if not success:
+            return None
+      
+        # IMPROVED: Better layout and higher quality export
+        fig.tight_layout(pad=2.0)  # More padding
+      
+        # IMPROVED: Higher quality image export
+        buf = io.BytesIO()
+        fig.savefig(buf, format=fmt, 
+                   dpi=dpi,  # 200 for full size, lower for previews
+                   bbox_inches='tight',
+                   facecolor='white', 
+                   edgecolor='none',
+                   pad_inches=0.2)  # Small padding around the image
+        logger.debug("[Chart Debug] Successfully created high-quality %s chart", chart_type)
+      
+        return {
+            "type": chart_type,
+            "title": question,
+            "image": buf.getvalue(),
+            "format": fmt,
+            "engine": "matplotlib"
+        }
+      
+    except Exception as e:
+        logger.warning("[Chart Debug] Overall chart creation error: %s", e)
+        return None
+
+
+# ---------- Render Service ----------
+class ChartRenderService:
+    """Process pool that renders charts off the event loop and off the GIL.
+
+    Workers come from a forkserver that has matplotlib pre-imported. At most
+    `max_pending` renders may be queued or running; callers beyond that wait up
+    to `queue_timeout` seconds and then get ChartQueueFull (backpressure).
+    """
+
+    def __init__(self, workers=None, max_pending=None, queue_timeout=5.0):
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.max_pending = max_pending or self.workers * 4
+        self.queue_timeout = queue_timeout
+        self._executor = None
+        self._slots = None
+        self.submitted = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload([__name__] + MATPLOTLIB_MODULES)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=ctx, initializer=_warm_up_worker
+            )
+        return self._executor
+
+    def warm_up(self):
+        """Start the forkserver and every worker now instead of on the first chart request."""
+        executor = self._get_executor()
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        return self
+
+    async def render(self, columns, rows, chart_type, question, fmt="png", dpi=200):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ChartQueueFull(f"Chart render queue full ({self.max_pending} pending)")
+        try:
+            self.submitted += 1
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(), create_enhanced_matplotlib_chart, columns, rows, chart_type, question, fmt, dpi
+            )
+        except BrokenProcessPool:
+            # A worker died (OOM, segfault): drop the pool so the next render starts a fresh one
+            self.shutdown()
+            raise
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        in_flight = self.max_pending - self._slots._value if self._slots else 0
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": in_flight,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT,
+    sources TEXT,
+    details TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+)
+"""
+
+
+def _owner_alive(owner: str) -> bool:
+    """Whether the process behind an owner tag ("host:pid") may still be running its jobs."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname():
+        return bool(owner)  # another machine sharing the file: can't tell, leave its jobs alone
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass  # exists, owned by another user
+    return True
+
+
+class JobQueue:
+    """Bounded local worker pool for long-running loader jobs, backed by a SQLite job table.
+
+    `submit(kind, fn, params, cleanup)` returns a job id at once; `fn(progress, cancel_event)`
+    runs on one of `workers` threads and returns its log lines, and `cleanup()`
+    runs once the job is over, even if it was cancelled before it started. Per-source
+    progress snapshots are kept in memory and written to SQLite at most every
+    `flush_interval` seconds, so polling stays cheap and a finished job's
+    outcome survives restarts.
+
+    Several server processes may share the SQLite file. Each job records the
+    process that owns it ("host:pid"). A cancel request is written to the
+    table, and the owning process picks it up on its next progress flush,
+    whichever process received the request. On start-up, queued or running
+    jobs are marked failed only when their owner process is gone.
+    """
+
+    def __init__(self, path: str = "jobs.db", workers: int = 2, flush_interval: float = 1.0, max_jobs: int = 1000):
+        self.path = path
+        self.workers = max(1, workers)
+        self.flush_interval = flush_interval
+        self.max_jobs = max_jobs
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._futures = {}  # job id -> Future, while queued or running
+        self._cancel = {}  # job id -> threading.Event
+        self._sources = {}  # job id -> {source: snapshot}, while running
+        self._flushed = {}  # job id -> time of the last progress write
+        self._cleanups = {}  # job id -> callable run once the job is over
+        self.submitted = 0
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        with self._db_lock, self._db:
+            self._db.execute("PRAGMA busy_timeout = 5000")  # other workers write the same file
+            self._db.execute(_SCHEMA)
+            if "owner" not in {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            orphans = [row[0] for row in self._db.execute(
+                "SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')") if not _owner_alive(row[1])]
+            interrupted = sum(self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = 'interrupted by a server restart', finished = ? "
+                "WHERE id = ? AND status IN ('queued', 'running')", (time.time(), job_id)).rowcount
+                for job_id in orphans)
+        if interrupted:
+            logger.warning("marked %d interrupted job(s) as failed", interrupted)
+
+    # ---------- Storage ----------
+    def _execute(self, sql: str, params=()):
+        with self._db_lock, self._db:
+            return self._db.execute(sql, params).fetchall()
+
+    def _row(self, row) -> dict:
+        job = dict(row)
+        job["params"] = json.loads(job["params"] or "{}")
+        job["sources"] = json.loads(job["sources"] or "[]")
+        job["details"] = json.loads(job["details"]) if job["details"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def _flush(self, job_id: str):
+        """Write the job's progress and pick up a cancel request made through another process."""
+        with self._lock:
+            sources = list(self._sources.get(job_id, {}).values())
+            self._flushed[job_id] = time.monotonic()
+            event = self._cancel.get(job_id)
+        rows = self._execute("UPDATE jobs SET sources = ? WHERE id = ? RETURNING cancel_requested",
+                             (json.dumps(sources), job_id))
+        if event is not None and rows and rows[0][0]:
+            event.set()
+
+    def _prune(self):
+        self._execute(
+            "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND id NOT IN "
+            "(SELECT id FROM jobs ORDER BY created DESC LIMIT ?)", (self.max_jobs,))
+
+    # ---------- Jobs ----------
+    def submit(self, kind: str, fn, params: dict = None, cleanup=None) -> str:
+        job_id = uuid.uuid4().hex
+        cancel_event = threading.Event()
+        self._execute("INSERT INTO jobs (id, kind, status, params, owner, created) VALUES (?, ?, 'queued', ?, ?, ?)",
+                      (job_id, kind, json.dumps(params or {}), self.owner, time.time()))
+        with self._lock:
+            self._cancel[job_id] = cancel_event
+            self._sources[job_id] = {}
+            if cleanup is not None:
+                self._cleanups[job_id] = cleanup
+            self._futures[job_id] = self._executor.submit(self._run, job_id, fn, cancel_event)
+            self.submitted += 1
+        if self.submitted % 100 == 0:
+            self._prune()
+        return job_id
+
+    def _progress(self, job_id: str):
+        def report(snapshot: dict):
+            with self._lock:
+                self._sources.setdefault(job_id, {})[snapshot["source"]] = snapshot
+                due = time.monotonic() - self._flushed.get(job_id, 0.0) >= self.flush_interval
+            if due:
+                self._flush(job_id)
+        return report
+
+    def _run(self, job_id: str, fn, cancel_event: threading.Event):
+        started = self._execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ? AND status = 'queued' "
+                                "RETURNING cancel_requested", (time.time(), job_id))
+        details, error = [], None
+        if not started or started[0][0]:
+            cancel_event.set()  # cancelled while queued, through another process
+        try:
+            if not cancel_event.is_set():
+                details = fn(self._progress(job_id), cancel_event) or []
+            errors = [line for line in details if line.startswith(("ERROR", "CRITICAL"))]
+            error = errors[0] if errors else None
+        except Exception as e:
+            logger.exception("job %s failed", job_id)
+            error = str(e)
+        status = "cancelled" if cancel_event.is_set() else "failed" if error else "succeeded"
+        self._flush(job_id)
+        self._execute("UPDATE jobs SET status = ?, details = ?, error = ?, finished = ? WHERE id = ?",
+                      (status, json.dumps(details), error, time.time(), job_id))
+        self._forget(job_id)
+        logger.info("job %s %s", job_id, status)
+
+    def _forget(self, job_id: str):
+        """Drop a finished job's in-memory state and run its cleanup."""
+        with self._lock:
+            for d in (self._futures, self._cancel, self._sources, self._flushed):
+                d.pop(job_id, None)
+            cleanup = self._cleanups.pop(job_id, None)
+        if cleanup is not None:
+            try:
+                cleanup()
+            except Exception:
+                logger.exception("cleanup of job %s failed", job_id)
+
+    def get(self, job_id: str) -> dict:
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = self._row(rows[0])
+        with self._lock:
+            live = self._sources.get(job_id)
+            if live:
+                job["sources"] = list(live.values())
+        job["rows_written"] = sum(s.get("rows_written", 0) for s in job["sources"])
+        return job
+
+    def list(self, limit: int = 50) -> list:
+        rows = self._execute(
+            "SELECT id, kind, status, error, cancel_requested, created, started, finished "
+            "FROM jobs ORDER BY created DESC LIMIT ?", (limit,))
+        return [dict(r) for r in rows]
+
+    def cancel(self, job_id: str) -> dict:
+        """Cancel a queued job outright; a running job stops at its sources' next chunk or stage.
+
+        Jobs owned by another process see the request at their next progress flush (or when they start)."""
+        self._execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')", (job_id,))
+        with self._lock:
+            future, event = self._futures.get(job_id), self._cancel.get(job_id)
+        if event is not None:
+            event.set()
+            if future.cancel():  # never started
+                self._execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ?", (time.time(), job_id))
+                self._forget(job_id)
+        return self.get(job_id)
+
+    def stats(self) -> dict:
+        counts = {s: 0 for s in STATUSES}
+        for row in self._execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        return {"workers": self.workers, "path": self.path, **counts}
+
+    def shutdown(self):
+        """Ask running jobs to stop and wait for them, so their staging tables are dropped."""
+        with self._lock:
+            events = list(self._cancel.values())
+        for event in events:
+            event.set()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            never_started = list(self._cleanups)
+        for job_id in never_started:
+            self._forget(job_id)
+        with self._db_lock:
+            self._db.close()
+
@@ -0,0 +1,82 @@
+import importlib
+import importlib.util
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyImport:
+    """An optional, heavy dependency imported on first use instead of at server start.
+
+    `load` is a module name or a function doing the imports (and any one-off
+    setup); its return value is what `get()` hands out. The first caller pays
+    for the import, concurrent callers wait for it, and an ImportError marks
+    the engine unavailable for good instead of being retried on every request.
+    `status()` and `installed()` never trigger the import, so /health and
+    /chart-options can report on an engine without causing it. `modules` names
+    the top-level packages a `load` function needs (a module name covers itself).
+    """
+
+    def __init__(self, name: str, load, install_hint: str = None, modules: tuple = ()):
+        self.name = name
+        self._load = (lambda: importlib.import_module(load)) if isinstance(load, str) else load
+        self.install_hint = install_hint
+        self.modules = tuple(modules) or ((load.partition(".")[0],) if isinstance(load, str) else ())
+        self.state = "not_loaded"  # -> loading -> ready | unavailable | failed
+        self.error = None
+        self.load_ms = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The loaded value, or None when the dependency is missing or failed to set up."""
+        if self.state == "ready":
+            return self._value
+        with self._lock:
+            if self.state in ("not_loaded", "loading"):
+                self.state = "loading"
+                start = time.perf_counter()
+                try:
+                    self._value = self._load()
+                    self.state = "ready"
+                except ImportError as e:
+                    self.state, self.error = "unavailable", str(e)
+                    logger.info("%s not available.%s", self.name,
+                                f" Install with: {self.install_hint}" if self.install_hint else "")
+                except Exception as e:
+                    self.state, self.error = "failed", str(e)
+                    logger.warning("%s failed to load: %s", self.name, e)
+                self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+        return self._value
+
+    def require(self):
+        """Like get(), but a missing dependency is an error."""
+        value = self.get()
+        if value is None:
+            raise RuntimeError(f"{self.name} is not available: {self.error}")
+        return value
+
+    @property
+    def available(self) -> bool:
+        return self.get() is not None
+
+    def installed(self) -> bool:
+        """Whether the engine can be used, without importing it: its load outcome once known,
+        before that whether its packages are on the path."""
+        if self.state in ("ready", "unavailable", "failed"):
+            return self.state == "ready"
+        return all(importlib.util.find_spec(module) is not None for module in self.modules)
+
+    def status(self) -> dict:
+        return {"state": self.state, "load_ms": self.load_ms, **({"error": self.error} if self.error else {})}
+
+
+def warm_up(imports: list):
+    """Load each LazyImport in order (call from a background thread)."""
+    start = time.perf_counter()
+    for lazy in imports:
+        lazy.get()
+    logger.info("warm-up loaded %s in %.0f ms",
+                ", ".join(f"{lazy.name}={lazy.state}" for lazy in imports), (time.perf_counter() - start) * 1000)
@@ -1,10 +1,24 @@
-import os, re, pandas as pd, requests
+import os, re, time, pandas as pd, numpy as np, requests, threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from requests.adapters import HTTPAdapter
-from snowflake.connector.pandas_tools import write_pandas
 from urllib3.util.retry import Retry
-import snowflake.connector
 import traceback
 import urllib.parse
+import json
+from datetime import datetime, timezone
+from pool import SnowflakePool
+from api_fetcher import JsonApiFetcher, is_ndjson
+from replica import create_replica
+from bulk_copy import create_copy_writer, scratch_table
+import metrics
+from metrics import LOADER_STAGE_SECONDS
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
 
 # ---------- Snowflake Credentials ----------
 sf_user = "KINGKONG"
@@ -14,11 +28,142 @@ sf_role = "ACCOUNTADMIN"
 sf_warehouse = "COMPUTE_WH"
 sf_database = "HACKATHON"
 sf_schema = "RAW"
+
+# ---------- Shared Connection Pool ----------
+sf_pool = SnowflakePool(
+    max_size=int(os.getenv("SF_POOL_MAX_SIZE", "8")),
+    wait_timeout=float(os.getenv("SF_POOL_WAIT_TIMEOUT", "30")),
+    idle_timeout=float(os.getenv("SF_POOL_IDLE_TIMEOUT", "600")),
+    user=sf_user, password=sf_password, account=sf_account,
+    role=sf_role, warehouse=sf_warehouse,
+    database=sf_database, schema=sf_schema,
+    client_session_keep_alive=True,
+)
+
+# ---------- Schema / Table Versions ----------
+# Table versions are bumped after every successful table write so downstream caches
+# (results, replica) know the data they were built against may have changed; the
+# schema version (NL->SQL cache, schema index) only when a write changed the columns.
+_schema_version = 0
+_table_versions: dict[str, int] = {}
+_table_columns: dict[str, tuple] = {}  # table -> ((column, kind), ...) as last written here
+# INFORMATION_SCHEMA.TABLES.LAST_ALTERED per table: the part of a version every worker process sees
+_last_altered: dict[str, str] = {}
+_schema_lock = threading.Lock()
+
+def schema_version() -> int:
+    return _schema_version
+
+def data_version() -> int:
+    """Moves with every table write made by this process (row counts may have changed)."""
+    with _schema_lock:
+        return sum(_table_versions.values())
+
+def table_version(table_name: str) -> tuple:
+    """(writes made by this process, Snowflake's LAST_ALTERED as of the last sync).
+
+    The counter moves the moment this process writes; LAST_ALTERED carries
+    writes made by other worker processes once sync_table_versions() sees them.
+    """
+    key = table_name.upper()
+    return _table_versions.get(key, 0), _last_altered.get(key)
+
+def sync_table_versions(conn, tables=None) -> set:
+    """Refresh LAST_ALTERED for HACKATHON.RAW tables (all, or `tables`); returns the tables that changed."""
+    sql = f"SELECT TABLE_NAME, LAST_ALTERED FROM {sf_database}.INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = %s"
+    params = [sf_schema]
+    if tables:
+        sql += f" AND TABLE_NAME IN ({', '.join(['%s'] * len(tables))})"
+        params += [t.upper() for t in tables]
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    changed = set()
+    with _schema_lock:
+        for name, altered in rows:
+            key, value = name.upper(), str(altered)
+            if _last_altered.get(key) != value:
+                _last_altered[key] = value
+                changed.add(key)
+    return changed
+
+def bump_schema_version() -> int:
+    global _schema_version
+    with _schema_lock:
+        _schema_version += 1
+        return _schema_version
+
+def _column_kind(dtype) -> str:
+    """The Snowflake-relevant kind of a pandas dtype: nullable and Arrow variants count as the same."""
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bool"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "int"
+    if pd.api.types.is_float_dtype(dtype):
+        return "float"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime"
+    return "text"
+
+def record_table_columns(table_name: str, dtypes) -> bool:
+    """Bump the schema version if a write changed `table_name`'s columns or their kinds.
+
+    `dtypes` maps column -> dtype (df.dtypes works). Data-only reloads leave the
+    schema version, and with it the NL->SQL cache, alone; the first write of a
+    table seen by this process counts as a change.
+    """
+    columns = tuple((str(col).upper(), _column_kind(dtype)) for col, dtype in dict(dtypes).items())
+    with _schema_lock:
+        changed = _table_columns.get(table_name.upper()) != columns
+        _table_columns[table_name.upper()] = columns
+    if changed:
+        bump_schema_version()
+    return changed
+
+def bump_table_version(table_name: str, conn=None) -> int:
+    with _schema_lock:
+        key = table_name.upper()
+        _table_versions[key] = _table_versions.get(key, 0) + 1
+        version = _table_versions[key]
+    if conn is not None:
+        try:
+            # Take in our own write's LAST_ALTERED now, so the next sync does not see it as someone else's
+            sync_table_versions(conn, [key])
+        except Exception:
+            pass
+    return version
+
+# ---------- Local Replica ----------
+# DuckDB copy of small hot tables (REPLICA_TABLES); None when duckdb is not installed
+replica = create_replica(table_version)
+
+def _replica_frames(chunks, box: dict):
+    """Pass chunks through, keeping them in box["frames"] while they fit in the replica."""
+    frames, rows = [], 0
+    for df in chunks:
+        if frames is not None:
+            rows += len(df)
+            frames = frames + [df] if rows <= replica.max_rows else None
+        yield df
+    box["frames"] = frames
+
+def update_replica(table_name: str, results: list, df: pd.DataFrame = None, conn=None):
+    """Mirror a freshly written table into the replica, from its cleaned frame or from Snowflake."""
+    try:
+        mirrored = replica.mirror(table_name, df) if df is not None else replica.mirror_from(conn, table_name)
+        results.append(f"Replica: {table_name} {'mirrored' if mirrored else 'not mirrored (too large or empty)'}")
+    except Exception as e:
+        replica.drop(table_name)  # never serve a stale copy
+        results.append(f"WARNING: replica not updated for {table_name}: {e}")
  
-def create_retry_session(retries=3, backoff_factor=0.5, status_forcelist=(500,502,503,504)):
+def create_retry_session(retries=3, backoff_factor=0.5, status_forcelist=(500,502,503,504), pool_maxsize=10):
     session = requests.Session()
     retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=status_forcelist, allowed_methods=frozenset(['GET']))
-    adapter = HTTPAdapter(max_retries=retry)
+    # Keep-alive pool sized for concurrent page prefetch against the same host
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
     session.mount("https://", adapter)
     session.mount("http://", adapter)
     return session
@@ -32,184 +177,938 @@ def sanitize_column(col: str) -> str:
         col = "UNNAMED_COL"
     return col.upper()
 
-def clean_data(df: pd.DataFrame) -> pd.DataFrame:
-    """Clean DATE, PHONE, and text columns."""
-    for col in df.columns:
-        col_upper = col.upper()
-
-        # ---------- DATE Columns ----------
-        if "DATE" in col_upper:
-            df[col] = pd.to_datetime(df[col], errors="coerce", dayfirst=True) \
-                         .dt.strftime("%Y-%m-%d")
-
-        # ---------- PHONE Columns ----------
-        elif "PHONE" in col_upper:
-            df[col] = df[col].astype(str)
-            df[col] = df[col].str.replace(r"x\d+$", "", regex=True)  # remove extensions
-            df[col] = df[col].str.replace(r"[^0-9+]", "", regex=True)  # keep only digits & +
-            df[col] = df[col].str.replace(r"\+0", "+", regex=True)  # normalize +0
-            df[col] = df[col].replace({"": None, "-": None})
-
-        # ---------- TEXTUAL Columns ----------
-        elif df[col].dtype == "object":
-            df[col] = df[col].astype(str)
-            df[col] = df[col].str.strip()  # trim leading/trailing spaces
-            df[col] = df[col].str.replace(r"\s+", " ", regex=True)  # normalize multiple spaces
-            df[col] = df[col].str.replace(r"[\x00-\x1F\x7F]", "", regex=True)  # remove control chars
-    
+# ---------- Cleaning Kernels ----------
+# Each column's rules run as one pass over its values: one str() per value, no
+# intermediate astype(str) copies, and real nulls stay None instead of "nan".
+_PHONE_EXT_RE = re.compile(r"x\d+$")  # remove extensions
+_PHONE_DROP_RE = re.compile(r"[^0-9+]")  # keep only digits & +
+_TEXT_WS_RE = re.compile(r"\s+")  # normalize multiple spaces
+_TEXT_CTRL_RE = re.compile(r"[\x00-\x1F\x7F]")  # remove control chars
+# Values without runs of whitespace, non-space whitespace or control chars only need strip()
+_TEXT_DIRTY_RE = re.compile(r"\s{2,}|[^\S ]|[\x00-\x1F\x7F]")
+CLEAN_WORKERS = int(os.getenv("LOADER_CLEAN_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+def _clean_phone_value(v):
+    if v is None or v is pd.NA or (isinstance(v, float) and v != v):
+        return None
+    v = _PHONE_DROP_RE.sub("", _PHONE_EXT_RE.sub("", str(v))).replace("+0", "+")
+    return v or None
+
+def _clean_text_value(v):
+    if v is None or v is pd.NA or (isinstance(v, float) and v != v):
+        return v
+    v = str(v).strip()
+    if _TEXT_DIRTY_RE.search(v):
+        v = _TEXT_CTRL_RE.sub("", _TEXT_WS_RE.sub(" ", v))
+    return v
+
+def _apply_kernel(s: pd.Series, kernel) -> pd.Series:
+    """Run a value kernel over a column, once per distinct value when the column is all strings."""
+    values = s.to_numpy(dtype=object)
+    if pd.api.types.infer_dtype(values, skipna=True) == "string":
+        # Codes/uniques come from a C hash table; repeated values (cities, phone formats) are cleaned once
+        codes, uniques = pd.factorize(values)
+        cleaned = np.empty(len(uniques) + 1, dtype=object)
+        cleaned[:-1] = [kernel(v) for v in uniques]
+        cleaned[-1] = None  # code -1: missing
+        return pd.Series(cleaned[codes], index=s.index, dtype=object)
+    # Mixed objects: 1, 1.0 and True hash alike but stringify differently, so no dedup
+    return pd.Series([kernel(v) for v in values], index=s.index, dtype=object)
+
+# ---------- Arrow Kernels ----------
+# RE2 equivalents of the Python rules for Arrow-backed columns (uploads loaded from
+# Parquet). RE2's \s and \d are ASCII-only, so whitespace and digits are spelled
+# out to keep Python's Unicode semantics; Python's $ also matches before a final \n.
+def _arrow_string(s: pd.Series, cast_integers: bool = False):
+    """The column as a pyarrow string array, or None when it is not an Arrow string column."""
+    if not PYARROW_AVAILABLE or not isinstance(s.dtype, pd.ArrowDtype):
+        return None
+    arr = pa.chunked_array(pa.array(s))
+    if pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type):
+        return arr
+    if cast_integers and pa.types.is_integer(arr.type):
+        return pc.cast(arr, pa.string())  # same digits as str(int)
+    return None
+
+def _to_series(arr, s: pd.Series) -> pd.Series:
+    return pd.Series(arr, index=s.index, dtype=pd.ArrowDtype(arr.type), copy=False)
+
+def _arrow_clean_phone(arr):
+    arr = pc.replace_substring_regex(arr, pattern=r"x\p{Nd}+\n?$", replacement="")
+    arr = pc.replace_substring_regex(arr, pattern=r"[^0-9+]", replacement="")
+    arr = pc.replace_substring(arr, pattern="+0", replacement="+")
+    return pc.if_else(pc.equal(arr, ""), pa.scalar(None, arr.type), arr)
+
+def _arrow_clean_text(arr):
+    arr = pc.utf8_trim(arr, characters=_PY_WHITESPACE)
+    arr = pc.replace_substring_regex(arr, pattern=_ARROW_WS_RUN, replacement=" ")
+    return pc.replace_substring_regex(arr, pattern=r"[\x00-\x1F\x7F]", replacement="")
+
+def _clean_column(col: str, s: pd.Series):
+    """Return (cleaned series or None if the column has no rule, seconds spent)."""
+    start = time.perf_counter()
+    col_upper = col.upper()
+
+    # ---------- DATE Columns ----------
+    if "DATE" in col_upper:
+        out = pd.to_datetime(s, errors="coerce", dayfirst=True).dt.strftime("%Y-%m-%d")
+        if isinstance(s.dtype, pd.ArrowDtype):
+            out = out.astype(pd.ArrowDtype(pa.string()))
+
+    # ---------- PHONE Columns ----------
+    elif "PHONE" in col_upper:
+        arr = _arrow_string(s, cast_integers=True)
+        out = _to_series(_arrow_clean_phone(arr), s) if arr is not None else _apply_kernel(s, _clean_phone_value)
+
+    # ---------- TEXTUAL Columns ----------
+    elif s.dtype == "object":
+        out = _apply_kernel(s, _clean_text_value)
+    elif (arr := _arrow_string(s)) is not None:
+        out = _to_series(_arrow_clean_text(arr), s)
+
+    else:
+        out = None
+    return out, time.perf_counter() - start
+
+def clean_data(df: pd.DataFrame, max_workers: int = CLEAN_WORKERS, timings: dict = None) -> pd.DataFrame:
+    """Clean DATE, PHONE, and text columns.
+
+    Columns are cleaned in parallel on a thread pool; pass a dict as `timings`
+    to receive seconds spent per column.
+    """
+    columns = list(df.columns)
+    if max_workers > 1 and len(columns) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="clean") as pool:
+            cleaned = list(pool.map(lambda c: _clean_column(c, df[c]), columns))
+    else:
+        cleaned = [_clean_column(c, df[c]) for c in columns]
+
+    for col, (out, seconds) in zip(columns, cleaned):
+        if out is not None:
+            df[col] = out
+        if timings is not None:
+            timings[col] = seconds
     return df
 
+NULL_TOKENS = ("nan", "nat", "none", "null")
+# Exactly the characters str.strip() removes, so the Arrow kernel agrees with Python semantics
+_PY_WHITESPACE = "\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000"
+_ARROW_WS_RUN = "[" + "".join(f"\\x{{{ord(c):x}}}" for c in _PY_WHITESPACE) + "]+"  # Python's \s+ in RE2
+
+def _string_token_mask(values: np.ndarray) -> np.ndarray:
+    """Token mask for an object array holding only str values."""
+    if PYARROW_AVAILABLE:
+        arr = pa.array(values, type=pa.string())
+        normalized = pc.utf8_lower(pc.utf8_trim(arr, characters=_PY_WHITESPACE))
+        return pc.is_in(normalized, value_set=pa.array(NULL_TOKENS)).to_numpy(zero_copy_only=False)
+    return pd.Series(values, dtype=object).str.strip().str.lower().isin(NULL_TOKENS).to_numpy()
+
+def null_token_mask(s: pd.Series) -> np.ndarray:
+    """True where a value is missing or reads as nan/nat/none/null once stripped and lower-cased."""
+    arr = _arrow_string(s)
+    if arr is not None:  # Arrow-backed: no object array at all
+        normalized = pc.utf8_lower(pc.utf8_trim(arr, characters=_PY_WHITESPACE))
+        mask = pc.or_kleene(pc.is_null(arr), pc.is_in(normalized, value_set=pa.array(NULL_TOKENS)))
+        return pc.fill_null(mask, True).to_numpy(zero_copy_only=False)
+    values = s.to_numpy(dtype=object)
+    mask = pd.isna(values)
+    present = ~mask
+    if not present.any():
+        return mask
+    candidates = values[present]
+    if pd.api.types.infer_dtype(candidates, skipna=False) == "string":
+        mask[present] = _string_token_mask(candidates)
+    else:
+        # Mixed objects (Decimal('NaN'), bytes, ...): only these pay for str() per value
+        mask[present] = np.fromiter(
+            (str(x).strip().lower() in NULL_TOKENS for x in candidates), dtype=bool, count=len(candidates)
+        )
+    return mask
+
 def ensure_nulls(df: pd.DataFrame) -> pd.DataFrame:
-    """Ensure all missing values are true None (SQL NULL)."""
-    df = df.where(pd.notnull(df), None)  # replace NaN/NaT with None
-    df = df.applymap(lambda x: None if str(x).strip().lower() in ["nan", "nat", "none", "null"] else x)
+    """Ensure all missing values are true None (SQL NULL).
+
+    Works column by column: numeric, bool and datetime columns already carry
+    NaN/NaT which write_pandas stores as NULL, so only object, string and
+    categorical columns are scanned for "nan"/"nat"/"none"/"null" tokens.
+    """
+    df = df.copy(deep=False)
+    for col in df.columns:
+        s = df[col]
+        dtype = s.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            cats = pd.Series(dtype.categories)
+            drop = cats[null_token_mask(cats)].tolist()
+            if drop:
+                df[col] = s.cat.remove_categories(drop)
+        elif pd.api.types.is_object_dtype(dtype):
+            mask = null_token_mask(s)
+            if mask.any():
+                values = s.to_numpy(dtype=object, copy=True)
+                values[mask] = None
+                df[col] = pd.Series(values, index=s.index, dtype=object)
+        elif pd.api.types.is_string_dtype(dtype):
+            mask = null_token_mask(s)
+            if mask.any():
+                df[col] = s.mask(mask)
     return df
 
 def test_snowflake_connection():
     """Test if Snowflake connection works"""
     try:
-        conn = snowflake.connector.connect(
-            user=sf_user, password=sf_password, account=sf_account,
-            role=sf_role, warehouse=sf_warehouse,
-            database=sf_database, schema=sf_schema,
-        )
-        cursor = conn.cursor()
-        cursor.execute("SELECT CURRENT_VERSION()")
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        with sf_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT CURRENT_VERSION()")
+            result = cursor.fetchone()
+            cursor.close()
         return True, f"Connection successful. Snowflake version: {result[0]}"
     except Exception as e:
         return False, f"Connection failed: {str(e)}"
  
-def run_loader(api_list: list[str]):
+# ---------- Source Readers ----------
+STREAMING_THRESHOLD_BYTES = int(os.getenv("LOADER_STREAMING_THRESHOLD_MB", "256")) * 1024 * 1024
+DEFAULT_CHUNK_ROWS = int(os.getenv("LOADER_CHUNK_ROWS", "200000"))
+API_PAGINATION = os.getenv("LOADER_API_PAGINATION", "auto")  # "auto" (link/cursor) or "offset"
+API_PAGE_SIZE = int(os.getenv("LOADER_API_PAGE_SIZE", "1000"))
+API_PREFETCH = int(os.getenv("LOADER_API_PREFETCH", "4"))
+API_MAX_PAGES = int(os.getenv("LOADER_API_MAX_PAGES", "10000"))  # 0: no cap
+
+def json_fetcher(session, batch_rows: int = DEFAULT_CHUNK_ROWS) -> JsonApiFetcher:
+    return JsonApiFetcher(session, batch_rows=batch_rows, pagination=API_PAGINATION,
+                          page_size=API_PAGE_SIZE, prefetch=API_PREFETCH, max_pages=API_MAX_PAGES or None)
+
+def is_file_source(url: str) -> bool:
+    return os.path.exists(url) or url.endswith((".csv", ".parquet"))
+
+def read_source(url: str, session, results: list) -> pd.DataFrame:
+    """Read a whole source into memory (small files and JSON APIs)."""
+    if os.path.exists(url):  # Local uploaded file
+        if url.endswith(".csv"):
+            df = pd.read_csv(url)
+            results.append(f"Loaded local CSV with shape: {df.shape}")
+        elif url.endswith(".parquet"):
+            df = pd.read_parquet(url, dtype_backend="pyarrow")  # Arrow-backed: no object columns
+            results.append(f"Loaded local Parquet with shape: {df.shape}")
+        else:
+            raise ValueError(f"Unsupported local file type: {url}")
+    elif url.endswith(".csv"):
+        df = pd.read_csv(url)
+        results.append(f"Loaded remote CSV with shape: {df.shape}")
+    elif url.endswith(".parquet"):
+        df = pd.read_parquet(url)
+        results.append(f"Loaded remote Parquet with shape: {df.shape}")
+    else:
+        fetcher = json_fetcher(session)
+        batches = list(fetcher.iter_batches(url))
+        df = pd.concat(batches, ignore_index=True) if len(batches) > 1 else (batches[0] if batches else pd.DataFrame())
+        results.append(f"Loaded JSON API with shape: {df.shape} ({fetcher.pages} page(s))")
+    return df
+
+def iter_source_chunks(url: str, chunksize: int = DEFAULT_CHUNK_ROWS, session=None):
+    """Yield a CSV in `chunksize`-row frames, a Parquet file batch by batch within its row groups,
+    or a JSON API page stream in `chunksize`-record frames."""
+    if url.endswith(".csv"):
+        yield from pd.read_csv(url, chunksize=chunksize)
+    elif url.endswith(".parquet") and os.path.exists(url):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(url)
+        for batch in parquet_file.iter_batches(batch_size=chunksize):
+            yield batch.to_pandas(types_mapper=pd.ArrowDtype)
+    elif not is_file_source(url):
+        with (session or create_retry_session(pool_maxsize=API_PREFETCH + 1)) as session:
+            yield from json_fetcher(session, chunksize).iter_batches(url)
+    else:
+        raise ValueError(f"Streaming not supported for source: {url}")
+
+UPLOAD_BLOCK_BYTES = int(os.getenv("LOADER_UPLOAD_BLOCK_MB", "16")) * 1024 * 1024
+
+def csv_to_parquet(source, parquet_path: str, block_size: int = UPLOAD_BLOCK_BYTES) -> int:
+    """Convert a CSV file or binary file object to Parquet block by block; returns rows written.
+
+    Memory stays around one `block_size` block of Arrow data. The Parquet file is
+    written next to its final path and renamed into place, so a failed
+    conversion never leaves a partial file behind.
+    """
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+    reader = pacsv.open_csv(
+        source,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        # Match pandas.read_csv: empty strings in text columns are NULL too
+        convert_options=pacsv.ConvertOptions(strings_can_be_null=True),
+    )
+    tmp_path = parquet_path + ".part"
+    rows = 0
+    try:
+        with pq.ParquetWriter(tmp_path, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        os.replace(tmp_path, parquet_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+def should_stream(url: str, streaming=None) -> bool:
+    """Streaming is used when forced, or automatically for large local files, remote CSVs and NDJSON APIs."""
+    if streaming is not None:
+        return streaming and (url.endswith(".csv") or (url.endswith(".parquet") and os.path.exists(url)) or not is_file_source(url))
+    if os.path.exists(url):
+        return url.endswith((".csv", ".parquet")) and os.path.getsize(url) >= STREAMING_THRESHOLD_BYTES
+    return url.endswith(".csv") or is_ndjson(url)
+
+def table_name_for(url: str, i: int) -> str:
+    parsed = urllib.parse.urlparse(url)
+    filename = os.path.basename(parsed.path) or parsed.path or url
+    filename = re.sub(r"\.(ndjson|jsonl|json)$", "", filename)
+    table_name = filename.replace(".csv", "").replace(".parquet", "").replace("-", "_").upper()
+    return table_name or f"SOURCE_{i}"
+
+def sanitize_columns(columns) -> list[str]:
+    """Sanitize column names and de-duplicate collisions with _1, _2 suffixes."""
+    seen, final = {}, []
+    for c in (sanitize_column(c) for c in columns):
+        if c in seen:
+            seen[c] += 1
+            final.append(f"{c}_{seen[c]}")
+        else:
+            seen[c] = 0
+            final.append(c)
+    return final
+
+# ---------- Snowflake Writers ----------
+def write_pandas(*args, **kwargs):
+    """snowflake.connector.pandas_tools.write_pandas, imported on the first write rather than with the server."""
+    from snowflake.connector.pandas_tools import write_pandas as _write_pandas
+    return _write_pandas(*args, **kwargs)
+
+# "write_pandas" (default) or "copy": Parquet parts PUT to a stage and loaded with one COPY INTO
+LOADER_BACKEND = os.getenv("LOADER_BACKEND", "write_pandas").lower()
+copy_writer = create_copy_writer(sf_database, sf_schema) if LOADER_BACKEND == "copy" else None
+
+def pinned_dtypes(df: pd.DataFrame) -> dict:
+    """Column dtypes every chunk of a chunked write is cast to, taken from its first chunk.
+
+    The scratch table is created from the first chunk, but each later chunk would
+    otherwise be typed on its own. Text, and columns with no values yet, are pinned
+    as strings; integers as nullable Int64, so a later chunk with nulls stays integer.
+    """
+    dtypes = {}
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.ArrowDtype):
+            dtypes[col] = pd.ArrowDtype(pa.string()) if pa.types.is_null(s.dtype.pyarrow_dtype) else s.dtype
+        elif s.dtype == object or s.isna().all():
+            dtypes[col] = pd.StringDtype()
+        elif pd.api.types.is_bool_dtype(s.dtype):
+            dtypes[col] = pd.BooleanDtype()
+        elif pd.api.types.is_integer_dtype(s.dtype):
+            dtypes[col] = pd.Int64Dtype()
+        else:
+            dtypes[col] = s.dtype
+    return dtypes
+
+def cast_chunk(df: pd.DataFrame, dtypes: dict, n: int, table_name: str) -> pd.DataFrame:
+    """`df` with the pinned dtypes; raises when its values do not fit them (e.g. text in an integer column)."""
+    try:
+        return df.astype(dtypes)
+    except (ValueError, TypeError) as e:
+        raise RuntimeError(f"chunk {n} of {table_name} does not fit the column types of chunk 1: {e}") from e
+
+def write_full(conn, df: pd.DataFrame, table_name: str, results: list):
+    results.append(f"Writing {len(df)} rows to Snowflake table {table_name}")
+    if copy_writer is not None:
+        return write_copy(conn, [df], table_name, results)
+   
+    start = time.perf_counter()
+    with metrics.span("write", LOADER_STAGE_SECONDS):
+        success, nchunks, nrows, _ = write_pandas(
+            conn, df, table_name,
+            overwrite=True,
+            auto_create_table=True,
+            quote_identifiers=False
+        )
+   
+    if success:
+        bump_table_version(table_name, conn)
+        record_table_columns(table_name, df.dtypes)
+        results.append(f"SUCCESS: Loaded {nrows} rows into {table_name} (chunks: {nchunks}, "
+                       f"{nrows / max(time.perf_counter() - start, 1e-9):,.0f} rows/s)")
+        cursor = conn.cursor()
+        with metrics.span("verify", LOADER_STAGE_SECONDS):
+            cursor.execute(f"SELECT COUNT(*) FROM {sf_database}.{sf_schema}.{table_name}")
+            count_result = cursor.fetchone()
+        cursor.close()
+        results.append(f"VERIFICATION: Table {table_name} now has {count_result[0]} rows")
+    else:
+        results.append(f"ERROR: write_pandas returned success=False for {table_name}")
+
+def write_streaming(conn, chunks, table_name: str, results: list):
+    """Append cleaned chunks to a staging table, then atomically swap it into place.
+
+    Only one chunk is held in memory at a time. The target keeps serving its old
+    contents until the final SWAP, which gives the same end state as overwrite=True.
+    """
+    if copy_writer is not None:
+        return write_copy(conn, chunks, table_name, results)
+    staging = scratch_table(table_name, "STAGING")
+    total_rows = 0
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS {sf_database}.{sf_schema}.{staging}")
+        dtypes = None
+        for n, df in enumerate(chunks, start=1):
+            dtypes = dtypes or pinned_dtypes(df)
+            df = cast_chunk(df, dtypes, n, table_name)
+            with metrics.span("write", LOADER_STAGE_SECONDS):
+                success, nchunks, nrows, _ = write_pandas(
+                    conn, df, staging,
+                    overwrite=False,
+                    auto_create_table=(n == 1),
+                    quote_identifiers=False
+                )
+            if not success:
+                raise RuntimeError(f"write_pandas returned success=False for chunk {n} of {table_name}")
+            total_rows += nrows
+            results.append(f"Chunk {n}: appended {nrows} rows to {staging} (total {total_rows})")
+        if total_rows == 0:
+            results.append(f"WARNING: {table_name} produced no rows, target left unchanged")
+            cursor.execute(f"DROP TABLE IF EXISTS {sf_database}.{sf_schema}.{staging}")
+            return
+        with metrics.span("write", LOADER_STAGE_SECONDS):
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {sf_database}.{sf_schema}.{table_name} LIKE {sf_database}.{sf_schema}.{staging}")
+            cursor.execute(f"ALTER TABLE {sf_database}.{sf_schema}.{staging} SWAP WITH {sf_database}.{sf_schema}.{table_name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {sf_database}.{sf_schema}.{staging}")
+        bump_table_version(table_name, conn)
+        record_table_columns(table_name, dtypes)
+        results.append(f"SUCCESS: Streamed {total_rows} rows into {table_name} via {staging} "
+                       f"({total_rows / max(time.perf_counter() - start, 1e-9):,.0f} rows/s)")
+        with metrics.span("verify", LOADER_STAGE_SECONDS):
+            cursor.execute(f"SELECT COUNT(*) FROM {sf_database}.{sf_schema}.{table_name}")
+            count = cursor.fetchone()[0]
+        results.append(f"VERIFICATION: Table {table_name} now has {count} rows")
+    except Exception:
+        try:
+            cursor.execute(f"DROP TABLE IF EXISTS {sf_database}.{sf_schema}.{staging}")
+        except Exception:
+            pass
+        raise
+    finally:
+        cursor.close()
+
+def write_copy(conn, chunks, table_name: str, results: list):
+    """Replace `table_name` through the stage-and-COPY backend (see bulk_copy.BulkCopyWriter)."""
+    first = {}
+    def remember_first(chunks):
+        for df in chunks:
+            first.setdefault("dtypes", df.dtypes)
+            yield df
+    if copy_writer.load(conn, remember_first(chunks), table_name, sf_database, sf_schema, results):
+        bump_table_version(table_name, conn)
+        if "dtypes" in first:
+            record_table_columns(table_name, first["dtypes"])
+
+# ---------- Incremental Loads ----------
+# Per-table config: {"TRANSACTIONS": {"key": ["TXN_ID"], "watermark": "TXN_DATE", "since_param": "since"}}
+# Only rows at or after the stored high-water mark are cleaned and MERGEd on `key`.
+LOADER_STATE_PATH = os.getenv("LOADER_STATE_PATH", "loader_state.json")
+_state_lock = threading.Lock()
+
+def load_incremental_config() -> dict:
+    """Default incremental config from the JSON file named by LOADER_INCREMENTAL_CONFIG, if any."""
+    path = os.getenv("LOADER_INCREMENTAL_CONFIG")
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {k.upper(): v for k, v in json.load(f).items()}
+
+def read_watermarks() -> dict:
+    with _state_lock:
+        if not os.path.exists(LOADER_STATE_PATH):
+            return {}
+        with open(LOADER_STATE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+
+def save_watermark(table_name: str, watermark: str):
+    with _state_lock:
+        state = {}
+        if os.path.exists(LOADER_STATE_PATH):
+            with open(LOADER_STATE_PATH, encoding="utf-8") as f:
+                state = json.load(f)
+        state[table_name] = {"watermark": watermark, "updated_at": datetime.now(timezone.utc).isoformat()}
+        tmp = f"{LOADER_STATE_PATH}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, LOADER_STATE_PATH)
+
+def watermark_values(s: pd.Series, raw: bool = False) -> pd.Series:
+    """Comparable watermark values: datetimes or numbers, by dtype, else by what the values parse as.
+
+    Text that is not all numbers is read as timestamps whatever the column is
+    called (UPDATED, MODIFIED_AT_UTC, ...). Raw values of DATE columns are parsed
+    day-first like clean_data does; cleaned values and stored marks are ISO formatted.
+    Time zones are converted to naive UTC so marks compare across sources.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s.dtype):
+        values = s
+    elif pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+        return pd.to_numeric(s, errors="coerce")
+    else:
+        present = int(s.notna().sum())
+        numbers = pd.to_numeric(s, errors="coerce")
+        if int(numbers.notna().sum()) == present:
+            return numbers
+        if raw and "DATE" in str(s.name).upper():
+            values = pd.to_datetime(s, errors="coerce", dayfirst=True)
+        else:
+            values = pd.to_datetime(s, errors="coerce", format="ISO8601", utc=True)
+            if int(values.notna().sum()) < present:
+                values = pd.to_datetime(s, errors="coerce", format="mixed", utc=True)
+    if getattr(values.dt, "tz", None) is not None:
+        values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+    return values
+
+def filter_new_rows(df: pd.DataFrame, watermark: str, since) -> pd.DataFrame:
+    """Keep rows whose watermark is >= the stored mark (>= so same-day corrections are re-merged)."""
+    if since is None or df.empty:
+        return df
+    values = watermark_values(df[watermark], raw=True)
+    since_value = watermark_values(pd.Series([since], name=watermark)).iloc[0]
+    return df[values >= since_value].copy()  # cleaned in place afterwards
+
+def max_watermark(df: pd.DataFrame, watermark: str):
+    values = watermark_values(df[watermark]).dropna()
+    return None if values.empty else values.max()
+
+def format_watermark(value) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S") if isinstance(value, pd.Timestamp) else str(value)
+
+def no_mark_warning(table_name: str, watermark: str) -> str:
+    return (f"WARNING: watermark column {watermark} of {table_name} has no usable date or number; "
+            f"no high-water mark saved, the next incremental run re-reads every row")
+
+def table_exists(conn, table_name: str) -> bool:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {sf_database}.INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+            (sf_schema, table_name),
+        )
+        return cursor.fetchone()[0] > 0
+    finally:
+        cursor.close()
+
+def write_merge(conn, chunks, table_name: str, keys: list[str], watermark: str, results: list):
+    """Stage cleaned delta chunks in a <TABLE>__DELTA_<id> table and MERGE them into the target on `keys`.
+
+    Returns the highest watermark merged, or None when there was nothing new.
+    """
+    delta = scratch_table(table_name, "DELTA")
+    target_fq, delta_fq = f"{sf_database}.{sf_schema}.{table_name}", f"{sf_database}.{sf_schema}.{delta}"
+    total_rows, columns, new_mark, dtypes = 0, None, None, None
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS {delta_fq}")
+        for n, df in enumerate(chunks, start=1):
+            if df.empty:
+                continue
+            # MERGE rejects several source rows per key: keep the latest occurrence
+            df = df.drop_duplicates(subset=keys, keep="last")
+            dtypes = dtypes or pinned_dtypes(df)
+            df = cast_chunk(df, dtypes, n, table_name)
+            with metrics.span("write", LOADER_STAGE_SECONDS):
+                success, _, nrows, _ = write_pandas(
+                    conn, df, delta,
+                    overwrite=False,
+                    auto_create_table=columns is None,
+                    quote_identifiers=False
+                )
+            if not success:
+                raise RuntimeError(f"write_pandas returned success=False for delta chunk {n} of {table_name}")
+            columns = columns or list(df.columns)
+            mark = max_watermark(df, watermark)
+            if mark is not None and (new_mark is None or mark > new_mark):
+                new_mark = mark
+            total_rows += nrows
+        if total_rows == 0:
+            results.append(f"No new rows for {table_name}; nothing to merge")
+            return None
+        if new_mark is None:
+            results.append(no_mark_warning(table_name, watermark))
+
+        on = " AND ".join(f"t.{k} = s.{k}" for k in keys)
+        updates = ", ".join(f"t.{c} = s.{c}" for c in columns if c not in keys)
+        inserts, values = ", ".join(columns), ", ".join(f"s.{c}" for c in columns)
+        # Several chunks can still repeat a key: dedupe the staged delta once more
+        source = f"(SELECT * FROM {delta_fq} QUALIFY ROW_NUMBER() OVER (PARTITION BY {', '.join(keys)} ORDER BY {watermark} DESC) = 1)"
+        with metrics.span("write", LOADER_STAGE_SECONDS):
+            cursor.execute(
+                f"MERGE INTO {target_fq} t USING {source} s ON {on} "
+                + (f"WHEN MATCHED THEN UPDATE SET {updates} " if updates else "")
+                + f"WHEN NOT MATCHED THEN INSERT ({inserts}) VALUES ({values})"
+            )
+            merge_result = cursor.fetchone()
+        inserted = merge_result[0] if merge_result else 0
+        updated = merge_result[1] if merge_result and len(merge_result) > 1 else 0
+        bump_table_version(table_name, conn)
+        results.append(f"SUCCESS: Merged {total_rows} delta rows into {table_name} (inserted {inserted}, updated {updated})")
+        return format_watermark(new_mark) if new_mark is not None else None
+    finally:
+        try:
+            cursor.execute(f"DROP TABLE IF EXISTS {delta_fq}")
+        except Exception:
+            pass
+        cursor.close()
+
+def _clean_chunks(chunks, results: list, watermark: str = None, since=None):
+    """Sanitize, clean and null-normalize each raw chunk; column names are fixed by the first chunk.
+
+    Later chunks are aligned to the first one by name, not position: JSON pages
+    can list their keys in another order or leave some out (filled with nulls).
+    Keys the first chunk did not have are dropped with a warning, since the
+    table's columns are already fixed.
+    """
+    raw_columns = columns = None
+    for n, df in enumerate(chunks, start=1):
+        if columns is None:
+            raw_columns = df.columns.tolist()
+            results.append(f"Original columns ({len(df.columns)}): {raw_columns}")
+            columns = sanitize_columns(df.columns)
+            results.append(f"Sanitized columns ({len(columns)}): {columns}")
+        elif df.columns.tolist() != raw_columns:
+            known = set(raw_columns)
+            extra = [c for c in df.columns if c not in known]
+            if extra:
+                results.append(f"WARNING: chunk {n} has columns the first chunk did not, dropped: {extra}")
+            df = df.reindex(columns=raw_columns)
+        df.columns = columns
+        if watermark:
+            df = filter_new_rows(df, watermark, since)
+        clean_timings = {}
+        with metrics.span("clean", LOADER_STAGE_SECONDS):
+            df = clean_data(df, timings=clean_timings)
+        with metrics.span("null_normalize", LOADER_STAGE_SECONDS):
+            df = ensure_nulls(df)
+        if n == 1:
+            results.append(f"Cleaning time per column (ms): { {c: round(t * 1000, 1) for c, t in clean_timings.items()} }")
+            results.append(f"Data types: {dict(df.dtypes)}")
+            results.append(f"Sample data: {df.head(2).to_dict()}")
+        results.append(f"Loaded chunk {n} with shape: {df.shape}")
+        yield df
+
+def prepare_frame(df: pd.DataFrame, watermark: str = None, since=None):
+    """Sanitize columns, clean and null-normalize one in-memory source.
+
+    Returns (df, log lines, {stage: seconds}); the caller records the stage
+    times, since metrics observed in a worker process would be lost. With a
+    watermark column and mark, rows older than the mark are dropped before
+    cleaning. Top-level and self-contained so it can run in a worker process.
+    """
+    logs = []
+    original_columns = df.columns.tolist()
+    logs.append(f"Original columns ({len(original_columns)}): {original_columns}")
+   
+    df.columns = sanitize_columns(df.columns)
+    logs.append(f"Sanitized columns ({len(df.columns)}): {list(df.columns)}")
+
+    if watermark and since is not None:
+        before = len(df)
+        df = filter_new_rows(df, watermark, since)
+        logs.append(f"Incremental filter: {len(df)} of {before} rows at or after {watermark} >= {since}")
+   
+    # ---------- Clean Data ----------
+    # Already one source per process: don't fan out again inside the worker
+    clean_timings = {}
+    start = time.perf_counter()
+    df = clean_data(df, max_workers=1, timings=clean_timings)
+    stages = {"clean": time.perf_counter() - start}
+    logs.append(f"Cleaning time per column (ms): { {c: round(t * 1000, 1) for c, t in clean_timings.items()} }")
+
+    # ---------- Ensure NULLs ----------
+    start = time.perf_counter()
+    df = ensure_nulls(df)
+    stages["null_normalize"] = time.perf_counter() - start
+   
+    logs.append(f"Data types: {dict(df.dtypes)}")
+    logs.append(f"Sample data: {df.head(2).to_dict()}")
+    return df, logs, stages
+
+# ---------- Concurrency ----------
+FETCH_WORKERS = int(os.getenv("LOADER_FETCH_WORKERS", "4"))
+CLEAN_PROCESSES = int(os.getenv("LOADER_CLEAN_PROCESSES", str(min(4, os.cpu_count() or 1))))
+WRITE_CONCURRENCY = int(os.getenv("LOADER_WRITE_CONCURRENCY", "2"))
+_clean_pool = None
+_clean_pool_size = 0
+_clean_pool_lock = threading.Lock()
+
+def _get_clean_pool(processes: int):
+    """Lazily started process pool for CPU-bound cleaning, reused across loader runs."""
+    global _clean_pool, _clean_pool_size
+    with _clean_pool_lock:
+        if _clean_pool is None or _clean_pool_size != processes:
+            if _clean_pool is not None:
+                _clean_pool.shutdown(wait=False)
+            # forkserver: never fork a process that is running Snowflake/HTTP threads
+            ctx = multiprocessing.get_context("forkserver")
+            _clean_pool = ProcessPoolExecutor(max_workers=processes, mp_context=ctx)
+            _clean_pool_size = processes
+        return _clean_pool
+
+def _with_query_param(url: str, param: str, value) -> str:
+    parsed = urllib.parse.urlparse(url)
+    query = urllib.parse.parse_qsl(parsed.query) + [(param, str(value))]
+    return urllib.parse.urlunparse(parsed._replace(query=urllib.parse.urlencode(query)))
+
+def _tracking_watermark(chunks, watermark: str, box: dict):
+    """Pass chunks through while remembering the highest watermark seen in box["mark"]."""
+    for df in chunks:
+        mark = max_watermark(df, watermark) if watermark in df.columns else None
+        if mark is not None and (box.get("mark") is None or mark > box["mark"]):
+            box["mark"] = mark
+        yield df
+
+# ---------- Progress / Cancellation ----------
+class LoadCancelled(Exception):
+    """The run's cancel event was set; raised between chunks and between stages."""
+
+
+class SourceProgress:
+    """Row counters of one source, passed to the run's progress callback on every change.
+
+    Counters advance chunk by chunk while streaming and once per stage otherwise.
+    `check()` raises LoadCancelled once the cancel event is set; writers drop
+    their staging tables on the way out, so the target keeps its old contents.
+    """
+
+    def __init__(self, name: str, url: str, callback=None, cancel_event: threading.Event = None):
+        self.name = name
+        self.url = url
+        self.table = None
+        self.status = "queued"
+        self.rows_fetched = self.rows_cleaned = self.rows_written = 0
+        self.started = self.finished = None
+        self._callback = callback
+        self._cancel = cancel_event
+
+    def check(self):
+        if self._cancel is not None and self._cancel.is_set():
+            raise LoadCancelled(f"{self.name} cancelled")
+
+    def update(self, **fields):
+        for k, v in fields.items():
+            setattr(self, k, v)
+        if self.status in ("done", "failed", "cancelled", "skipped") and self.finished is None:
+            self.finished = time.time()
+        if self._callback is not None:
+            self._callback(self.snapshot())
+
+    def add(self, counter: str, rows: int):
+        self.update(**{counter: getattr(self, counter) + rows})
+
+    def counted(self, chunks, counter: str):
+        """Pass chunks through, adding their rows to `counter` as they arrive."""
+        for df in chunks:
+            self.check()
+            self.add(counter, len(df))
+            yield df
+
+    def written(self, chunks):
+        """Pass chunks to a writer, counting each once the writer asks for the next one."""
+        for df in chunks:
+            self.check()
+            yield df
+            self.add("rows_written", len(df))
+        self.check()
+
+    def snapshot(self) -> dict:
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0.0
+        return {
+            "source": self.name, "url": self.url, "table": self.table, "status": self.status,
+            "rows_fetched": self.rows_fetched, "rows_cleaned": self.rows_cleaned, "rows_written": self.rows_written,
+            "elapsed_s": round(elapsed, 2),
+            "rows_per_s": round(self.rows_written / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+def load_source(name: str, url: str, i: int, streaming, chunksize: int,
+                fetch_slots: threading.Semaphore, write_slots: threading.Semaphore, clean_processes: int,
+                incremental: dict = None, progress: SourceProgress = None) -> list:
+    """Fetch, clean and write one source; returns its own log lines."""
+    results = []
+    progress = progress or SourceProgress(name, url)
+    try:
+        progress.check()
+        results.append(f"Processing {name}: {url}")
+        table_name = table_name_for(url, i)
+        progress.update(table=table_name, status="fetching", started=time.time())
+
+        # ---------- Incremental Mode ----------
+        inc = (incremental or {}).get(table_name)
+        keys = watermark = since = None
+        merge = False
+        if inc:
+            keys = [sanitize_column(k) for k in ([inc["key"]] if isinstance(inc["key"], str) else inc["key"])]
+            watermark = sanitize_column(inc["watermark"])
+            with sf_pool.connection() as conn:
+                merge = table_exists(conn, table_name)
+            if merge:
+                since = read_watermarks().get(table_name, {}).get("watermark")
+                results.append(f"Incremental load of {table_name} on {keys}, watermark {watermark} >= {since}")
+                if since is not None and inc.get("since_param") and not os.path.exists(url) and not url.endswith((".csv", ".parquet")):
+                    url = _with_query_param(url, inc["since_param"], since)
+            else:
+                results.append(f"Incremental load of {table_name}: target missing, doing a full load first")
+        box = {}
+       
+        if should_stream(url, streaming):
+            results.append(f"Streaming {url} in chunks of {chunksize} rows")
+            results.append(f"Target table name: {table_name}")
+            chunks = progress.counted(metrics.timed_iter(iter_source_chunks(url, chunksize), "fetch"), "rows_fetched")
+            chunks = progress.counted(_clean_chunks(chunks, results, watermark, since), "rows_cleaned")
+            mirror = replica is not None and replica.wants(table_name)
+            # Chunks are fetched lazily while writing, so the whole source counts against the write limit
+            with write_slots, sf_pool.connection() as conn:
+                progress.update(status="streaming")
+                if merge:
+                    box["mark"] = write_merge(conn, progress.written(chunks), table_name, keys, watermark, results)
+                    if mirror:
+                        update_replica(table_name, results, conn=conn)
+                else:
+                    if watermark:
+                        chunks = _tracking_watermark(chunks, watermark, box)
+                    chunks = progress.written(_replica_frames(chunks, box) if mirror else chunks)
+                    write_streaming(conn, chunks, table_name, results)
+                    box["mark"] = format_watermark(box["mark"]) if box.get("mark") is not None else None
+                    if watermark and box["mark"] is None:
+                        results.append(no_mark_warning(table_name, watermark))
+            if mirror and not merge:
+                if box.get("frames"):
+                    update_replica(table_name, results, df=pd.concat(box["frames"], ignore_index=True))
+                else:
+                    replica.drop(table_name)
+                    results.append(f"Replica: {table_name} exceeds {replica.max_rows} rows, left to Snowflake")
+        else:
+            # ---------- Load Data ----------
+            with fetch_slots:
+                with create_retry_session(pool_maxsize=API_PREFETCH + 1) as session, \
+                        metrics.span("fetch", LOADER_STAGE_SECONDS):
+                    df = read_source(url, session, results)
+            progress.add("rows_fetched", len(df))
+ 
+            if df.empty:
+                results.append(f"WARNING: {name} is empty, skipping")
+                progress.update(status="skipped")
+                return results
+            progress.check()
+ 
+            # ---------- Table Name ----------
+            results.append(f"Target table name: {table_name}")
+           
+            # ---------- Column Handling / Clean Data / Ensure NULLs ----------
+            if clean_processes > 1:
+                df, logs, stages = _get_clean_pool(clean_processes).submit(prepare_frame, df, watermark, since).result()
+            else:
+                df, logs, stages = prepare_frame(df, watermark, since)
+            results.extend(logs)
+            for stage, seconds in stages.items():
+                metrics.record(stage, seconds, LOADER_STAGE_SECONDS)
+            progress.add("rows_cleaned", len(df))
+            progress.check()
+ 
+            # ---------- Write to Snowflake ----------
+            with write_slots, sf_pool.connection() as conn:
+                progress.check()
+                progress.update(status="writing")
+                if merge:
+                    box["mark"] = write_merge(conn, [df], table_name, keys, watermark, results)
+                else:
+                    write_full(conn, df, table_name, results)
+                    mark = max_watermark(df, watermark) if watermark else None
+                    box["mark"] = format_watermark(mark) if mark is not None else None
+                    if watermark and mark is None:
+                        results.append(no_mark_warning(table_name, watermark))
+                if replica is not None and replica.wants(table_name):
+                    # After a MERGE the table is more than this frame: re-read it
+                    update_replica(table_name, results, df=None if merge else df, conn=conn)
+            if not any(line.startswith("ERROR") for line in results):
+                progress.add("rows_written", len(df))
+
+        if inc and box.get("mark") is not None:
+            save_watermark(table_name, box["mark"])
+            results.append(f"Watermark for {table_name} advanced to {box['mark']}")
+        progress.update(status="failed" if any(line.startswith("ERROR") for line in results) else "done")
+ 
+    except LoadCancelled:
+        results.append(f"CANCELLED: {name} stopped, its target table was left unchanged")
+        progress.update(status="cancelled")
+    except Exception as e:
+        error_msg = f"ERROR processing {name}: {str(e)}"
+        results.append(error_msg)
+        results.append(f"Traceback: {traceback.format_exc()}")
+        progress.update(status="failed")
+    return results
+
+def run_loader(api_list: list[str], streaming=None, chunksize: int = DEFAULT_CHUNK_ROWS,
+               fetch_workers: int = FETCH_WORKERS, clean_processes: int = CLEAN_PROCESSES,
+               write_concurrency: int = WRITE_CONCURRENCY, incremental: dict = None,
+               progress=None, cancel_event: threading.Event = None):
+    """Load each source into HACKATHON.RAW.
+
+    Sources run concurrently: at most `fetch_workers` downloads, `clean_processes`
+    cleaning processes and `write_concurrency` Snowflake writes at a time. Each
+    source's log lines are kept together, in input order.
+
+    streaming=None streams large local files and remote CSVs chunk by chunk;
+    True/False forces the mode where the source supports it.
+
+    `incremental` maps target table names to {"key", "watermark", "since_param"};
+    those tables are MERGEd from the rows at or after their last high-water mark
+    instead of being overwritten. Defaults to LOADER_INCREMENTAL_CONFIG.
+
+    `progress(snapshot)` is called with a SourceProgress.snapshot() dict whenever
+    a source's counters or status change. Setting `cancel_event` stops every
+    source at its next chunk or stage boundary.
+    """
     results = []
+    incremental = {k.upper(): v for k, v in (incremental if incremental is not None else load_incremental_config()).items()}
    
     # First test the connection
     conn_success, conn_msg = test_snowflake_connection()
-    results.append(f"Connection test: {conn_msg}")
+    # ERROR-prefixed like every other failure line: job status and callers key off it
+    results.append(f"Connection test: {conn_msg}" if conn_success else f"ERROR: Connection test: {conn_msg}")
    
     if not conn_success:
         return results
    
-    session = create_retry_session()
-    conn = None
-   
     try:
-        # Connect to Snowflake
-        conn = snowflake.connector.connect(
-            user=sf_user, password=sf_password, account=sf_account,
-            role=sf_role, warehouse=sf_warehouse,
-            database=sf_database, schema=sf_schema,
-        )
-        results.append("Connected to Snowflake successfully")
-       
         # Process each source
         sources = {f"source_{i+1}": url for i, url in enumerate(api_list) if url.strip()}
         results.append(f"Processing {len(sources)} sources: {list(sources.keys())}")
+        if not sources:
+            return results
  
-        for i, (name, url) in enumerate(sources.items(), start=1):
-            try:
-                results.append(f"Processing {name}: {url}")
-               
-                # ---------- Load Data ----------
-                if os.path.exists(url):  # Local uploaded file
-                    if url.endswith(".csv"):
-                        df = pd.read_csv(url)
-                        results.append(f"Loaded local CSV with shape: {df.shape}")
-                    elif url.endswith(".parquet"):
-                        df = pd.read_parquet(url)
-                        results.append(f"Loaded local Parquet with shape: {df.shape}")
-                    else:
-                        raise ValueError(f"Unsupported local file type: {url}")
-                elif url.endswith(".csv"):
-                    df = pd.read_csv(url)
-                    results.append(f"Loaded remote CSV with shape: {df.shape}")
-                elif url.endswith(".parquet"):
-                    df = pd.read_parquet(url)
-                    results.append(f"Loaded remote Parquet with shape: {df.shape}")
-                else:
-                    response = session.get(url, timeout=15)
-                    response.raise_for_status()
-                    data = response.json()
-                    df = pd.DataFrame(data)
-                    results.append(f"Loaded JSON API with shape: {df.shape}")
- 
-                if df.empty:
-                    results.append(f"WARNING: {name} is empty, skipping")
-                    continue
- 
-                # ---------- Table Name ----------
-                parsed = urllib.parse.urlparse(url)
-                filename = os.path.basename(parsed.path) or parsed.path or url
-                table_name = filename.replace(".csv", "").replace(".parquet", "").replace("-", "_").upper()
-                if not table_name:
-                    table_name = f"SOURCE_{i}"
-                results.append(f"Target table name: {table_name}")
-               
-                # ---------- Column Handling ----------
-                original_columns = df.columns.tolist()
-                results.append(f"Original columns ({len(original_columns)}): {original_columns}")
-               
-                df.columns = [sanitize_column(c) for c in df.columns]
-               
-                # Handle duplicate columns
-                seen, final = {}, []
-                for c in df.columns:
-                    if c in seen:
-                        seen[c] += 1
-                        final.append(f"{c}_{seen[c]}")
-                    else:
-                        seen[c] = 0
-                        final.append(c)
-                df.columns = final
-                results.append(f"Sanitized columns ({len(final)}): {final}")
-               
-                # ---------- Clean Data ----------
-                df = clean_data(df)
-
-                # ---------- Ensure NULLs ----------
-                df = ensure_nulls(df)
-               
-                results.append(f"Data types: {dict(df.dtypes)}")
-                results.append(f"Sample data: {df.head(2).to_dict()}")
- 
-                # ---------- Write to Snowflake ----------
-                results.append(f"Writing {len(df)} rows to Snowflake table {table_name}")
-               
-                success, nchunks, nrows, _ = write_pandas(
-                    conn, df, table_name,
-                    overwrite=True,
-                    auto_create_table=True,
-                    quote_identifiers=False
-                )
-               
-                if success:
-                    results.append(f"SUCCESS: Loaded {nrows} rows into {table_name} (chunks: {nchunks})")
-                    cursor = conn.cursor()
-                    cursor.execute(f"SELECT COUNT(*) FROM {sf_database}.{sf_schema}.{table_name}")
-                    count_result = cursor.fetchone()
-                    cursor.close()
-                    results.append(f"VERIFICATION: Table {table_name} now has {count_result[0]} rows")
-                else:
-                    results.append(f"ERROR: write_pandas returned success=False for {table_name}")
- 
-            except Exception as e:
-                error_msg = f"ERROR processing {name}: {str(e)}"
-                results.append(error_msg)
-                results.append(f"Traceback: {traceback.format_exc()}")
+        trackers = {name: SourceProgress(name, url, progress, cancel_event) for name, url in sources.items()}
+        for tracker in trackers.values():
+            tracker.update()
+        start = time.perf_counter()
+        fetch_slots = threading.Semaphore(max(1, fetch_workers))
+        write_slots = threading.Semaphore(max(1, write_concurrency))
+        # Enough threads to keep every stage's slots busy; the semaphores do the real limiting
+        workers = min(len(sources), max(1, fetch_workers) + max(1, clean_processes) + max(1, write_concurrency))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="loader") as executor:
+            futures = [
+                executor.submit(load_source, name, url, i, streaming, chunksize,
+                                fetch_slots, write_slots, clean_processes, incremental, trackers[name])
+                for i, (name, url) in enumerate(sources.items(), start=1)
+            ]
+            for future in futures:
+                results.extend(future.result())
+        results.append(f"Processed {len(sources)} sources in {time.perf_counter() - start:.1f}s")
  
     except Exception as e:
         error_msg = f"CRITICAL ERROR: {str(e)}"
         results.append(error_msg)
         results.append(f"Traceback: {traceback.format_exc()}")
-       
-    finally:
-        if conn:
-            try:
-                conn.close()
-                results.append("Snowflake connection closed")
-            except:
-                pass
  
     return results
@@ -0,0 +1,154 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds: from a cache hit to a slow warehouse query or a large loader write
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label combination."""
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for labelvalues, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames + ('le',), labelvalues + (le,))} {cumulative}")
+            labels = _label_str(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time: a number, or {label value: number} for `labelname`."""
+
+    def __init__(self, name: str, help: str, fn, labelname: str = None, kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelname = labelname
+        self.kind = kind
+
+    def render(self) -> list:
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.warning("metric %s failed: %s", self.name, e)
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if isinstance(value, dict):
+            for label, v in sorted(value.items()):
+                lines.append(f"{self.name}{_label_str((self.labelname,), (label,))} {float(v)}")
+        elif value is not None:
+            lines.append(f"{self.name} {float(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn, labelname: str = None, kind: str = "gauge") -> Gauge:
+        self._metrics[name] = Gauge(name, help, fn, labelname, kind)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+ASK_STAGE_SECONDS = REGISTRY.histogram(
+    "ask_stage_seconds", "Time spent in each stage of answering a question.", ("stage",))
+LOADER_STAGE_SECONDS = REGISTRY.histogram(
+    "loader_stage_seconds", "Time spent in each stage of loading a source.", ("stage",))
+
+# Per-request breakdown: a dict of stage -> ms while collect_timings() is active
+_timings = contextvars.ContextVar("timings", default=None)
+
+
+# ---------- Spans ----------
+def record(stage: str, seconds: float, histogram: Histogram = ASK_STAGE_SECONDS):
+    """Account `seconds` to `stage` in `histogram` and in the current request's breakdown."""
+    histogram.observe(seconds, stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds * 1000, 2)
+
+
+@contextmanager
+def span(stage: str, histogram: Histogram = ASK_STAGE_SECONDS):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, histogram)
+
+
+def timed_iter(iterable, stage: str, histogram: Histogram = LOADER_STAGE_SECONDS):
+    """Yield from `iterable`, timing each step as `stage` (e.g. lazily fetched chunks)."""
+    it = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            record(stage, time.perf_counter() - start, histogram)
+            return
+        record(stage, time.perf_counter() - start, histogram)
+        yield item
+
+
+@contextmanager
+def collect_timings():
+    """Collect the spans of this request (threads and tasks started from it included) into a dict."""
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
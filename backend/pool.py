@@ -0,0 +1,170 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+def snowflake_connect(**kwargs):
+    """snowflake.connector.connect, importing the connector on the first connection."""
+    import snowflake.connector
+    return snowflake.connector.connect(**kwargs)
+
+
+def is_connection_error(e: BaseException) -> bool:
+    """Connector errors that poison the session (never true before the connector is imported)."""
+    connector = sys.modules.get("snowflake.connector")
+    return connector is not None and isinstance(
+        e, (connector.errors.OperationalError, connector.errors.InterfaceError))
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became available within wait_timeout."""
+
+
+class SnowflakePool:
+    """Bounded pool of reusable Snowflake connections.
+
+    Connections are handed out LIFO so hot connections stay warm and cold ones
+    age out through idle eviction. A connection that has been idle longer than
+    `health_check_after` seconds is pinged with `SELECT 1` before reuse.
+    """
+
+    def __init__(self, max_size=8, wait_timeout=30.0, idle_timeout=600.0,
+                 health_check_after=60.0, connect=None, **connect_kwargs):
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self._connect = connect or snowflake_connect
+        self._connect_kwargs = connect_kwargs
+        self._idle = []  # [(conn, last_used)]
+        self._size = 0  # idle + checked out
+        self._cond = threading.Condition()
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.evictions = 0
+
+    # ---------- Internals ----------
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, idle_for):
+        try:
+            if conn.is_closed():
+                return False
+            if idle_for >= self.health_check_after:
+                cur = conn.cursor()
+                try:
+                    cur.execute("SELECT 1")
+                    cur.fetchone()
+                finally:
+                    cur.close()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle_locked(self, now):
+        keep = []
+        for conn, last_used in self._idle:
+            if now - last_used > self.idle_timeout:
+                self._size -= 1
+                self.evictions += 1
+                self._close(conn)
+            else:
+                keep.append((conn, last_used))
+        self._idle = keep
+
+    # ---------- Public API ----------
+    def acquire(self):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._cond:
+                self._evict_idle_locked(time.monotonic())
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            f"No Snowflake connection available within {self.wait_timeout}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    conn, last_used = None, None
+                    self._size += 1  # reserve a slot before connecting outside the lock
+
+            if conn is None:
+                try:
+                    conn = self._connect(**self._connect_kwargs)
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self.misses += 1
+                return conn
+
+            if self._is_healthy(conn, time.monotonic() - last_used):
+                with self._cond:
+                    self.hits += 1
+                return conn
+
+            # Broken connection: drop it and try again
+            self._close(conn)
+            with self._cond:
+                self._size -= 1
+                self.evictions += 1
+                self._cond.notify()
+
+    def release(self, conn, discard=False):
+        if discard or conn.is_closed():
+            self._close(conn)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException as e:
+            # Connection-level failures poison the session; don't hand it out again
+            self.release(conn, discard=is_connection_error(e))
+            raise
+        else:
+            self.release(conn)
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            total = self.hits + self.misses
+            return {
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "timeouts": self.timeouts,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,45 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class IssuedQueryIds:
+    """Snowflake query ids this worker handed to a client, so /results only re-reads those.
+
+    RESULT_SCAN runs as the shared service role, which can read the result of
+    any query that role ran; without this set, knowing or guessing an id is
+    enough to read someone else's rows. Ids expire after `ttl` seconds
+    (Snowflake keeps results for 24 hours) and the oldest are dropped beyond
+    `max_ids`.
+    """
+
+    def __init__(self, max_ids=10_000, ttl=24 * 3600.0):
+        self.max_ids = max_ids
+        self.ttl = ttl
+        self._ids = OrderedDict()  # query id -> issued at
+        self._lock = threading.Lock()
+        self.issued = 0
+        self.denied = 0
+
+    def add(self, query_id: str):
+        with self._lock:
+            self._ids.pop(query_id, None)
+            self._ids[query_id] = time.time()
+            self.issued += 1
+            while len(self._ids) > self.max_ids:
+                self._ids.popitem(last=False)
+
+    def allowed(self, query_id: str) -> bool:
+        now = time.time()
+        with self._lock:
+            issued = self._ids.get(query_id)
+            if issued is not None and self.ttl is not None and now - issued > self.ttl:
+                del self._ids[query_id]
+                issued = None
+            if issued is None:
+                self.denied += 1
+            return issued is not None
+
+    def stats(self):
+        with self._lock:
+            return {"ids": len(self._ids), "max_ids": self.max_ids, "issued": self.issued, "denied": self.denied}
@@ -0,0 +1,228 @@
+import os
+import re
+import threading
+import time
+
+from result_cache import canonicalize_sql, referenced_tables
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    SQLGLOT_AVAILABLE = True
+except ImportError:
+    SQLGLOT_AVAILABLE = False
+
+REPLICA_CATALOG = "HACKATHON"
+REPLICA_SCHEMA = "RAW"
+_USE_SCHEMA = f"USE {REPLICA_CATALOG}.{REPLICA_SCHEMA}"
+# Snowflake-only constructs: never sent to DuckDB, even when sqlglot can "translate" them
+_SNOWFLAKE_ONLY_RE = re.compile(
+    r"\b(?:flatten|lateral|parse_json|object_construct|array_construct|get_path|result_scan|"
+    r"information_schema|split_to_table|generator|seq[1248]|uuid_string|current_\w+|sysdate|getdate)\b"
+    r"|(?<=[\w\"\]]):(?![:=])",  # variant path access col:field (but not ::casts)
+)
+# Without sqlglot: functions whose name, arguments or semantics differ between the dialects
+_UNTRANSLATED_RE = re.compile(
+    r"\b(?:to_date|to_timestamp\w*|to_char|to_varchar|to_number|to_decimal|try_to_\w+|try_cast|iff|nvl2?|"
+    r"zeroifnull|nullifzero|decode|dateadd|datediff|timestampadd|timestampdiff|date_from_parts|"
+    r"listagg|div0|ratio_to_report|array_agg|within)\b"
+)
+
+
+class ReplicaMiss(Exception):
+    """The query cannot be answered by the replica; run it on Snowflake."""
+
+
+class DuckDBReplica:
+    """In-process DuckDB copy of small, hot HACKATHON.RAW tables.
+
+    The loader mirrors each replicated table from the frame it has just cleaned
+    and written, tagged with the table version the write produced. A query is
+    served locally only when every table it reads is mirrored at its current
+    version and its SQL is known to run the same in DuckDB (translated from
+    Snowflake with sqlglot when installed, otherwise a conservative blocklist);
+    everything else, including any DuckDB error, falls back to Snowflake.
+    Loads made by other worker processes reach the version through Snowflake's
+    LAST_ALTERED (loader.sync_table_versions), after which the copy is stale
+    until it is mirrored again.
+    """
+
+    def __init__(self, tables, max_rows=100_000, table_version=None):
+        self.tables = {t.strip().upper() for t in tables if t.strip()}
+        self.max_rows = max_rows
+        self._table_version = table_version or (lambda table: 0)
+        self._versions = {}  # table -> table version the mirrored copy reflects
+        self._lock = threading.Lock()
+        self._conn = duckdb.connect(":memory:")
+        # Same three-part names as Snowflake: HACKATHON.RAW.<table>
+        self._conn.execute(f"ATTACH ':memory:' AS {REPLICA_CATALOG}")
+        self._conn.execute(f"CREATE SCHEMA IF NOT EXISTS {REPLICA_CATALOG}.{REPLICA_SCHEMA}")
+        # Generated SQL often names tables bare (FROM stores), resolved against the session's HACKATHON.RAW
+        self._conn.execute(_USE_SCHEMA)
+        self._translated = {}  # canonical Snowflake SQL -> DuckDB SQL, or None if not servable
+        self.hits = 0
+        self.fallbacks = 0
+        self.errors = 0
+
+    # ---------- Mirroring ----------
+    def wants(self, table_name: str) -> bool:
+        return table_name.upper() in self.tables
+
+    def mirror(self, table_name: str, data, version: int = None):
+        """Replace the local copy of `table_name` with a DataFrame or pyarrow Table."""
+        table_name = table_name.upper()
+        if not self.wants(table_name):
+            return False
+        if len(data) > self.max_rows:
+            self.drop(table_name)
+            return False
+        target = f'{REPLICA_CATALOG}.{REPLICA_SCHEMA}."{table_name}"'
+        with self._lock:
+            self._conn.register("_replica_src", data)
+            try:
+                self._conn.execute(f"CREATE OR REPLACE TABLE {target} AS SELECT * FROM _replica_src")
+            finally:
+                self._conn.unregister("_replica_src")
+            self._versions[table_name] = self._table_version(table_name) if version is None else version
+        return True
+
+    def mirror_from(self, conn, table_name: str):
+        """Refresh a mirrored table from Snowflake (after a MERGE, or to warm up at startup)."""
+        if not self.wants(table_name):
+            return False
+        version = self._table_version(table_name)
+        cur = conn.cursor()
+        try:
+            cur.execute(f'SELECT * FROM {REPLICA_CATALOG}.{REPLICA_SCHEMA}."{table_name.upper()}" LIMIT {self.max_rows + 1}')
+            table = cur.fetch_arrow_all()
+        finally:
+            cur.close()
+        if table is None:
+            return False
+        return self.mirror(table_name, table, version)
+
+    def mirrored(self) -> set:
+        """Tables that currently have a local copy."""
+        with self._lock:
+            return set(self._versions)
+
+    def drop(self, table_name: str):
+        table_name = table_name.upper()
+        with self._lock:
+            self._versions.pop(table_name, None)
+            self._conn.execute(f'DROP TABLE IF EXISTS {REPLICA_CATALOG}.{REPLICA_SCHEMA}."{table_name}"')
+
+    # ---------- Routing ----------
+    def _current(self, tables) -> bool:
+        return bool(tables) and all(
+            t in self._versions and self._versions[t] == self._table_version(t) for t in tables
+        )
+
+    def _translate(self, sql: str):
+        """DuckDB SQL for a Snowflake query over replicated tables only, or None."""
+        if _SNOWFLAKE_ONLY_RE.search(canonicalize_sql(sql)):
+            return None
+        if not SQLGLOT_AVAILABLE:
+            if _UNTRANSLATED_RE.search(canonicalize_sql(sql)):
+                return None
+            return sql
+        try:
+            tree = sqlglot.parse_one(sql, read="snowflake")
+        except Exception:
+            return None
+        if not tree.find(exp.Select) or tree.find(exp.Insert, exp.Update, exp.Delete, exp.Create, exp.Drop, exp.Merge):
+            return None
+        ctes = {cte.alias_or_name.upper() for cte in tree.find_all(exp.CTE)}
+        for table in tree.find_all(exp.Table):
+            name = table.name.upper()
+            if name in ctes and not table.db:
+                continue
+            if (table.catalog and table.catalog.upper() != REPLICA_CATALOG) or (table.db and table.db.upper() != REPLICA_SCHEMA):
+                return None
+        try:
+            return tree.sql(dialect="duckdb")
+        except Exception:
+            return None
+
+    def route(self, sql: str):
+        """The DuckDB SQL to run for `sql`, or None to use Snowflake."""
+        tables = referenced_tables(sql) - (self._cte_names(sql) - self.tables)
+        if not tables or not tables <= self.tables or not self._current(tables):
+            return None
+        key = canonicalize_sql(sql)
+        if key not in self._translated:
+            if len(self._translated) > 4096:
+                self._translated.clear()
+            self._translated[key] = self._translate(sql)
+        return self._translated[key]
+
+    @staticmethod
+    def _cte_names(sql: str) -> set:
+        return {m.group(1).upper() for m in re.finditer(r"(?:\bwith|,)\s+([a-z_][a-z0-9_$]*)\s+as\s*\(", sql, re.IGNORECASE)}
+
+    # ---------- Execution ----------
+    def execute(self, sql: str, limit: int = None, arrow: bool = False):
+        """Run a routed query: (columns, rows or Table, truncated, elapsed_ms); raises ReplicaMiss."""
+        duck_sql = self.route(sql)
+        if duck_sql is None:
+            self.fallbacks += 1
+            raise ReplicaMiss(sql)
+        start = time.time()
+        try:
+            cur = self._conn.cursor()  # per-thread handle on the shared database
+            try:
+                cur.execute(_USE_SCHEMA)  # cursors start in the default catalog, not the parent's
+                cur.execute(duck_sql)
+                columns = [self._snowflake_name(c[0], sql) for c in cur.description]
+                if arrow:
+                    table = cur.fetch_arrow_table()
+                    truncated = limit is not None and table.num_rows > limit
+                    data = table.slice(0, limit) if truncated else table
+                    data = data.rename_columns(columns)
+                else:
+                    fetched = cur.fetchmany(limit + 1) if limit is not None else cur.fetchall()
+                    truncated = limit is not None and len(fetched) > limit
+                    data = fetched[:limit] if truncated else fetched
+            finally:
+                cur.close()
+        except Exception as e:
+            # Dialect gap sqlglot did not catch: remember it and let Snowflake answer
+            self._translated[canonicalize_sql(sql)] = None
+            self.errors += 1
+            raise ReplicaMiss(str(e))
+        self.hits += 1
+        return columns, data, truncated, int((time.time() - start) * 1000)
+
+    @staticmethod
+    def _snowflake_name(name: str, sql: str) -> str:
+        """Snowflake upper-cases unquoted identifiers in result columns; DuckDB keeps them as written."""
+        return name if f'"{name}"' in sql else name.upper()
+
+    def stats(self):
+        routed = self.hits + self.fallbacks + self.errors
+        return {
+            "tables": {t: self._versions.get(t) for t in sorted(self.tables)},
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / routed, 4) if routed else 0.0,
+            "sqlglot": SQLGLOT_AVAILABLE,
+        }
+
+
+def create_replica(table_version=None):
+    """The configured replica, or None when DuckDB is missing or REPLICA_TABLES is empty."""
+    tables = os.getenv("REPLICA_TABLES", "STORES,PRODUCTS,PRODUCT_PRICES").split(",")
+    if not DUCKDB_AVAILABLE or not any(t.strip() for t in tables):
+        return None
+    return DuckDBReplica(
+        tables,
+        max_rows=int(os.getenv("REPLICA_MAX_ROWS", "100000")),
+        table_version=table_version,
+    )
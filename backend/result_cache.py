@@ -0,0 +1,269 @@
+import hashlib
+import os
+import pickle
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    SQLGLOT_AVAILABLE = True
+except ImportError:
+    SQLGLOT_AVAILABLE = False
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_QUOTED_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_WS_RE = re.compile(r"\s+")
+_NAME = r"(?:\"?[a-z0-9_$]+\"?\.){0,2}\"?[a-z0-9_$]+\"?"
+_ALIAS = (r"(?:\s+(?:as\s+)?(?!(?:where|join|inner|left|right|full|outer|cross|natural|lateral|on|using|group|order"
+          r"|having|qualify|limit|union|except|intersect|minus|window)\b)[a-z_][a-z0-9_$]*)?")
+_TABLE_REF_RE = re.compile(rf"\b(?:from|join)\s+({_NAME}{_ALIAS}(?:\s*,\s*{_NAME}{_ALIAS})*)", re.IGNORECASE)
+_TABLE_LIST_RE = re.compile(rf"(?:^|,)\s*({_NAME})", re.IGNORECASE)
+_QUALIFIED_RE = re.compile(r"\bhackathon\s*\.\s*raw\s*\.\s*\"?([a-z0-9_$]+)", re.IGNORECASE)
+_VOLATILE_RE = re.compile(r"\b(?:current_(?:date|time|timestamp)|getdate|sysdate|localtimestamp|random|uuid_string|seq[1248]|result_scan)\b")
+
+
+def canonicalize_sql(sql: str) -> str:
+    """Normalize whitespace, comments and identifier case without touching literals."""
+    parts = _QUOTED_RE.split(sql)
+    out = []
+    for i, part in enumerate(parts):
+        if i % 2:  # quoted literal or identifier: keep verbatim
+            out.append(part)
+        else:
+            part = _COMMENT_RE.sub(" ", part)
+            out.append(_WS_RE.sub(" ", part).lower())
+    return "".join(out).strip().rstrip(";").strip()
+
+
+@lru_cache(maxsize=2048)
+def _parsed_tables(sql: str):
+    """Base tables in the sqlglot parse of `sql` (CTE names excluded), or None when it cannot parse."""
+    try:
+        tree = sqlglot.parse_one(sql, read="snowflake")
+    except Exception:
+        return None
+    if tree is None:
+        return None
+    ctes = {cte.alias_or_name.upper() for cte in tree.find_all(exp.CTE)}
+    return frozenset(
+        t.name.upper() for t in tree.find_all(exp.Table)
+        if isinstance(t.this, exp.Identifier) and t.name and (t.db or t.name.upper() not in ctes)
+    )
+
+
+def _regex_tables(sql: str) -> set[str]:
+    canonical = canonicalize_sql(sql)
+    tables = {m.group(1).upper() for m in _QUALIFIED_RE.finditer(canonical)}
+    for m in _TABLE_REF_RE.finditer(canonical):
+        for ref in _TABLE_LIST_RE.finditer(m.group(1)):  # every table of a comma join
+            name = ref.group(1).split(".")[-1].strip('"')
+            if name:
+                tables.add(name.upper())
+    return tables
+
+
+def referenced_tables(sql: str) -> set[str]:
+    """Set of unqualified, upper-cased table names a query reads (sqlglot table walk, regex without it)."""
+    if SQLGLOT_AVAILABLE:
+        tables = _parsed_tables(sql)
+        if tables is not None:
+            return set(tables)
+    return _regex_tables(sql)
+
+
+def is_cacheable(sql: str) -> bool:
+    """Queries over volatile functions must always hit the warehouse."""
+    return not _VOLATILE_RE.search(canonicalize_sql(sql))
+
+
+class ResultCache:
+    """Query result cache keyed by canonical SQL.
+
+    Results are stored columnar and zlib-compressed so the memory budget is
+    accounted in real bytes. Each entry remembers the version of every table it
+    read; bumping a table version (the loader does this after write_pandas)
+    makes dependent entries stale. Entries evicted from memory are spilled to
+    `spill_dir` when configured.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=900.0, spill_dir=None,
+                 max_spill_bytes=512 * 1024 * 1024, table_version=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self._table_version = table_version or (lambda table: 0)
+        self._entries = OrderedDict()  # key -> (blob, created)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stale = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    # ---------- Encoding ----------
+    def versions(self, sql: str):
+        """Versions of the tables `sql` reads, or None when its result must not be cached.
+
+        Take this *before* running the query and hand it to put(): a load that
+        lands while the query runs then leaves the entry stale instead of
+        filing the pre-load result under the post-load version. SQL sqlglot
+        cannot parse is not cached, since its table list is only a guess.
+        """
+        if not is_cacheable(sql) or (SQLGLOT_AVAILABLE and _parsed_tables(sql) is None):
+            return None
+        return {t: self._table_version(t) for t in referenced_tables(sql)}
+
+    def _encode(self, result, versions):
+        columns = result["columns"]
+        payload = {"columns": columns, "rowcount": result["rowcount"], "versions": versions}
+        if "table" in result:
+            # Arrow results stay Arrow: IPC stream bytes, no Python row objects
+            import pyarrow as pa
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, result["table"].schema) as writer:
+                writer.write_table(result["table"])
+            payload["ipc"] = sink.getvalue().to_pybytes()
+        else:
+            payload["data"] = [list(col) for col in zip(*result["rows"])] if result["rows"] else [[] for _ in columns]
+        for extra in ("truncated", "query_id"):
+            if extra in result:
+                payload[extra] = result[extra]
+        return zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+    def _decode(self, blob):
+        payload = pickle.loads(zlib.decompress(blob))
+        for table, version in payload.pop("versions").items():
+            if self._table_version(table) != version:
+                return None
+        if "ipc" in payload:
+            import pyarrow as pa
+            payload["table"] = pa.ipc.open_stream(payload.pop("ipc")).read_all()
+            return payload
+        data = payload.pop("data")
+        payload["rows"] = [list(row) for row in zip(*data)] if data and data[0] else []
+        return payload
+
+    # ---------- Disk Spill ----------
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".bin")
+
+    def _spill(self, key, blob):
+        try:
+            with open(self._spill_path(key), "wb") as f:
+                f.write(blob)
+            self._trim_spill()
+        except OSError:
+            pass
+
+    def _trim_spill(self):
+        files = [os.path.join(self.spill_dir, f) for f in os.listdir(self.spill_dir) if f.endswith(".bin")]
+        files.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in files)
+        while files and total > self.max_spill_bytes:
+            oldest = files.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+
+    def _load_spilled(self, key):
+        path = self._spill_path(key)
+        try:
+            written = os.path.getmtime(path)
+            if self.ttl is not None and time.time() - written > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                blob = f.read()
+            os.remove(path)
+            return blob, written
+        except OSError:
+            return None
+
+    # ---------- Memory LRU ----------
+    def _insert_locked(self, key, blob, created):
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key)[0])
+        if len(blob) > self.max_bytes:
+            return
+        self._entries[key] = (blob, created)
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes:
+            old_key, (old_blob, _) = self._entries.popitem(last=False)
+            self._bytes -= len(old_blob)
+            if self.spill_dir:
+                self._spill(old_key, old_blob)
+
+    # ---------- Public API ----------
+    @staticmethod
+    def _key(sql: str, kind: str) -> str:
+        key = canonicalize_sql(sql)
+        return key if kind == "rows" else f"{kind}:{key}"
+
+    def get(self, sql: str, kind: str = "rows"):
+        """Cached result for `sql`; kind="arrow" entries hold a pyarrow Table under "table"."""
+        if not is_cacheable(sql):
+            return None
+        key = self._key(sql, kind)
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            from_disk = False
+            if item is not None and self.ttl is not None and now - item[1] > self.ttl:
+                self._bytes -= len(self._entries.pop(key)[0])
+                item = None
+            if item is None and self.spill_dir:
+                item = self._load_spilled(key)
+                from_disk = item is not None
+            if item is None:
+                self.misses += 1
+                return None
+            result = self._decode(item[0])
+            if result is None:
+                if not from_disk:
+                    self._bytes -= len(self._entries.pop(key)[0])
+                self.stale += 1
+                self.misses += 1
+                return None
+            if from_disk:
+                self.disk_hits += 1
+                self._insert_locked(key, item[0], item[1])
+            else:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, sql: str, result: dict, kind: str = "rows", versions=None):
+        """Cache `result` under the table `versions` read before it ran (see versions())."""
+        if versions is None:
+            return
+        key = self._key(sql, kind)
+        blob = self._encode(result, versions)
+        with self._lock:
+            self._insert_locked(key, blob, time.time())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "spill_dir": self.spill_dir,
+            }
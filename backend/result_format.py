@@ -0,0 +1,162 @@
+import io
+import json
+import os
+import sys
+from datetime import date, datetime
+
+from pydantic_core import to_json
+
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+ARROW_STREAM_MIME = "application/vnd.apache.arrow.stream"
+RESULT_FORMATS = ("rows", "columnar", "arrow")
+# IPC body compression: "zstd", "lz4" or "none" (for readers without codec support, e.g. arrow-js)
+ARROW_COMPRESSION = os.getenv("RESULT_ARROW_COMPRESSION", "zstd")
+
+
+def _ipc_options():
+    codec = None if ARROW_COMPRESSION in ("", "none") else ARROW_COMPRESSION
+    return pa.ipc.IpcWriteOptions(compression=codec)
+
+
+# ---------- Negotiation ----------
+def negotiate_format(accept: str = None, requested: str = None) -> str:
+    """Pick "rows", "columnar" or "arrow" from an explicit format or the Accept header.
+
+    Accept: application/vnd.apache.arrow.stream -> Arrow IPC stream
+    Accept: application/json; layout=columnar   -> {"data": {col: [values]}}
+    Anything else keeps the row-oriented JSON. Without pyarrow, everything is rows.
+    """
+    fmt = (requested or "").lower()
+    if fmt not in RESULT_FORMATS:
+        accept = (accept or "").lower()
+        if ARROW_STREAM_MIME in accept:
+            fmt = "arrow"
+        elif "layout=columnar" in accept.replace(" ", ""):
+            fmt = "columnar"
+        else:
+            fmt = "rows"
+    return fmt if PYARROW_AVAILABLE else "rows"
+
+
+# ---------- Fetching ----------
+def _arrow_unsupported(e: Exception) -> bool:
+    """The cursor can't fetch Arrow (a non-Snowflake cursor, or a connector without its Arrow extras)."""
+    if isinstance(e, (AttributeError, NotImplementedError)):
+        return True
+    # Looked up, not imported: only a loaded connector can have raised its own error
+    errors = sys.modules.get("snowflake.connector.errors")
+    return errors is not None and isinstance(e, errors.NotSupportedError)
+
+
+def _table_from_rows(columns, rows):
+    data = [list(col) for col in zip(*rows)] if rows else [[] for _ in columns]
+    return pa.table({name: pa.array(values) for name, values in zip(columns, data)})
+
+
+def fetch_arrow(cur, limit: int = None):
+    """Read an executed cursor as one pyarrow Table: (table, truncated).
+
+    Uses the connector's fetch_arrow_batches, so values never become Python
+    rows. Stops once `limit` + 1 rows are buffered; cursors without Arrow
+    support (or non-Arrow results) fall back to fetchmany.
+    """
+    columns = [c[0] for c in cur.description] if cur.description else []
+    batches, buffered = [], 0
+    try:
+        for batch in cur.fetch_arrow_batches():
+            batches.append(batch)
+            buffered += batch.num_rows
+            if limit is not None and buffered > limit:
+                break
+    except Exception as e:
+        if not _arrow_unsupported(e):
+            raise
+        rows = cur.fetchmany(limit + 1) if limit is not None else cur.fetchall()
+        batches = [_table_from_rows(columns, rows)]
+    table = pa.concat_tables(batches) if batches else _table_from_rows(columns, [])
+    truncated = limit is not None and table.num_rows > limit
+    if truncated:
+        table = table.slice(0, limit)
+    return table, truncated
+
+
+def iter_arrow_batches(cur):
+    """Yield an executed cursor's result as pyarrow Tables without buffering all of it."""
+    columns = [c[0] for c in cur.description] if cur.description else []
+    try:
+        batches = cur.fetch_arrow_batches()
+    except Exception as e:
+        if not _arrow_unsupported(e):
+            raise
+        batches = None
+    if batches is not None:
+        yield from batches
+    else:
+        while True:
+            rows = cur.fetchmany(10000)
+            if not rows:
+                break
+            yield _table_from_rows(columns, rows)
+
+
+# ---------- Encoding ----------
+def _jsonable_column(col) -> list:
+    """One Arrow column as JSON-ready values, matching AskResponse rows (ISO dates, Decimals as str)."""
+    t = col.type
+    if pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_boolean(t):
+        return col.to_pylist() if col.null_count else col.to_numpy().tolist()
+    values = col.to_pylist()
+    if pa.types.is_temporal(t):
+        return [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    if pa.types.is_decimal(t):
+        return [None if v is None else str(v) for v in values]
+    return values
+
+
+def table_rows(table) -> list:
+    """Row-oriented values for the chart/summary code paths that still need them."""
+    columns = [_jsonable_column(col) for col in table.columns]
+    return [list(row) for row in zip(*columns)]
+
+
+def columnar_data(table) -> dict:
+    return {name: _jsonable_column(col) for name, col in zip(table.column_names, table.columns)}
+
+
+def columnar_json(body: dict, table) -> bytes:
+    """`body` plus {"data": {col: [values]}} as compact JSON, encoded by pydantic-core (Rust)."""
+    return to_json({**body, "data": columnar_data(table)}, fallback=str)
+
+
+def arrow_ipc_bytes(table, metadata: dict = None) -> bytes:
+    """Serialize a Table as an Arrow IPC stream; `metadata` rides along JSON-encoded in the schema."""
+    if metadata is not None:
+        table = table.replace_schema_metadata({"response": json.dumps(metadata, default=str)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema, options=_ipc_options()) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def arrow_ipc_stream(batches, columns=()):
+    """Encode Tables as one Arrow IPC stream incrementally, yielding bytes per batch."""
+    buf = io.BytesIO()
+    writer = schema = None
+    for table in batches:
+        if writer is None:
+            schema = table.schema
+            writer = pa.ipc.new_stream(buf, schema, options=_ipc_options())
+        # Fallback batches infer types per batch (e.g. all-null -> null): align to the first
+        writer.write_table(table if table.schema.equals(schema) else table.cast(schema))
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if writer is None:  # empty result: still a valid stream with the column names
+        writer = pa.ipc.new_stream(buf, _table_from_rows(columns, []).schema, options=_ipc_options())
+    writer.close()
+    yield buf.getvalue()
@@ -0,0 +1,330 @@
+import hashlib
+import re
+import threading
+from collections import deque
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+_ENCODING = None
+
+_ROWS_HEADER = "Number of rows:"
+_SCHEMA_HEADER = "Schema:"
+_JOINS_HEADER = "Table Relationships / Joins"
+_GUIDELINES_HEADER = "Enhanced Visualization Guidelines"
+_JOIN_RE = re.compile(r"\b([A-Z][A-Z0-9_]*)\.([A-Z][A-Z0-9_]*)\s*=\s*([A-Z][A-Z0-9_]*)\.([A-Z][A-Z0-9_]*)\b")
+_TABLE_COL_RE = re.compile(r"\b([A-Z][A-Z0-9_]*)\.[A-Z][A-Z0-9_]*\b")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Business words that never appear in a column name, mapped to the tables that answer them
+SYNONYMS = {
+    "sale": ("TRANSACTIONS", "TRANSACTION_LINES"),
+    "revenue": ("TRANSACTIONS", "TRANSACTION_LINES"),
+    "order": ("TRANSACTIONS",),
+    "purchase": ("TRANSACTIONS",),
+    "spend": ("TRANSACTIONS",),
+    "basket": ("TRANSACTION_LINES",),
+    "unit": ("TRANSACTION_LINES",),
+    "sold": ("TRANSACTION_LINES",),
+    "item": ("TRANSACTION_LINES", "PRODUCTS"),
+    "vip": ("DIM_CUSTOMERS",),
+    "customer": ("DIM_CUSTOMERS",),
+    "segment": ("DIM_CUSTOMERS",),
+    "loyalty": ("LOYALTY_LEDGER",),
+    "point": ("LOYALTY_LEDGER",),
+    "redeem": ("LOYALTY_LEDGER",),
+    "redemption": ("LOYALTY_LEDGER",),
+    "promo": ("LOYALTY_LEDGER",),
+    "refund": ("FINANCE_ENTRIES", "TRANSACTIONS"),
+    "finance": ("FINANCE_ENTRIES",),
+    "payment": ("FINANCE_ENTRIES",),
+    "fee": ("FINANCE_ENTRIES",),
+    "price": ("PRODUCT_PRICES",),
+    "pricing": ("PRODUCT_PRICES",),
+    "currency": ("PRODUCT_PRICES",),
+    "category": ("PRODUCTS",),
+    "sku": ("PRODUCTS",),
+    "region": ("STORES",),
+    "geo": ("STORES",),
+    "north": ("STORES",),
+    "address": ("CUSTOMER_ADDRESSES",),
+    "postal": ("CUSTOMER_ADDRESSES",),
+    "zip": ("CUSTOMER_ADDRESSES",),
+    "moved": ("CUSTOMER_ADDRESSES",),
+}
+# Words every table shares: they say nothing about which table is meant
+STOPWORDS = {"id", "is", "date", "the", "of", "by", "and", "a", "an", "in", "to", "for", "per", "what",
+             "which", "how", "many", "much", "show", "me", "top", "list", "each", "with", "all", "total"}
+
+
+def _encoding():
+    """tiktoken's o200k_base, loaded on the first count rather than at import (it may be downloaded)."""
+    global _ENCODING, TIKTOKEN_AVAILABLE
+    if _ENCODING is None and TIKTOKEN_AVAILABLE:
+        try:
+            _ENCODING = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            TIKTOKEN_AVAILABLE = False
+    return _ENCODING
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens for `text`: exact with tiktoken, else the ~4 chars/token rule of thumb."""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(1, len(text) // 4)
+
+
+def _stem(word: str) -> str:
+    """Plural -> singular, just enough to match question words to column names."""
+    if len(word) <= 3 or word.endswith("ss"):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("sses"):
+        return word[:-2]
+    return word[:-1] if word.endswith("s") else word
+
+
+_SYNONYMS = {_stem(word): tables for word, tables in SYNONYMS.items()}
+
+
+def _words(text: str) -> set:
+    return {_stem(w) for w in _WORD_RE.findall(text.lower())} - STOPWORDS
+
+
+class SchemaIndex:
+    """metadata.txt split into a static prompt prefix and per-table schema blocks.
+
+    The rules, domain knowledge and guidelines never change between questions,
+    so they form one static prefix that the LLM provider can cache. Per
+    question only the top-k tables by keyword overlap (within `min_score_ratio`
+    of the best match) are added, plus any
+    tables needed to join them (shortest path over the documented
+    relationships). Questions that match no table get the full schema.
+    """
+
+    def __init__(self, text: str, top_k: int = 3, min_score_ratio: float = 0.4):
+        self.top_k = top_k
+        self.min_score_ratio = min_score_ratio
+        self.version = 0
+        self._lock = threading.Lock()
+        self.load(text)
+        self.requests = 0
+        self.full_tokens = 0  # what the whole metadata.txt would have cost
+        self.sent_tokens = 0  # estimated prefix + schema actually sent
+        self.usage_tokens = 0  # prompt_tokens reported by the API
+        self.cached_tokens = 0  # of which served from the provider's prompt cache
+        self.llm_ms = 0
+
+    # ---------- Parsing ----------
+    def load(self, text: str):
+        """(Re)build the index from metadata.txt's text."""
+        head, _, rest = text.partition(_ROWS_HEADER)
+        rows_text, _, rest = rest.partition(_SCHEMA_HEADER)
+        schema_text, _, rest = rest.partition(_JOINS_HEADER)
+        joins_text, _, guidelines = rest.partition(_GUIDELINES_HEADER)
+
+        row_counts = {}
+        for line in rows_text.splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1].isdigit():
+                row_counts[parts[0]] = int(parts[1])
+
+        columns, current = {}, None
+        for line in schema_text.splitlines():
+            parts = line.split()
+            if len(parts) == 1 and parts[0].isupper() and not parts[0].startswith("-"):
+                current = parts[0]
+                columns[current] = []
+            elif len(parts) == 2 and current:
+                columns[current].append((parts[0], parts[1]))
+
+        edges, join_lines, notes = {}, {}, {}
+        for line in joins_text.splitlines():
+            line = line.strip()
+            m = _JOIN_RE.search(line)
+            if m:
+                a, b = m.group(1), m.group(3)
+                edges.setdefault(a, set()).add(b)
+                edges.setdefault(b, set()).add(a)
+                join_lines.setdefault(frozenset((a, b)), []).append(line.lstrip("- ").strip())
+            elif line.startswith("-"):
+                for table in set(_TABLE_COL_RE.findall(line)):
+                    notes.setdefault(table, []).append(line.lstrip("- ").strip())
+
+        prefix = head.rstrip()
+        guidelines = guidelines.strip(" -\n")
+        if guidelines:
+            prefix += f"\n\n{_GUIDELINES_HEADER}\n" + guidelines
+        with self._lock:
+            self.prefix = prefix
+            self.row_counts = row_counts
+            self.columns = columns
+            self.edges = edges
+            self.join_lines = join_lines
+            self.notes = notes
+            self.full_prompt_tokens = count_tokens(text)
+            self._build_vocabulary()
+            self.version += 1
+
+    def _build_vocabulary(self):
+        self.vocab = {}
+        for table, cols in self.columns.items():
+            words = {}
+            for w in _words(table.replace("_", " ")):
+                words[w] = 3.0  # table name
+            for col, _ in cols:
+                for w in _words(col.replace("_", " ")):
+                    words.setdefault(w, 1.0)
+            self.vocab[table] = words
+
+    # ---------- Refresh ----------
+    def refresh_from(self, conn, database: str = "HACKATHON", schema: str = "RAW") -> bool:
+        """Replace columns (and row counts) with INFORMATION_SCHEMA's view; returns True if anything changed."""
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                f"SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE FROM {database}.INFORMATION_SCHEMA.COLUMNS "
+                f"WHERE TABLE_SCHEMA = %s ORDER BY TABLE_NAME, ORDINAL_POSITION", (schema,))
+            column_rows = cur.fetchall()
+            cur.execute(
+                f"SELECT TABLE_NAME, ROW_COUNT FROM {database}.INFORMATION_SCHEMA.TABLES "
+                f"WHERE TABLE_SCHEMA = %s AND TABLE_TYPE = 'BASE TABLE'", (schema,))
+            count_rows = cur.fetchall()
+        finally:
+            cur.close()
+        columns = {}
+        for table, column, data_type in column_rows:
+            if "__STAGING" in table or "__DELTA" in table:
+                continue  # loader scratch tables
+            columns.setdefault(table, []).append((column, data_type))
+        row_counts = {t: int(n) for t, n in count_rows if t in columns and n is not None}
+        if not columns or (columns == self.columns and row_counts == self.row_counts):
+            return False
+        with self._lock:
+            self.row_counts = {**self.row_counts, **row_counts}
+            if columns != self.columns:
+                # Only a column change moves the version (and the NL->SQL cache key); row counts follow reloads
+                self.columns = columns
+                self._build_vocabulary()
+                self.version += 1
+        return True
+
+    # ---------- Retrieval ----------
+    def score(self, question: str) -> dict:
+        words = _words(question)
+        scores = {}
+        for table, vocab in self.vocab.items():
+            score = sum(weight for w, weight in vocab.items() if w in words)
+            if re.search(rf"\b{table}\b", question):
+                score += 5.0  # named explicitly, as in "rows in LOYALTY_LEDGER"
+            scores[table] = score
+        for w in words:
+            for table in _SYNONYMS.get(w, ()):
+                if table in scores:
+                    scores[table] += 2.0
+        return scores
+
+    def _join_path(self, start: str, goal: set) -> list:
+        """Shortest chain of tables from `start` to any table in `goal` over documented joins."""
+        queue, seen = deque([[start]]), {start}
+        while queue:
+            path = queue.popleft()
+            if path[-1] in goal:
+                return path
+            for nxt in sorted(self.edges.get(path[-1], ())):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    queue.append(path + [nxt])
+        return []
+
+    def select_tables(self, question: str) -> list:
+        """Top-k tables for a question plus the tables needed to join them; all tables if none match."""
+        with self._lock:
+            scores = self.score(question)
+            ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+            if not ranked or ranked[0][1] <= 0:
+                return sorted(self.columns)
+            # Weak matches (a shared CUSTOMER_ID column) don't ride along with a strong one,
+            # but a table the question names ("product") always stays in the running
+            words = _words(question)
+            named = {t for t, vocab in self.vocab.items() if any(vocab.get(w) == 3.0 for w in words)}
+            cutoff = ranked[0][1] * self.min_score_ratio
+            ranked = [t for t, s in ranked if s > 0 and (s >= cutoff or t in named)]
+            picked = ranked[: self.top_k]
+            connected = [picked[0]]
+            for table in picked[1:]:
+                path = self._join_path(table, set(connected))
+                for t in path or [table]:
+                    if t not in connected:
+                        connected.append(t)
+            return connected
+
+    # ---------- Prompt ----------
+    def schema_block(self, tables: list) -> str:
+        lines = ["Tables (row counts):"]
+        lines += [f"{t}\t{self.row_counts[t]}" for t in tables if t in self.row_counts]
+        lines.append("\nSchema:")
+        for t in tables:
+            lines.append(f"\n{t}")
+            lines += [f"{col}\t{dtype}" for col, dtype in self.columns.get(t, [])]
+        chosen = set(tables)
+        joins = [line for pair, pair_lines in self.join_lines.items() if pair <= chosen for line in pair_lines]
+        if joins:
+            lines.append("\nJoins:")
+            lines += [f"- {line}" for line in joins]
+        notes = sorted({note for t in tables for note in self.notes.get(t, [])})
+        if notes:
+            lines.append("\nNotes:")
+            lines += [f"- {note}" for note in notes]
+        return "\n".join(lines)
+
+    def build_messages(self, question: str, user_content: str) -> tuple[list, dict]:
+        """Chat messages (static prefix first, then the question's schema) and prompt stats."""
+        tables = self.select_tables(question)
+        schema = self.schema_block(tables)
+        messages = [
+            {"role": "system", "content": self.prefix},
+            {"role": "system", "content": schema},
+            {"role": "user", "content": user_content},
+        ]
+        stats = {
+            "tables": tables,
+            "prefix_tokens": count_tokens(self.prefix),
+            "schema_tokens": count_tokens(schema),
+        }
+        return messages, stats
+
+    def record(self, stats: dict, usage=None, elapsed_ms: int = 0):
+        """Account one LLM call built by build_messages (usage is the response's `usage`, if any)."""
+        self.requests += 1
+        self.full_tokens += self.full_prompt_tokens
+        self.sent_tokens += stats["prefix_tokens"] + stats["schema_tokens"]
+        self.llm_ms += elapsed_ms
+        if usage is not None:
+            self.usage_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            self.cached_tokens += getattr(details, "cached_tokens", 0) or 0
+
+    def stats(self):
+        n = self.requests or 1
+        return {
+            "tables": len(self.columns),
+            "version": self.version,
+            "requests": self.requests,
+            "avg_full_prompt_tokens": round(self.full_tokens / n, 1),
+            "avg_sent_prompt_tokens": round(self.sent_tokens / n, 1),
+            "avg_api_prompt_tokens": round(self.usage_tokens / n, 1),
+            "cached_token_ratio": round(self.cached_tokens / self.usage_tokens, 4) if self.usage_tokens else 0.0,
+            "avg_llm_ms": round(self.llm_ms / n, 1),
+            "tiktoken": TIKTOKEN_AVAILABLE,
+        }
+
+    def fingerprint(self) -> str:
+        """Identifies the index contents: part of the NL->SQL cache key."""
+        digest = hashlib.sha1(repr((self.prefix, sorted(self.columns.items()))).encode("utf-8")).hexdigest()[:8]
+        return f"{self.version}-{digest}"
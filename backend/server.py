@@ -1,48 +1,49 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile
+from fastapi import FastAPI, HTTPException, File, UploadFile, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from datetime import date, datetime
 from pathlib import Path
+from contextlib import contextmanager
 import traceback
+import logging
 import loader
 import re, time
-import snowflake.connector
-from snowflake.connector import DictCursor
+import shutil
+import uuid
+import threading
+import asyncio
 import os
 from dotenv import load_dotenv
 import json
+import hashlib
 import pandas as pd
 from typing import Optional, Dict, Any, List
 import numpy as np
+from lazy_imports import LazyImport, warm_up
 from loader import run_loader
-# ---- OpenAI ----
-from openai import OpenAI
-# ---- Chart Generation ----
-import matplotlib
-matplotlib.use('Agg') # Use non-interactive backend
-import matplotlib.pyplot as plt
-import seaborn as sns
+from pool import PoolTimeout, is_connection_error
+from replica import ReplicaMiss
+from sql_cache import SqlCache, normalize_question
+from singleflight import SingleFlight, CallerLeft
+from result_cache import ResultCache
+from query_ids import IssuedQueryIds
+from schema_index import SchemaIndex
+from sql_guard import create_sql_guard, SqlRejected, QueryTimeout, QueryCancelled
+from jobs import JobQueue, STATUSES as JOB_STATUSES
+import metrics
+from metrics import span
 import base64
 import io
-from matplotlib.figure import Figure
-# ---- Enhanced Visualization Libraries ----
-try:
-    import plotly.graph_objects as go
-    import plotly.express as px
-    from plotly.subplots import make_subplots
-    PLOTLY_AVAILABLE = True
-except ImportError:
-    PLOTLY_AVAILABLE = False
-    print("Plotly not available. Install with: pip install plotly kaleido")
-try:
-    import pandasai as pai
-    from pandasai import Agent
-    from pandasai_litellm.litellm import LiteLLM
-    PANDASAI_AVAILABLE = True
-except ImportError:
-    PANDASAI_AVAILABLE = False
-    print("PandasAI not available. Install with: pip install pandasai pandasai-litellm")
+from chart_cache import ChartCache, chart_key, CHART_MIME_TYPES
+from result_format import (ARROW_STREAM_MIME, negotiate_format, fetch_arrow, iter_arrow_batches,
+                           table_rows, columnar_json, arrow_ipc_bytes, arrow_ipc_stream)
+from chart_render import ChartRenderService, ChartQueueFull, detect_optimal_chart_type, create_enhanced_matplotlib_chart
+# Debug chatter (cache hits, chart steps) is only formatted and written at LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("server")
 # Load environment variables
 load_dotenv()
 # ---------- Config ----------
@@ -55,9 +56,23 @@ SF_DATABASE = "HACKATHON"
 SF_SCHEMA = "RAW"
 OPENAI_API_KEY = "*********************************************"
 OPENAI_MODEL = "gpt-4.1"
-if PANDASAI_AVAILABLE and OPENAI_API_KEY and "****" not in OPENAI_API_KEY:
-    llm = LiteLLM(model="gpt-4", api_key=OPENAI_API_KEY)
-    pai.config.set({"llm": llm})
+# ---------- Lazy Engines ----------
+# Heavy SDKs load on first use or in the start-up warm-up, not at import: workers start serving sooner
+def _load_plotly():
+    import plotly.express as px
+    return px
+def _load_pandasai():
+    import pandasai as pai
+    from pandasai import Agent
+    from pandasai_litellm.litellm import LiteLLM
+    if OPENAI_API_KEY and "****" not in OPENAI_API_KEY:
+        pai.config.set({"llm": LiteLLM(model="gpt-4", api_key=OPENAI_API_KEY)})
+    return Agent
+openai_sdk = LazyImport("openai", "openai", "pip install openai")
+snowflake_connector = LazyImport("snowflake", "snowflake.connector", "pip install snowflake-connector-python")
+plotly_engine = LazyImport("plotly", _load_plotly, "pip install plotly kaleido", modules=("plotly",))
+pandasai_engine = LazyImport("pandasai", _load_pandasai, "pip install pandasai pandasai-litellm",
+                             modules=("pandasai", "pandasai_litellm"))
 # ---------- App ----------
 app = FastAPI(title="Enhanced Data Analytics API", version="3.0.0")
 app.add_middleware(
@@ -70,19 +85,29 @@ app.add_middleware(
 # ---------- Models ----------
 class ApiInput(BaseModel):
     apis: list[str]
+    # {"TABLE": {"key": ["ID"], "watermark": "UPDATED_DATE", "since_param": "since"}} -> MERGE only new rows
+    incremental: Optional[Dict[str, Dict[str, Any]]] = None
 class AskRequest(BaseModel):
     question: str = Field(..., min_length=1)
     include_summary: bool = Field(default=True)
     include_chart: bool = Field(default=False)
     chart_type: Optional[str] = Field(default="auto")
     chart_engine: Optional[str] = Field(default="matplotlib")
+    chart_size: Optional[str] = Field(default="full")  # "full" or "preview"
+    chart_format: Optional[str] = Field(default="png")  # "png", "webp" or "svg"
+    inline_chart: bool = Field(default=False)  # also return base64 in data_encoded
+    result_format: Optional[str] = Field(default=None)  # "rows", "columnar" or "arrow"; else from Accept
+    include_timings: bool = Field(default=False)  # per-stage ms breakdown in `timings`
 class ChartConfig(BaseModel):
     type: str
     title: str
     x_label: Optional[str] = None
     y_label: Optional[str] = None
-    data_encoded: str
+    data_encoded: Optional[str] = None
     engine: Optional[str] = None
+    format: Optional[str] = None
+    hash: Optional[str] = None
+    url: Optional[str] = None
 class AskResponse(BaseModel):
     question: str
     sql: str
@@ -90,42 +115,145 @@ class AskResponse(BaseModel):
     rows: list[list]
     rowcount: int
     elapsed_ms: int
+    cached: bool = False
+    truncated: bool = False
+    query_id: Optional[str] = None
+    format: str = "rows"
+    data: Optional[Dict[str, list]] = None  # columnar layout: {column: [values]}
     response_text: str
     ai_summary: Optional[str] = None
     chart: Optional[ChartConfig] = None
     insights: Optional[Dict[str, Any]] = None
     sql_explanation: Optional[str] = None
+    timings: Optional[Dict[str, float]] = None  # stage -> ms, with include_timings
+    coalesced: bool = False  # shared the answer of an identical request already in flight
+class ResultPage(BaseModel):
+    query_id: str
+    columns: list[str]
+    rows: list[list]
+    offset: int
+    rowcount: int
+    has_more: bool
 # ---------- Helper ----------
 def get_snowflake_connection():
+    """Borrow a connection from the shared pool; hand it back with release_snowflake_connection()."""
     try:
-        return snowflake.connector.connect(
-            user=SF_USER,
-            password=SF_PASSWORD,
-            account=SF_ACCOUNT,
-            role=SF_ROLE,
-            warehouse=SF_WAREHOUSE,
-            database=SF_DATABASE,
-            schema=SF_SCHEMA,
-            client_session_keep_alive=True,
-        )
+        with span("snowflake_connect"):
+            return loader.sf_pool.acquire()
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Snowflake pool exhausted: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Snowflake connection failed: {str(e)}")
-SYSTEM_PROMPT = Path("metadata.txt").read_text(encoding="utf-8")
+def release_snowflake_connection(conn, discard=False):
+    try:
+        loader.sf_pool.release(conn, discard=discard)
+    except Exception:
+        pass
+@contextmanager
+def snowflake_connection():
+    """A pooled connection for the block, like sf_pool.connection() (a connection-level
+    error discards it instead of handing it to the next borrower) with HTTP errors on acquire."""
+    conn = get_snowflake_connection()
+    try:
+        yield conn
+    except BaseException as e:
+        release_snowflake_connection(conn, discard=is_connection_error(e))
+        raise
+    else:
+        release_snowflake_connection(conn)
+METADATA_PATH = Path("metadata.txt")
+# Read (and indexed) by the first get_system_prompt(), at warm-up or on the first question
+SYSTEM_PROMPT = None
+_system_prompt_mtime = None
+_system_prompt_hash = None
+# Send only the tables a question needs (plus the static rules prefix) instead of all of metadata.txt
+PROMPT_RETRIEVAL = os.getenv("PROMPT_RETRIEVAL", "1") == "1"
+schema_index = SchemaIndex("", top_k=int(os.getenv("PROMPT_TOP_K", "3")))
+_schema_index_synced = None  # loader_versions() the index last read INFORMATION_SCHEMA at
+_schema_index_lock = threading.Lock()
+def get_system_prompt() -> str:
+    """Return metadata.txt, re-reading it when the file changes on disk."""
+    global SYSTEM_PROMPT, _system_prompt_mtime, _system_prompt_hash, _schema_index_synced
+    try:
+        mtime = METADATA_PATH.stat().st_mtime
+    except OSError:
+        if SYSTEM_PROMPT is None:
+            raise
+        return SYSTEM_PROMPT
+    if mtime != _system_prompt_mtime:
+        SYSTEM_PROMPT = METADATA_PATH.read_text(encoding="utf-8")
+        _system_prompt_mtime = mtime
+        _system_prompt_hash = hashlib.sha1(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+        schema_index.load(SYSTEM_PROMPT)
+        _schema_index_synced = None
+    return SYSTEM_PROMPT
+def loader_versions() -> tuple:
+    """(schema version, data version): the index re-reads columns and row counts when either moves."""
+    return loader.schema_version(), loader.data_version()
+def refresh_schema_index():
+    """Bring the index's columns in line with HACKATHON.INFORMATION_SCHEMA (tables the loader added or altered)."""
+    global _schema_index_synced
+    if not _schema_index_lock.acquire(blocking=False):
+        return  # a refresh is already running
+    version = loader_versions()
+    try:
+        get_system_prompt()  # metadata.txt first, so the refresh overlays it rather than being replaced by it
+        with loader.sf_pool.connection() as conn:
+            if schema_index.refresh_from(conn, SF_DATABASE, SF_SCHEMA):
+                logger.info("[Schema Index] refreshed: %d tables", len(schema_index.columns))
+    except Exception as e:
+        # Keep serving metadata.txt's view; retry after the next schema change, not every request
+        logger.warning("[Schema Index] refresh failed: %s", e)
+    finally:
+        _schema_index_synced = version
+        _schema_index_lock.release()
+def maybe_refresh_schema_index():
+    """Refresh in the background after a loader run wrote a table; never blocks a request."""
+    if PROMPT_RETRIEVAL and _schema_index_synced != loader_versions() and not _schema_index_lock.locked():
+        threading.Thread(target=refresh_schema_index, name="schema-index-refresh", daemon=True).start()
+def sql_cache_fingerprint() -> str:
+    """Identifies the prompt + schema a cached SQL answer was generated against."""
+    get_system_prompt()
+    fingerprint = f"{_system_prompt_hash}:{loader.schema_version()}"
+    return f"{fingerprint}:{schema_index.fingerprint()}" if PROMPT_RETRIEVAL else fingerprint
+sql_cache = SqlCache(
+    max_entries=int(os.getenv("SQL_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("SQL_CACHE_TTL", "3600")),
+    similarity_threshold=float(os.getenv("SQL_CACHE_SIMILARITY", "0.92")),
+)
 SUMMARY_PROMPT = """You are a data analyst. Analyze the following query results and provide a concise, insightful summary."""
 # ---------- AI Logic ----------
 def generate_sql(question: str) -> tuple[str, Optional[str]]:
     if not OPENAI_API_KEY or "****" in OPENAI_API_KEY:
         raise HTTPException(status_code=500, detail="OpenAI API key not configured")
+    fingerprint = sql_cache_fingerprint()
+    cached = sql_cache.get(question, fingerprint)
+    if cached:
+        sql_only, explanation, tier = cached
+        logger.debug("[SQL Cache] %s hit for q='%s'", tier, question)
+        return sql_only, explanation
+    maybe_refresh_schema_index()
+    user_content = f"Question:\n{question}\n\nSQL:\n<your SQL>\n\nEXPLANATION:\n<your explanation>"
+    if PROMPT_RETRIEVAL:
+        messages, prompt_stats = schema_index.build_messages(question, user_content)
+    else:
+        messages = [
+            {"role": "system", "content": get_system_prompt()},
+            {"role": "user", "content": user_content}
+        ]
+        prompt_stats = {"tables": [], "prefix_tokens": schema_index.full_prompt_tokens, "schema_tokens": 0}
     try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": f"Question:\n{question}\n\nSQL:\n<your SQL>\n\nEXPLANATION:\n<your explanation>"}
-            ],
-            temperature=0
-        )
+        client = get_openai_client()
+        start = time.time()
+        with span("llm_sql"):
+            response = client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                temperature=0
+            )
+        schema_index.record(prompt_stats, getattr(response, "usage", None), int((time.time() - start) * 1000))
+        logger.debug("[Prompt] tables=%s ~%d tokens", prompt_stats["tables"],
+                     prompt_stats["prefix_tokens"] + prompt_stats["schema_tokens"])
         text = response.choices[0].message.content.strip()
         text = text.replace("```sql", "").replace("```", "").strip()
         sql_match = re.search(r"SQL:\s*(select.+?)(?=EXPLANATION:|$)", text, re.IGNORECASE | re.DOTALL)
@@ -134,98 +262,185 @@ def generate_sql(question: str) -> tuple[str, Optional[str]]:
             raise HTTPException(status_code=400, detail="No valid SQL found in response")
         sql_only = sql_match.group(1).strip()
         explanation = explanation_match.group(1).strip() if explanation_match else None
-        if not sql_only.lower().startswith("select"):
-            raise HTTPException(status_code=400, detail="Generated SQL is not a SELECT statement")
-        return sql_only, explanation
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
-def generate_ai_summary(question: str, columns: List[str], rows: List[List], sql: str) -> str:
+    try:
+        # Cached as guarded, so repeated questions skip the parse
+        sql_only = sql_guard.check(sql_only)
+    except SqlRejected as e:
+        raise HTTPException(status_code=400, detail=f"Generated SQL rejected: {e}")
+    sql_cache.put(question, fingerprint, sql_only, explanation)
+    return sql_only, explanation
+_openai_client = None
+_async_openai_client = None
+def get_openai_client():
+    """One shared client for SQL generation; the SDK is imported on first use."""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = openai_sdk.require().OpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
+def get_async_openai_client():
+    """One shared async client so summary calls reuse its HTTP connection pool."""
+    global _async_openai_client
+    if _async_openai_client is None:
+        _async_openai_client = openai_sdk.require().AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return _async_openai_client
+def summary_messages(columns: List[str], rows: List[List]) -> list:
+    df = pd.DataFrame(rows[:5], columns=columns)
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"Data:\n{df.head().to_dict()}"}
+    ]
+async def generate_ai_summary(question: str, columns: List[str], rows: List[List], sql: str) -> str:
     if not OPENAI_API_KEY or "****" in OPENAI_API_KEY:
         return "AI summary not available"
     try:
-        df = pd.DataFrame(rows, columns=columns)
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        response = client.chat.completions.create(
+        client = get_async_openai_client()
+        with span("summary"):
+            response = await client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=summary_messages(columns, rows),
+                temperature=0.3,
+                max_tokens=300
+            )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        return f"Summary generation failed: {str(e)}"
+async def stream_ai_summary(columns: List[str], rows: List[List]):
+    """generate_ai_summary, yielding the text piece by piece as OpenAI streams it."""
+    if not OPENAI_API_KEY or "****" in OPENAI_API_KEY:
+        yield "AI summary not available"
+        return
+    start = time.perf_counter()
+    try:
+        stream = await get_async_openai_client().chat.completions.create(
             model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": SUMMARY_PROMPT},
-                {"role": "user", "content": f"Data:\n{df.head().to_dict()}"}
-            ],
+            messages=summary_messages(columns, rows),
             temperature=0.3,
-            max_tokens=300
+            max_tokens=300,
+            stream=True
         )
-        return response.choices[0].message.content.strip()
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
     except Exception as e:
-        return f"Summary generation failed: {str(e)}"
+        yield f"Summary generation failed: {str(e)}"
+    finally:
+        metrics.record("summary", time.perf_counter() - start)
 # ---------- Query ----------
-def run_query(conn, sql: str):
+ASK_ROW_LIMIT = int(os.getenv("ASK_ROW_LIMIT", "1000"))
+RESULT_PAGE_MAX = int(os.getenv("RESULT_PAGE_MAX", "10000"))
+RESULT_STREAM_BATCH = int(os.getenv("RESULT_STREAM_BATCH", "10000"))
+QUERY_ID_RE = re.compile(r"^[0-9a-fA-F-]{36}$")
+# Only ids /ask handed out may be re-read with /results (RESULT_SCAN runs as the shared service role)
+issued_query_ids = IssuedQueryIds(
+    max_ids=int(os.getenv("RESULT_QUERY_IDS_MAX", "10000")),
+    ttl=float(os.getenv("RESULT_QUERY_IDS_TTL", str(24 * 3600))),
+)
+# Generated SQL: LIMIT/cross-join checks, EXPLAIN preflight over big tables, statement timeout
+sql_guard = create_sql_guard(lambda: schema_index.row_counts)
+
+def jsonable_rows(rows: list) -> list:
+    """Convert date/datetime values column by column; columns without them are left untouched."""
+    if not rows:
+        return []
+    columns = [list(col) for col in zip(*rows)]
+    for col in columns:
+        sample = next((v for v in col if v is not None), None)
+        if isinstance(sample, (date, datetime)):
+            col[:] = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in col]
+    return [list(row) for row in zip(*columns)]
+
+def execute_guarded(cur, sql: str, cancel: threading.Event = None):
+    """Preflight `sql` if it reads big tables, then run it under the statement timeout;
+    setting `cancel` stops it in Snowflake."""
+    if sql_guard.needs_preflight(sql):
+        with span("preflight"):
+            sql_guard.preflight(cur, sql)
+    with span("execute"):
+        sql_guard.execute(cur, sql, cancel)
+
+def run_query(conn, sql: str, limit: int = ASK_ROW_LIMIT, cancel: threading.Event = None):
+    """Run a query and return its first `limit` rows plus a handle (query_id) for the rest."""
     cur = conn.cursor()
     try:
         start = time.time()
-        cur.execute(sql)
-        rows = [
-            [v.isoformat() if isinstance(v, (date, datetime)) else v for v in row]
-            for row in cur.fetchmany(1000)
-        ]
+        execute_guarded(cur, sql, cancel)
+        # One extra row tells us whether the result was cut off
+        with span("fetch"):
+            fetched = cur.fetchmany(limit + 1)
+            truncated = len(fetched) > limit
+            rows = jsonable_rows(fetched[:limit])
         cols = [c[0] for c in cur.description] if cur.description else []
         elapsed = int((time.time() - start) * 1000)
-        return {"columns": cols, "rows": [list(row) for row in rows], "rowcount": len(rows), "elapsed_ms": elapsed}
+        return {"columns": cols, "rows": rows, "rowcount": len(rows), "elapsed_ms": elapsed,
+                "truncated": truncated, "query_id": getattr(cur, "sfqid", None)}
     finally:
         cur.close()
-# ---------- Chart Helpers ----------
-def detect_optimal_chart_type(df: pd.DataFrame, columns: List[str]) -> str:
-    """Enhanced chart type detection with better categorical data handling"""
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
-   
-    print(f"[Chart Debug] Numeric cols: {numeric_cols}, Categorical cols: {categorical_cols}")
-   
-    # Check for revenue share or percentage data - perfect for bar charts
-    if len(columns) >= 2:
-        col_names = [col.lower() for col in columns]
-        if any('revenue' in col or 'share' in col or 'pct' in col or 'percent' in col for col in col_names):
-            if any('category' in col or 'product' in col or 'type' in col for col in col_names):
-                print("[Chart Debug] Detected revenue/category data - using bar chart")
-                return "bar"
-   
-    # Check for frequency/distribution data
-    if len(columns) == 2:
-        col1_lower = columns[0].lower()
-        col2_lower = columns[1].lower()
-        if any(word in col2_lower for word in ['frequency', 'count', 'freq']):
-            return "bar"
-        if any(word in col1_lower for word in ['balance', 'points', 'score']) and 'frequency' in col2_lower:
-            return "bar"
-   
-    # Time series detection
-    for col in columns:
-        if any(k in col.lower() for k in ['date', 'time', 'year', 'month', 'day']):
-            return "line"
-   
-    # If we have one categorical column and one or more numeric columns -> bar chart
-    if len(categorical_cols) >= 1 and len(numeric_cols) >= 1:
-        print("[Chart Debug] Categorical + numeric data - using bar chart")
-        return "bar"
-   
-    # Distribution analysis
-    if len(numeric_cols) == 1 and len(categorical_cols) == 0:
-        return "histogram"
-   
-    # Multiple numerics - but be careful about what's actually categorical
-    if len(numeric_cols) >= 3:
-        return "heatmap"
-    if len(numeric_cols) == 2:
-        # Check if one of the "numeric" columns is actually categorical (like product IDs)
-        for col in columns:
-            if any(word in col.lower() for word in ['category', 'product', 'type', 'name']):
-                return "bar"
-        return "scatter"
-   
-    return "bar" # Safe default for most business data
+result_cache = ResultCache(
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("RESULT_CACHE_TTL", "900")),
+    spill_dir=os.getenv("RESULT_CACHE_SPILL_DIR") or None,
+    table_version=loader.table_version,
+)
+def run_query_arrow(conn, sql: str, limit: int = ASK_ROW_LIMIT, cancel: threading.Event = None):
+    """run_query, but the rows come back as a pyarrow Table under "table"."""
+    cur = conn.cursor()
+    try:
+        start = time.time()
+        execute_guarded(cur, sql, cancel)
+        with span("fetch"):
+            table, truncated = fetch_arrow(cur, limit)
+        elapsed = int((time.time() - start) * 1000)
+        return {"columns": table.column_names, "table": table, "rowcount": table.num_rows, "elapsed_ms": elapsed,
+                "truncated": truncated, "query_id": getattr(cur, "sfqid", None)}
+    finally:
+        cur.close()
+def run_query_replica(sql: str, arrow: bool = False, limit: int = ASK_ROW_LIMIT):
+    """Answer from the local DuckDB replica, or None when Snowflake has to run the query."""
+    if loader.replica is None:
+        return None
+    try:
+        columns, data, truncated, elapsed = loader.replica.execute(sql, limit, arrow)
+    except ReplicaMiss:
+        return None
+    logger.debug("[Replica] served in %d ms: %s", elapsed, sql[:80])
+    # No Snowflake query id: truncated replica results can't be paged with /results
+    result = {"columns": columns, "rowcount": len(data), "elapsed_ms": elapsed, "truncated": truncated, "query_id": None}
+    if arrow:
+        result["table"] = data
+    else:
+        result["rows"] = jsonable_rows(data)
+    return result
+def run_query_cached(sql: str, arrow: bool = False, cancel: threading.Event = None):
+    """Serve a SELECT from the result cache, then the local replica, borrowing a pooled
+    Snowflake connection only when neither can answer (`cancel` stops that query)."""
+    kind = "arrow" if arrow else "rows"
+    start = time.perf_counter()
+    cached = result_cache.get(sql, kind)
+    if cached is not None:
+        cached["elapsed_ms"] = int((time.perf_counter() - start) * 1000)
+        cached["cached"] = True
+        if cached.get("query_id"):
+            issued_query_ids.add(cached["query_id"])
+        return cached
+    result = run_query_replica(sql, arrow)
+    if result is not None:
+        result["cached"] = False
+        return result
+    versions = result_cache.versions(sql)  # before running: a load landing meanwhile leaves the entry stale
+    with snowflake_connection() as conn:
+        result = run_query_arrow(conn, sql, cancel=cancel) if arrow else run_query(conn, sql, cancel=cancel)
+    result_cache.put(sql, result, kind, versions)
+    if result.get("query_id"):
+        issued_query_ids.add(result["query_id"])  # the caller hands it to the client for /results
+    result["cached"] = False
+    return result
 # ---------- Chart Engines ----------
 def generate_pandasai_chart(columns, rows, question):
-    if not PANDASAI_AVAILABLE or not rows or not columns:
+    if not rows or not columns or not pandasai_engine.available:
         return None
+    Agent = pandasai_engine.get()
     try:
         df = pd.DataFrame(rows, columns=columns)
         os.makedirs("temp_charts", exist_ok=True)
@@ -239,11 +454,12 @@ def generate_pandasai_chart(columns, rows, question):
                 b64 = base64.b64encode(f.read()).decode()
             return ChartConfig(type="pandasai_smart", title=question, data_encoded=b64, engine="pandasai")
     except Exception as e:
-        print(f"PandasAI error: {e}")
+        logger.warning("PandasAI error: %s", e)
         return None
 def create_plotly_chart(columns, rows, chart_type, question):
-    if not PLOTLY_AVAILABLE or not rows or not columns:
+    if not rows or not columns or not plotly_engine.available:
         return None
+    px = plotly_engine.get()
     try:
         df = pd.DataFrame(rows, columns=columns)
         if chart_type == "auto":
@@ -261,198 +477,83 @@ def create_plotly_chart(columns, rows, chart_type, question):
             b64 = base64.b64encode(img).decode()
             return ChartConfig(type=f"plotly_{chart_type}", title=question, data_encoded=b64, engine="plotly")
     except Exception as e:
-        print(f"Plotly error: {e}")
-        return None
-def create_enhanced_matplotlib_chart(columns, rows, chart_type, question):
-    """Improved matplotlib chart generation with better formatting"""
-    if not rows or not columns:
-        print("[Chart Debug] No data provided")
-        return None
-  
-    try:
-        df = pd.DataFrame(rows, columns=columns)
-        print(f"[Chart Debug] DataFrame shape: {df.shape}, columns: {columns}")
-        
-        if chart_type == "auto":
-            chart_type = detect_optimal_chart_type(df, columns)
-            print(f"[Chart Debug] Auto-detected chart type: {chart_type}")
-      
-        # IMPROVED: Larger figure size and better DPI
-        plt.style.use('default')
-        fig, ax = plt.subplots(figsize=(16, 10))  # Increased from (12, 8)
-        fig.patch.set_facecolor('white')
-      
-        success = False
-      
-        if chart_type == "bar" and len(columns) >= 2:
-            try:
-                # Find categorical and numeric columns
-                categorical_col = columns[0]
-                numeric_col = columns[1]
-                
-                for col in columns:
-                    if df[col].dtype == 'object' or any(word in col.lower() for word in ['category', 'product', 'type', 'name', 'country']):
-                        categorical_col = col
-                        break
-               
-                for col in columns:
-                    if pd.api.types.is_numeric_dtype(df[col]) and col != categorical_col:
-                        numeric_col = col
-                        break
-               
-                categories = df[categorical_col].astype(str)
-                values = pd.to_numeric(df[numeric_col], errors='coerce')
-                
-                # Remove NaN values
-                mask = ~values.isna()
-                categories = categories[mask]
-                values = values[mask]
-                
-                # IMPROVED: Sort by values for better visualization
-                sorted_data = sorted(zip(categories, values), key=lambda x: x[1], reverse=True)
-                categories, values = zip(*sorted_data)
-                
-                # IMPROVED: Limit to top N categories if too many
-                if len(categories) > 20:
-                    categories = categories[:20]
-                    values = values[:20]
-                    print(f"[Chart Debug] Limited to top 20 categories")
-                
-                # Create bar chart with better spacing
-                x_positions = range(len(categories))
-                bars = ax.bar(x_positions, values, 
-                             color='steelblue', alpha=0.8,
-                             edgecolor='navy', linewidth=0.8,
-                             width=0.7)  # Slightly thinner bars
-               
-                # IMPROVED: Better axis formatting
-                ax.set_xlabel(categorical_col, fontsize=14, fontweight='bold', labelpad=10)
-                ax.set_ylabel(numeric_col, fontsize=14, fontweight='bold', labelpad=10)
-                ax.set_title(f"{numeric_col} by {categorical_col}", 
-                           fontsize=18, fontweight='bold', pad=25)
-               
-                # IMPROVED: Smart x-axis label rotation
-                ax.set_xticks(x_positions)
-                if len(categories) > 10 or max(len(str(cat)) for cat in categories) > 12:
-                    ax.set_xticklabels(categories, rotation=45, ha='right', fontsize=11)
-                    # Add more bottom margin for rotated labels
-                    plt.subplots_adjust(bottom=0.15)
-                else:
-                    ax.set_xticklabels(categories, fontsize=11)
-               
-                # IMPROVED: Better value labels on bars
-                max_val = max(values)
-                for i, (pos, val) in enumerate(zip(x_positions, values)):
-                    # Format large numbers
-                    if val >= 1_000_000:
-                        label = f"${val/1_000_000:.1f}M"
-                    elif val >= 1_000:
-                        label = f"${val/1_000:.0f}K"
-                    elif val >= 1:
-                        label = f"${val:,.0f}" if val > 100 else f"${val:.1f}"
-                    else:
-                        label = f"${val:.2f}"
-                    
-                    # Position labels better
-                    y_pos = val + max_val * 0.01
-                    ax.text(pos, y_pos, label, 
-                           ha='center', va='bottom', 
-                           fontweight='bold', fontsize=10,
-                           rotation=0 if len(str(label)) < 8 else 0)
-               
-                # IMPROVED: Better grid and styling
-                ax.grid(True, alpha=0.3, axis='y', linestyle='--')
-                ax.set_axisbelow(True)
-                
-                # IMPROVED: Y-axis formatting
-                if max(values) >= 1_000_000:
-                    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x/1_000_000:.0f}M'))
-                elif max(values) >= 1_000:
-                    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x/1_000:.0f}K'))
-                
-                # IMPROVED: Better margins and spacing
-                ax.margins(x=0.01, y=0.05)  # Small margins
-                
-                # Style improvements
-                ax.spines['top'].set_visible(False)
-                ax.spines['right'].set_visible(False)
-                ax.spines['left'].set_color('#CCCCCC')
-                ax.spines['bottom'].set_color('#CCCCCC')
-                
-                success = True
-                print("[Chart Debug] Improved bar chart created successfully")
-              
-            except Exception as e:
-                print(f"[Chart Debug] Bar chart error: {e}")
-                import traceback
-                traceback.print_exc()
-      
-        # Other chart types remain similar but with improved sizing...
-        
-        if not success:
-            plt.close(fig)
-            return None
-      
-        # IMPROVED: Better layout and higher quality export
-        plt.tight_layout(pad=2.0)  # More padding
-      
-        # IMPROVED: Higher quality image export
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', 
-                   dpi=200,  # Increased from 150
-                   bbox_inches='tight',
-                   facecolor='white', 
-                   edgecolor='none',
-                   pad_inches=0.2)  # Small padding around the image
-        buf.seek(0)
-        img_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-        plt.close(fig)
-      
-        print(f"[Chart Debug] Successfully created high-quality {chart_type} chart")
-      
-        return {
-            "type": chart_type,
-            "title": question,
-            "data_encoded": img_base64,
-            "engine": "matplotlib"
-        }
-      
-    except Exception as e:
-        print(f"[Chart Debug] Overall chart creation error: {e}")
+        logger.warning("Plotly error: %s", e)
         return None
+CHART_SIZES = {"full": 200, "preview": 72}  # dpi on the same 16x10in canvas
+chart_cache = ChartCache(max_bytes=int(os.getenv("CHART_CACHE_MAX_BYTES", str(128 * 1024 * 1024))))
+chart_renderer = ChartRenderService(
+    workers=int(os.getenv("CHART_WORKERS", "0")) or None,
+    max_pending=int(os.getenv("CHART_MAX_PENDING", "0")) or None,
+    queue_timeout=float(os.getenv("CHART_QUEUE_TIMEOUT", "5")),
+)
+# Ready once the render workers are up with matplotlib imported
+matplotlib_engine = LazyImport("matplotlib", chart_renderer.warm_up)
+metadata_prompt = LazyImport("metadata", get_system_prompt)
+ENGINES = [metadata_prompt, snowflake_connector, openai_sdk, matplotlib_engine, plotly_engine, pandasai_engine]
+REQUIRED_ENGINES = [metadata_prompt, snowflake_connector, openai_sdk]
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "1") == "1"
 # ---------- Main Chart Wrapper ----------
-def create_advanced_chart(columns, rows, chart_type, chart_engine, question):
+async def create_advanced_chart(columns, rows, chart_type, chart_engine, question,
+                                chart_size="full", chart_format="png", inline=False):
     """Main chart creation wrapper with better debugging"""
-    print(f"[Chart Debug] Starting chart creation:")
-    print(f" - Engine: {chart_engine}")
-    print(f" - Type: {chart_type}")
-    print(f" - Rows: {len(rows) if rows else 0}")
-    print(f" - Columns: {columns}")
+    logger.debug("[Chart Debug] Starting chart creation: engine=%s type=%s rows=%d columns=%s",
+                 chart_engine, chart_type, len(rows) if rows else 0, columns)
   
     if not rows or not columns:
-        print("[Chart Debug] No data to chart")
+        logger.debug("[Chart Debug] No data to chart")
         return None
   
     # For now, let's focus on matplotlib since it's most reliable
     if chart_engine in ["pandasai", "plotly"]:
-        print(f"[Chart Debug] Falling back to matplotlib from {chart_engine}")
+        logger.debug("[Chart Debug] Falling back to matplotlib from %s", chart_engine)
         chart_engine = "matplotlib"
   
-    result = create_enhanced_matplotlib_chart(columns, rows, chart_type, question)
-  
-    if result:
-        print(f"[Chart Debug] Chart created successfully!")
-        return result
+    dpi = CHART_SIZES.get(chart_size, CHART_SIZES["full"])
+    fmt = chart_format if chart_format in CHART_MIME_TYPES else "png"
+    key = chart_key(columns, rows, chart_type, chart_engine, dpi, fmt)
+    entry = chart_cache.get(key)
+    if entry:
+        logger.debug("[Chart Debug] Chart cache hit %s", key[:12])
     else:
-        print(f"[Chart Debug] Chart creation failed")
-        return None
+        try:
+            with span("chart_render"):
+                result = await chart_renderer.render(columns, rows, chart_type, question, fmt, dpi)
+        except ChartQueueFull as e:
+            logger.warning("[Chart Debug] %s", e)
+            return None
+        except Exception as e:
+            logger.warning("[Chart Debug] Render worker error: %s", e)
+            return None
+        if not result:
+            logger.debug("[Chart Debug] Chart creation failed")
+            return None
+        logger.debug("[Chart Debug] Chart created successfully!")
+        entry = chart_cache.put(key, result["image"], fmt, {"type": result["type"], "engine": result["engine"]})
+  
+    # Too large for the cache: the URL would not resolve, so inline instead
+    servable = chart_cache.peek(key) is not None
+    data_encoded = None
+    if inline or not servable:
+        with span("base64_encode"):
+            data_encoded = base64.b64encode(entry["image"]).decode("utf-8")
+    return ChartConfig(
+        type=entry["meta"]["type"], title=question, engine=entry["meta"]["engine"],
+        format=fmt, hash=key, url=f"/charts/{key}" if servable else None,
+        data_encoded=data_encoded,
+    )
 # ---------- Insights ----------
-def generate_insights(columns, rows):
-    if not rows or not columns:
+def generate_insights(columns, rows, df=None):
+    with span("insights"):
+        return _generate_insights(columns, rows, df)
+def _generate_insights(columns, rows, df):
+    if df is None and (not rows or not columns):
+        return {}
+    if df is not None and df.empty:
         return {}
     try:
-        df = pd.DataFrame(rows, columns=columns)
-        insights = {"total_records": len(rows), "columns_analyzed": len(columns)}
+        if df is None:
+            df = pd.DataFrame(rows, columns=columns)
+        insights = {"total_records": len(df), "columns_analyzed": len(columns)}
         numeric_cols = df.select_dtypes(include=[np.number]).columns
         if not numeric_cols.empty:
             insights["numeric_columns"] = len(numeric_cols)
@@ -467,21 +568,62 @@ def generate_insights(columns, rows):
     except Exception as e:
         return {"error": str(e)}
 # ---------- Upload Endpoint ----------
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_COPY_BYTES = 8 * 1024 * 1024
+
+def save_upload(file: UploadFile) -> tuple[str, list]:
+    """Write an upload to its own directory under UPLOAD_DIR without holding it in memory;
+    CSVs become Parquet.
+
+    Starlette has already spooled the body to a temporary file, so this is a
+    chunked copy (or a block-by-block CSV -> Parquet conversion) from disk to disk.
+    The directory is per request, so uploads of the same filename waiting in the
+    job queue never overwrite each other, while the file keeps its name (the
+    table name comes from it); remove_upload() deletes it. Runs in a worker thread.
+    """
+    upload_dir = os.path.join(UPLOAD_DIR, uuid.uuid4().hex)
+    os.makedirs(upload_dir)
+    try:
+        return _save_upload(file, upload_dir)
+    except BaseException:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise
+
+def _save_upload(file: UploadFile, upload_dir: str) -> tuple[str, list]:
+    filename = os.path.basename(file.filename or "upload.csv")
+    logs = []
+    if filename.lower().endswith(".csv") and loader.PYARROW_AVAILABLE:
+        parquet_path = os.path.join(upload_dir, filename[:-4] + ".parquet")
+        start = time.time()
+        try:
+            rows = loader.csv_to_parquet(file.file, parquet_path)
+            logs.append(f"Converted {filename} to Parquet: {rows} rows in {time.time() - start:.2f}s")
+            return parquet_path, logs
+        except Exception as e:
+            # pyarrow is stricter than pandas about ragged rows / mixed types: keep the CSV
+            logs.append(f"Parquet conversion failed ({e}), loading the CSV as uploaded")
+            file.file.seek(0)
+    file_path = os.path.join(upload_dir, filename)
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(file.file, f, UPLOAD_COPY_BYTES)
+    return file_path, logs
+
+def remove_upload(file_path: str):
+    """Delete the per-request directory save_upload() wrote `file_path` into."""
+    shutil.rmtree(os.path.dirname(file_path), ignore_errors=True)
+
 @app.post("/upload-file")
 async def upload_file(file: UploadFile = File(...)):
     try:
-        # Save uploaded file temporarily
-        os.makedirs("uploads", exist_ok=True)
-        file_path = os.path.join("uploads", file.filename)
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        # Call loader with local path
-        logs = run_loader([file_path])
-        # Cleanup optional: keep file for debugging, or uncomment to auto-delete
-        # os.remove(file_path)
+        file_path, logs = await run_in_threadpool(save_upload, file)
+        try:
+            # Call loader with local path
+            logs += await run_in_threadpool(run_loader, [file_path])
+        finally:
+            remove_upload(file_path)
         return JSONResponse({"details": logs})
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("request failed")
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 # ---------- Existing Run Loader ----------
 @app.post("/run-loader")
@@ -489,53 +631,468 @@ def run_loader_endpoint(payload: ApiInput):
     try:
         if not payload.apis or not isinstance(payload.apis, list):
             raise HTTPException(status_code=400, detail="apis must be a non-empty list of URLs")
-        logs = run_loader(payload.apis)
+        logs = run_loader(payload.apis, incremental=payload.incremental)
         return JSONResponse({"details": logs})
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("request failed")
         raise HTTPException(status_code=500, detail=f"Loader failed: {str(e)}")
+# ---------- Background Jobs ----------
+# Same loads as /run-loader and /upload-file, but the request returns a job id at once
+job_queue = JobQueue(
+    path=os.getenv("JOBS_DB_PATH", "jobs.db"),
+    workers=int(os.getenv("JOBS_WORKERS", "2")),
+    flush_interval=float(os.getenv("JOBS_FLUSH_INTERVAL", "1.0")),
+)
+def _loader_job(apis: list, incremental=None, logs: list = None):
+    def run(progress, cancel_event):
+        return (logs or []) + run_loader(apis, incremental=incremental, progress=progress, cancel_event=cancel_event)
+    return run
+@app.post("/jobs/run-loader", status_code=202)
+def submit_loader_job(payload: ApiInput):
+    if not payload.apis or not isinstance(payload.apis, list):
+        raise HTTPException(status_code=400, detail="apis must be a non-empty list of URLs")
+    job_id = job_queue.submit("run-loader", _loader_job(payload.apis, payload.incremental),
+                              {"apis": payload.apis, "incremental": payload.incremental})
+    return {"job_id": job_id, "status": "queued", "url": f"/jobs/{job_id}"}
+@app.post("/jobs/upload-file", status_code=202)
+async def submit_upload_job(file: UploadFile = File(...)):
+    # The upload is only readable during the request: save it now, load it in the background
+    try:
+        file_path, logs = await run_in_threadpool(save_upload, file)
+    except Exception as e:
+        logger.exception("request failed")
+        raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
+    job_id = job_queue.submit("upload-file", _loader_job([file_path], logs=logs),
+                              {"filename": file.filename, "path": file_path},
+                              cleanup=lambda: remove_upload(file_path))
+    return {"job_id": job_id, "status": "queued", "url": f"/jobs/{job_id}"}
+@app.get("/jobs")
+def list_jobs(limit: int = 50):
+    return {"jobs": job_queue.list(min(max(limit, 1), 500))}
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Job status with per-source rows fetched/cleaned/written and rows/s; `details` once finished."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job
 # ---------- Ask Endpoint ----------
+async def _skip():
+    return None
+def encode_result_response(response: AskResponse, table, fmt: str) -> Response:
+    """Columnar JSON or Arrow IPC body for an /ask answer whose rows are in an Arrow table."""
+    if fmt == "arrow":
+        meta = response.model_dump(mode="json", exclude={"rows", "data"})
+        return Response(arrow_ipc_bytes(table, meta), media_type=ARROW_STREAM_MIME)
+    return Response(columnar_json(response.model_dump(mode="json"), table), media_type="application/json")
+# Identical questions asked while one is already being answered wait for it instead of redoing it
+ASK_COALESCING = os.getenv("ASK_COALESCING", "1") == "1"
+ask_flights = SingleFlight()
+def ask_flight_key(req: AskRequest, accept: Optional[str]) -> tuple:
+    """Everything that shapes an /ask answer: the normalized question plus the output options."""
+    return (normalize_question(req.question), negotiate_format(accept, req.result_format),
+            req.include_summary, req.include_chart, req.chart_type, req.chart_engine, req.chart_size,
+            req.chart_format, req.inline_chart, req.include_timings)
+def coalesced_response(response, req: AskRequest):
+    if isinstance(response, AskResponse):
+        return response.model_copy(update={"question": req.question, "coalesced": True})
+    # Encoded columnar/Arrow body: same bytes, flagged in a header
+    return Response(response.body, media_type=response.media_type, headers={"X-Coalesced": "1"})
+async def watch_disconnect(request: Request, cancel: threading.Event, interval: float = 0.25):
+    """Set `cancel` once the client has gone away, so its Snowflake query is cancelled too."""
+    while not cancel.is_set():
+        if await request.is_disconnected():
+            cancel.set()
+            return
+        await asyncio.sleep(interval)
 @app.post("/ask", response_model=AskResponse)
-def ask(req: AskRequest):
-    conn = None
+async def ask(req: AskRequest, request: Request = None, accept: Optional[str] = Header(default=None)):
+    start = time.perf_counter()
+    with metrics.collect_timings() as timings:
+        try:
+            if not ASK_COALESCING:
+                cancel = threading.Event()
+                watcher = asyncio.create_task(watch_disconnect(request, cancel)) if request is not None else None
+                try:
+                    return await answer_question(req, accept, timings, cancel)
+                finally:
+                    cancel.set()
+                    if watcher is not None:
+                        watcher.cancel()
+            # Shared by every caller with the same question: its query is cancelled only once all of them have left
+            gone = threading.Event()
+            watcher = asyncio.create_task(watch_disconnect(request, gone)) if request is not None else None
+            try:
+                response, shared = await ask_flights.do(ask_flight_key(req, accept),
+                                                        lambda cancel: answer_question(req, accept, timings, cancel),
+                                                        left=watcher)
+            except CallerLeft:
+                raise HTTPException(status_code=499, detail="Client disconnected")
+            finally:
+                gone.set()
+                if watcher is not None:
+                    watcher.cancel()
+            return coalesced_response(response, req) if shared else response
+        finally:
+            metrics.record("total", time.perf_counter() - start)
+async def answer_question(req: AskRequest, accept: Optional[str], timings: dict, cancel: threading.Event = None):
     try:
-        print(f"[ASK] q='{req.question}', chart={req.include_chart}, engine={req.chart_engine}")
-        conn = get_snowflake_connection()
-        sql, explanation = generate_sql(req.question)
-        result = run_query(conn, sql)
+        logger.info("[ASK] q='%s', chart=%s, engine=%s", req.question, req.include_chart, req.chart_engine)
+        fmt = negotiate_format(accept, req.result_format)
+        sql, explanation = await run_in_threadpool(generate_sql, req.question)
+        result = await run_in_threadpool(run_query_cached, sql, fmt != "rows", cancel)
+        table = result.get("table")
+        if table is not None:
+            # Columnar/Arrow answers: only build Python rows where a stage really needs them
+            rows = await run_in_threadpool(table_rows, table) if req.include_chart and table.num_rows else []
+            preview = table_rows(table.slice(0, 5))
+            frame = await run_in_threadpool(table.to_pandas)
+        else:
+            rows = preview = result["rows"]
+            frame = None
         response_text = f"Retrieved {result['rowcount']} records"
-        ai_summary = generate_ai_summary(req.question, result["columns"], result["rows"], sql) if req.include_summary else None
-        chart = None
-        if req.include_chart and result["rowcount"] > 0:
-            chart = create_advanced_chart(result["columns"], result["rows"], req.chart_type, req.chart_engine, req.question)
-        insights = generate_insights(result["columns"], result["rows"])
-        return AskResponse(
+        if result.get("truncated"):
+            response_text += f" (first {result['rowcount']}"
+            response_text += f"; page through the rest with /results/{result['query_id']})" if result.get("query_id") else ")"
+        # Summary (network), chart (CPU) and insights only depend on the rows: run them together
+        summary_stage = (
+            generate_ai_summary(req.question, result["columns"], preview, sql)
+            if req.include_summary else _skip()
+        )
+        chart_stage = (
+            create_advanced_chart(result["columns"], rows, req.chart_type, req.chart_engine, req.question,
+                                  req.chart_size, req.chart_format, req.inline_chart)
+            if req.include_chart and result["rowcount"] > 0 else _skip()
+        )
+        insights_stage = run_in_threadpool(generate_insights, result["columns"], result.get("rows"), frame)
+        ai_summary, chart, insights = await asyncio.gather(summary_stage, chart_stage, insights_stage)
+        response = AskResponse(
             question=req.question, sql=sql, sql_explanation=explanation,
-            columns=result["columns"], rows=result["rows"], rowcount=result["rowcount"],
-            elapsed_ms=result["elapsed_ms"], response_text=response_text,
-            ai_summary=ai_summary, chart=chart, insights=insights
+            columns=result["columns"], rows=[] if table is not None else rows, rowcount=result["rowcount"],
+            elapsed_ms=result["elapsed_ms"], cached=result["cached"],
+            truncated=result.get("truncated", False), query_id=result.get("query_id"), format=fmt,
+            response_text=response_text, ai_summary=ai_summary, chart=chart, insights=insights,
+            timings=timings if req.include_timings else None
         )
+        if table is None:
+            return response
+        return await run_in_threadpool(encode_result_response, response, table, fmt)
+    except HTTPException:
+        raise
+    except SqlRejected as e:
+        raise HTTPException(status_code=400, detail=f"Query rejected: {e}")
+    except QueryTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except QueryCancelled as e:
+        raise HTTPException(status_code=499, detail=str(e))  # nobody is left to read it
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("/ask failed")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            try: conn.close()
-            except: pass
+# ---------- Streaming Ask ----------
+ASK_STREAM_PAGE = int(os.getenv("ASK_STREAM_PAGE", "100"))
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # no proxy buffering of events
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n"
+async def ask_events(req: AskRequest, request: Request = None):
+    """The /ask pipeline as Server-Sent Events, each sent as soon as its stage is done.
+
+    sql -> rows (first ASK_STREAM_PAGE rows, then the rest) -> insights, summary_delta...,
+    summary and chart in completion order -> done. A failing stage sends an error event.
+    """
+    start = time.perf_counter()
+    tasks = []
+    cancel = threading.Event()  # set when the client disconnects: stops the Snowflake query too
+    watcher = asyncio.create_task(watch_disconnect(request, cancel)) if request is not None else None
+    with metrics.collect_timings() as timings:
+        try:
+            logger.info("[ASK/stream] q='%s', chart=%s", req.question, req.include_chart)
+            sql, explanation = await run_in_threadpool(generate_sql, req.question)
+            yield sse_event("sql", {"question": req.question, "sql": sql, "sql_explanation": explanation})
+            metrics.record("stream_first_event", time.perf_counter() - start)
+            result = await run_in_threadpool(run_query_cached, sql, False, cancel)
+            columns, rows = result["columns"], result["rows"]
+            meta = {"rowcount": result["rowcount"], "elapsed_ms": result["elapsed_ms"], "cached": result["cached"],
+                    "truncated": result.get("truncated", False), "query_id": result.get("query_id")}
+            yield sse_event("rows", {"columns": columns, "rows": rows[:ASK_STREAM_PAGE], "offset": 0,
+                                     "has_more": len(rows) > ASK_STREAM_PAGE, **meta})
+
+            # Summary, chart and insights run together; their events go out in completion order
+            events = asyncio.Queue()
+            async def stage(event, coro):
+                try:
+                    await events.put((event, await coro))
+                except Exception as e:
+                    logger.exception("/ask/stream %s failed", event)
+                    await events.put(("error", {"stage": event, "detail": str(e)}))
+            async def summary():
+                parts = []
+                async for delta in stream_ai_summary(columns, rows[:5]):
+                    parts.append(delta)
+                    await events.put(("summary_delta", {"text": delta}))
+                return {"ai_summary": "".join(parts).strip()}
+            async def chart():
+                chart = await create_advanced_chart(columns, rows, req.chart_type, req.chart_engine, req.question,
+                                                    req.chart_size, req.chart_format, req.inline_chart)
+                return {"chart": chart.model_dump() if chart is not None else None}
+            async def insights():
+                return {"insights": await run_in_threadpool(generate_insights, columns, rows, None)}
+            tasks.append(asyncio.create_task(stage("insights", insights())))
+            if req.include_summary:
+                tasks.append(asyncio.create_task(stage("summary", summary())))
+            if req.include_chart and rows:
+                tasks.append(asyncio.create_task(stage("chart", chart())))
+
+            for offset in range(ASK_STREAM_PAGE, len(rows), ASK_STREAM_PAGE):
+                yield sse_event("rows", {"rows": rows[offset:offset + ASK_STREAM_PAGE], "offset": offset,
+                                         "has_more": offset + ASK_STREAM_PAGE < len(rows)})
+            remaining = len(tasks)
+            while remaining:
+                event, data = await events.get()
+                remaining -= event != "summary_delta"
+                yield sse_event(event, data)
+            metrics.record("stream_total", time.perf_counter() - start)
+            yield sse_event("done", {"elapsed_ms": int((time.perf_counter() - start) * 1000),
+                                     "timings": timings if req.include_timings else None})
+        except QueryCancelled as e:
+            logger.info("/ask/stream: %s", e)  # the client is gone; nothing left to send
+        except Exception as e:
+            logger.exception("/ask/stream failed")
+            yield sse_event("error", {"stage": "ask", "detail": str(e)})
+        finally:
+            cancel.set()
+            if watcher is not None:
+                watcher.cancel()
+            for task in tasks:  # client went away or a stage failed: stop the rest
+                task.cancel()
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest, request: Request):
+    """Server-Sent Events variant of /ask: the SQL first, then rows, insights, summary tokens and the chart."""
+    return StreamingResponse(ask_events(req, request), media_type="text/event-stream", headers=SSE_HEADERS)
+# ---------- Result Pages ----------
+def _check_query_id(query_id: str):
+    if not QUERY_ID_RE.match(query_id):
+        raise HTTPException(status_code=400, detail="Invalid query id")
+    if not issued_query_ids.allowed(query_id):
+        # Same answer as an expired result: don't reveal whether the id exists in Snowflake
+        raise HTTPException(status_code=404, detail=f"Result {query_id} is not available")
+
+def _json_default(v):
+    """Same encoding as AskResponse rows: ISO dates, Decimals as strings."""
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    return str(v)
+
+@app.get("/results/{query_id}", response_model=ResultPage)
+def get_result_page(query_id: str, offset: int = 0, limit: int = ASK_ROW_LIMIT, format: Optional[str] = None,
+                    accept: Optional[str] = Header(default=None)):
+    """One page of a finished query's result, re-read from Snowflake's result cache by query id."""
+    _check_query_id(query_id)
+    fmt = negotiate_format(accept, format)
+    limit = max(1, min(limit, RESULT_PAGE_MAX))
+    offset = max(0, offset)
+    try:
+        with snowflake_connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT * FROM TABLE(RESULT_SCAN(%s)) LIMIT %s OFFSET %s", (query_id, limit + 1, offset))
+                if fmt == "rows":
+                    fetched = cur.fetchall()
+                    cols = [c[0] for c in cur.description] if cur.description else []
+                else:
+                    table, has_more = fetch_arrow(cur, limit)
+            finally:
+                cur.close()
+    except snowflake_connector.require().errors.ProgrammingError as e:
+        raise HTTPException(status_code=404, detail=f"Result {query_id} is not available: {e}")
+    if fmt == "rows":
+        rows = jsonable_rows(fetched[:limit])
+        return ResultPage(query_id=query_id, columns=cols, rows=rows, offset=offset,
+                          rowcount=len(rows), has_more=len(fetched) > limit)
+    meta = {"query_id": query_id, "columns": table.column_names, "offset": offset,
+            "rowcount": table.num_rows, "has_more": has_more}
+    if fmt == "arrow":
+        return Response(arrow_ipc_bytes(table, meta), media_type=ARROW_STREAM_MIME)
+    return Response(columnar_json(meta, table), media_type="application/json")
+
+@app.get("/results/{query_id}/stream")
+def stream_result(query_id: str, format: Optional[str] = None, accept: Optional[str] = Header(default=None)):
+    """The whole result as NDJSON (a {"columns": [...]} line, then one JSON array per row)
+    or, when Arrow is negotiated, as one Arrow IPC stream.
+
+    Rows are pulled from the cursor batch by batch (RESULT_STREAM_BATCH rows, or
+    the connector's Arrow chunks) and written as they arrive, so the server never
+    holds the full result.
+    """
+    _check_query_id(query_id)
+    arrow = negotiate_format(accept, format) == "arrow"
+    conn = get_snowflake_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM TABLE(RESULT_SCAN(%s))", (query_id,))
+    except snowflake_connector.require().errors.ProgrammingError as e:
+        release_snowflake_connection(conn)
+        raise HTTPException(status_code=404, detail=f"Result {query_id} is not available: {e}")
+    except Exception:
+        release_snowflake_connection(conn, discard=True)
+        raise
+    columns = [c[0] for c in cur.description] if cur.description else []
+
+    def lines():
+        yield json.dumps({"columns": columns}) + "\n"
+        while True:
+            batch = cur.fetchmany(RESULT_STREAM_BATCH)
+            if not batch:
+                break
+            yield "".join(json.dumps(row, default=_json_default) + "\n" for row in batch)
+
+    def body(chunks):
+        discard = False
+        try:
+            yield from chunks
+        except BaseException as e:
+            discard = is_connection_error(e)
+            raise
+        finally:
+            cur.close()
+            release_snowflake_connection(conn, discard=discard)
+
+    if arrow:
+        return StreamingResponse(body(arrow_ipc_stream(iter_arrow_batches(cur), columns)), media_type=ARROW_STREAM_MIME)
+    return StreamingResponse(body(lines()), media_type="application/x-ndjson")
+# ---------- Chart Images ----------
+@app.get("/charts/{chart_hash}")
+def get_chart(chart_hash: str):
+    entry = chart_cache.peek(chart_hash)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Chart not found or evicted")
+    # Content-addressed: the bytes behind a hash never change
+    return Response(
+        content=entry["image"], media_type=entry["mime_type"],
+        headers={"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{chart_hash}"'},
+    )
 # ---------- Chart Options and Health Check ----------
 @app.get("/chart-options")
 def get_chart_options():
     return {
         "engines": {
             "matplotlib": {"available": True},
-            "plotly": {"available": PLOTLY_AVAILABLE},
-            "pandasai": {"available": PANDASAI_AVAILABLE}
+            "plotly": {"available": plotly_engine.installed()},
+            "pandasai": {"available": pandasai_engine.installed()}
         },
-        "types": ["auto", "bar", "line", "pie", "scatter", "heatmap", "histogram", "box", "dashboard"]
+        "types": ["auto", "bar", "line", "pie", "scatter", "heatmap", "histogram", "box", "dashboard"],
+        "sizes": list(CHART_SIZES),
+        "formats": list(CHART_MIME_TYPES),
     }
+metrics.REGISTRY.gauge("snowflake_pool_connections", "Pooled Snowflake connections by state.",
+                       lambda: {k: v for k, v in loader.sf_pool.stats().items() if k in ("idle", "in_use")}, "state")
+metrics.REGISTRY.gauge("snowflake_pool_timeouts_total", "Acquires that gave up waiting for a connection.",
+                       lambda: loader.sf_pool.stats()["timeouts"], kind="counter")
+metrics.REGISTRY.gauge("jobs", "Loader jobs by status.",
+                       lambda: {k: v for k, v in job_queue.stats().items() if k in JOB_STATUSES}, "status")
+metrics.REGISTRY.gauge("ask_coalesced_total", "/ask requests that shared an identical in-flight answer.",
+                       lambda: ask_flights.stats()["coalesced"], kind="counter")
+metrics.REGISTRY.gauge("ask_inflight", "Distinct /ask computations in flight.",
+                       lambda: ask_flights.stats()["in_flight"])
+metrics.REGISTRY.gauge("sql_guard_rejected_total", "Generated queries the SQL guard refused to run, by reason.",
+                       lambda: sql_guard.stats()["rejected"], "reason", kind="counter")
+metrics.REGISTRY.gauge("sql_guard_cancelled_total", "Queries cancelled in Snowflake, by cause.",
+                       lambda: {"timeout": sql_guard.timeouts, "disconnect": sql_guard.cancelled}, "cause", kind="counter")
+metrics.REGISTRY.gauge("cache_hits_total", "Cache hits by cache.", lambda: {
+    "sql": sql_cache.stats()["exact_hits"] + sql_cache.stats()["semantic_hits"],
+    "result": result_cache.stats()["hits"],
+    "chart": chart_cache.stats()["hits"],
+    **({"replica": loader.replica.hits} if loader.replica is not None else {}),
+}, "cache", kind="counter")
+metrics.REGISTRY.gauge("cache_misses_total", "Cache misses by cache.", lambda: {
+    "sql": sql_cache.stats()["misses"],
+    "result": result_cache.stats()["misses"],
+    "chart": chart_cache.stats()["misses"],
+    **({"replica": loader.replica.fallbacks + loader.replica.errors} if loader.replica is not None else {}),
+}, "cache", kind="counter")
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition: per-stage latency histograms plus pool/cache counters."""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+def is_ready() -> bool:
+    """Required engines loaded; without the start-up warm-up they load lazily, so always ready."""
+    return not WARM_UP_ON_START or all(e.state == "ready" for e in REQUIRED_ENGINES)
+@app.get("/ready")
+def readiness():
+    """Readiness probe: 503 until the warm-up has loaded the engines every /ask needs."""
+    engines = {e.name: e.status() for e in ENGINES}
+    if not is_ready():
+        return JSONResponse({"ready": False, "engines": engines}, status_code=503)
+    return {"ready": True, "engines": engines}
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "plotly": PLOTLY_AVAILABLE, "pandasai": PANDASAI_AVAILABLE}
+    return {
+        "status": "ok", "ready": is_ready(),
+        # Reported without importing anything: "not_loaded" until first use or warm-up
+        "engines": {e.name: e.status() for e in ENGINES},
+        "plotly": plotly_engine.state == "ready", "pandasai": pandasai_engine.state == "ready",
+        "snowflake_pool": loader.sf_pool.stats(),
+        "sql_cache": sql_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "chart_renderer": chart_renderer.stats(),
+        "chart_cache": chart_cache.stats(),
+        "replica": loader.replica.stats() if loader.replica is not None else None,
+        "prompt": {"retrieval": PROMPT_RETRIEVAL, **schema_index.stats()},
+        "jobs": job_queue.stats(),
+        "ask_coalescing": {"enabled": ASK_COALESCING, **ask_flights.stats()},
+        "sql_guard": sql_guard.stats(),
+        "result_query_ids": issued_query_ids.stats(),
+    }
+def warm_replica():
+    """Fill the replica from Snowflake so hot tables are local before the next loader run."""
+    for table in sorted(loader.replica.tables):
+        try:
+            with loader.sf_pool.connection() as conn:
+                loader.replica.mirror_from(conn, table)
+        except Exception as e:
+            logger.warning("[Replica] warm-up of %s failed: %s", table, e)
+# Table versions key the result cache and the replica. A load in another worker process
+# only reaches this one through Snowflake's LAST_ALTERED, polled this often (0: never,
+# for single-process deployments, where the local write counters are enough)
+TABLE_VERSION_SYNC_SECONDS = float(os.getenv("TABLE_VERSION_SYNC_SECONDS", "30"))
+def follow_table_versions(warm: bool):
+    """Keep table versions in step with loads made by other processes, re-mirroring replicated
+    tables they changed; with `warm`, fill the replica once the first versions are known."""
+    first = True
+    while True:
+        try:
+            with loader.sf_pool.connection() as conn:
+                changed = loader.sync_table_versions(conn)
+                if loader.replica is not None and not first:
+                    for table in sorted(changed & loader.replica.mirrored()):
+                        logger.info("[Replica] %s changed in Snowflake, refreshing", table)
+                        loader.replica.mirror_from(conn, table)
+        except Exception as e:
+            logger.warning("[Versions] LAST_ALTERED sync failed: %s", e)
+        if first and warm:
+            warm_replica()
+        first = False
+        time.sleep(TABLE_VERSION_SYNC_SECONDS)
+@app.on_event("startup")
+def startup():
+    warm = loader.replica is not None and os.getenv("REPLICA_WARM_ON_START", "1") == "1"
+    if TABLE_VERSION_SYNC_SECONDS > 0:
+        threading.Thread(target=follow_table_versions, args=(warm,), name="table-versions", daemon=True).start()
+    elif warm:
+        threading.Thread(target=warm_replica, name="replica-warmup", daemon=True).start()
+    if WARM_UP_ON_START:
+        threading.Thread(target=warm_up, args=(ENGINES,), name="engine-warmup", daemon=True).start()
+    maybe_refresh_schema_index()
+@app.on_event("shutdown")
+def shutdown():
+    chart_renderer.shutdown()
+    job_queue.shutdown()
+    loader.sf_pool.close_all()
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+
+class CallerLeft(Exception):
+    """This caller went away before the shared result was ready."""
+
+
+class _Flight:
+    __slots__ = ("task", "cancel", "waiters")
+
+    def __init__(self):
+        self.task = None
+        self.cancel = threading.Event()  # set once every waiter has left
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent identical async calls onto one running computation.
+
+    The first caller for a key (the leader) starts `fn(cancel)` as its own
+    task; callers arriving with the same key while it runs await that task and
+    share its result or exception. Nothing is kept once the task finishes, so
+    this is deduplication of in-flight work, not a cache. The task is shielded,
+    so a caller that disconnects does not cancel the work for the others; the
+    flight counts its waiters instead, and when the last one has left it sets
+    `cancel` (a threading.Event shared by the flight) so `fn` can stop, and
+    later callers start a fresh flight.
+    """
+
+    def __init__(self):
+        self._inflight = {}  # key -> _Flight
+        self._lock = threading.Lock()  # counters are read from /health and /metrics threads
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.abandoned = 0
+
+    async def do(self, key, fn, left=None) -> tuple:
+        """Run (or join) `fn(cancel)` for `key`; returns (result, shared) where shared means it was joined.
+
+        `left` is an awaitable that completes when this caller has gone away;
+        the call then raises CallerLeft instead of waiting for the result.
+        """
+        flight = self._inflight.get(key)
+        shared = flight is not None
+        if shared:
+            with self._lock:
+                self.coalesced += 1
+        else:
+            flight = _Flight()
+            flight.task = asyncio.ensure_future(fn(flight.cancel))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda t: self._finished(key, flight))
+            with self._lock:
+                self.leaders += 1
+        flight.waiters += 1
+        try:
+            if left is None:
+                return await asyncio.shield(flight.task), shared
+            left = asyncio.ensure_future(left)
+            await asyncio.wait({flight.task, left}, return_when=asyncio.FIRST_COMPLETED)
+            if not flight.task.done():
+                raise CallerLeft(key)
+            return flight.task.result(), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is waiting any more: stop the work and let the next caller start over
+                flight.cancel.set()
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+                with self._lock:
+                    self.abandoned += 1
+
+    def _finished(self, key, flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        task = flight.task
+        if not task.cancelled() and task.exception() is not None:
+            with self._lock:
+                self.errors += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.leaders + self.coalesced
+            return {
+                "in_flight": len(self._inflight),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "abandoned": self.abandoned,
+                "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0,
+            }
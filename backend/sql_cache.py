@@ -0,0 +1,154 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+_WS_RE = re.compile(r"\s+")
+_TRAILING_RE = re.compile(r"[\s?.!;]+$")
+# Literals that change the meaning of a question even when the wording is nearly identical
+_LITERAL_RE = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"")
+_WORD_RE = re.compile(r"[a-z]+")
+# Words that only dress up a question; every other word has to appear on both sides of a semantic hit
+FILLER_WORDS = {"a", "an", "the", "please", "show", "me", "give", "list", "display", "get", "find", "what",
+                "whats", "which", "is", "are", "was", "were", "can", "could", "would", "you", "i", "want",
+                "to", "see", "tell", "us", "of", "for", "in", "on", "by", "all", "each", "every", "per", "and"}
+
+
+def normalize_question(question: str) -> str:
+    q = question.strip().lower()
+    q = q.replace("’", "'").replace("“", '"').replace("”", '"')
+    q = _WS_RE.sub(" ", q)
+    return _TRAILING_RE.sub("", q)
+
+
+def _ngrams(text: str, n: int) -> Counter:
+    padded = f" {text} "
+    return Counter(padded[i:i + n] for i in range(max(len(padded) - n + 1, 1)))
+
+
+def meaning_key(question: str) -> tuple:
+    """What two questions must share before one's SQL may answer the other: the literals
+    and every word that is not filler. Negations (not, without, except...), comparisons
+    (above, top, last...) and singular/plural forms all change the query, so they must match."""
+    words = set(_WORD_RE.findall(_LITERAL_RE.sub(" ", question))) - FILLER_WORDS
+    return tuple(_LITERAL_RE.findall(question)), tuple(sorted(words))
+
+
+class SqlCache:
+    """Two-tier NL->SQL cache.
+
+    Tier 1 matches the normalized question exactly. Tier 2 matches near-duplicate
+    phrasings by cosine similarity over character n-grams, and only when both
+    questions have the same meaning_key(): the same literals (numbers, quoted
+    values) and the same non-filler words, so "top 5" never answers "top 10"
+    and "not loyalty members" never answers "loyalty members". Entries share
+    one LRU with a TTL, and the whole cache is dropped whenever the
+    prompt/schema fingerprint changes.
+    """
+
+    def __init__(self, max_entries=512, ttl=3600.0, similarity_threshold=0.92, ngram=3):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.ngram = ngram
+        self._entries = OrderedDict()  # normalized question -> entry dict
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # ---------- Internals ----------
+    def _check_fingerprint_locked(self, fingerprint):
+        if fingerprint != self._fingerprint:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._fingerprint = fingerprint
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry["created"] > self.ttl
+
+    def _best_semantic_match_locked(self, vector, norm, meaning, now):
+        best_key, best_score = None, 0.0
+        for key, entry in list(self._entries.items()):
+            if self._expired(entry, now):
+                del self._entries[key]
+                continue
+            if entry["meaning"] != meaning:
+                continue
+            dot = sum(c * entry["vector"].get(g, 0) for g, c in vector.items())
+            score = dot / (norm * entry["norm"]) if norm and entry["norm"] else 0.0
+            if score > best_score:
+                best_key, best_score = key, score
+        if best_key is not None and best_score >= self.similarity_threshold:
+            return best_key, best_score
+        return None, best_score
+
+    # ---------- Public API ----------
+    def get(self, question: str, fingerprint: str):
+        """Return (sql, explanation, tier) or None."""
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._check_fingerprint_locked(fingerprint)
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["sql"], entry["explanation"], "exact"
+
+            vector = _ngrams(key, self.ngram)
+            norm = math.sqrt(sum(c * c for c in vector.values()))
+            match, _ = self._best_semantic_match_locked(vector, norm, meaning_key(key), now)
+            if match is not None:
+                self._entries.move_to_end(match)
+                self.semantic_hits += 1
+                entry = self._entries[match]
+                return entry["sql"], entry["explanation"], "semantic"
+
+            self.misses += 1
+            return None
+
+    def put(self, question: str, fingerprint: str, sql: str, explanation):
+        key = normalize_question(question)
+        vector = _ngrams(key, self.ngram)
+        with self._lock:
+            self._check_fingerprint_locked(fingerprint)
+            self._entries[key] = {
+                "sql": sql,
+                "explanation": explanation,
+                "created": time.time(),
+                "vector": vector,
+                "norm": math.sqrt(sum(c * c for c in vector.values())),
+                "meaning": meaning_key(key),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "exact_hit_rate": round(self.exact_hits / lookups, 4) if lookups else 0.0,
+                "semantic_hit_rate": round(self.semantic_hits / lookups, 4) if lookups else 0.0,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "similarity_threshold": self.similarity_threshold,
+            }
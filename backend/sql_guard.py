@@ -0,0 +1,275 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from result_cache import canonicalize_sql, referenced_tables
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    SQLGLOT_AVAILABLE = True
+except ImportError:
+    SQLGLOT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Without sqlglot (or when it cannot parse the query): conservative text checks
+_WRITE_RE = re.compile(
+    r"\b(?:insert|update|delete|merge|create|drop|alter|truncate|grant|revoke|call|put|copy|use|undrop)\b")
+_TRAILING_LIMIT_RE = re.compile(r"\blimit\s+(\d+)\s*(?:offset\s+\d+\s*)?;?\s*$", re.IGNORECASE)
+_CROSS_JOIN_RE = re.compile(r"\bcross\s+join\b")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+
+
+class SqlRejected(Exception):
+    """The query must not run; `reason` is a short tag for metrics (statement, cross_join, scan, ...)."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class QueryTimeout(Exception):
+    """The statement ran past the statement timeout and was cancelled in Snowflake."""
+
+
+class QueryCancelled(Exception):
+    """The statement was cancelled in Snowflake because nobody is waiting for it any more."""
+
+
+class SqlGuard:
+    """Checks generated SQL before it reaches the warehouse and bounds how long it may run there.
+
+    `check(sql)` parses the query with sqlglot (text checks when sqlglot is
+    missing or cannot parse it): one read-only statement, an outer LIMIT of
+    at most `max_rows` (injected or tightened), and no join without a join
+    condition between two tables when either has `big_table_rows` rows or
+    more. Row counts come from `row_counts()`, the schema index's view of
+    metadata.txt / INFORMATION_SCHEMA.
+
+    At execution, `preflight()` compiles queries over big tables with
+    EXPLAIN and rejects plans that would scan more than `max_scan_bytes`,
+    and `execute()` submits the statement asynchronously and cancels it in
+    Snowflake once it runs past `statement_timeout` seconds or its cancel
+    event is set (the client went away).
+    """
+
+    def __init__(self, row_counts=None, max_rows=100_000, big_table_rows=1_000_000, max_scan_bytes=10 * 2**30,
+                 statement_timeout=120.0, poll_interval=0.05, max_poll_interval=0.25):
+        self._row_counts = row_counts or (lambda: {})
+        self.max_rows = max_rows
+        self.big_table_rows = big_table_rows
+        self.max_scan_bytes = max_scan_bytes
+        self.statement_timeout = statement_timeout
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.limits_injected = 0
+        self.limits_tightened = 0
+        self.rejected = {}  # reason -> count
+        self.preflights = 0
+        self.preflight_errors = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    def _count(self, counter: str, n: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def _reject(self, reason: str, message: str):
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        logger.warning("[SQL Guard] rejected (%s): %s", reason, message)
+        raise SqlRejected(reason, message)
+
+    def _rows(self, table: str) -> int:
+        return self._row_counts().get(table.upper(), 0)
+
+    # ---------- Static checks ----------
+    def check(self, sql: str) -> str:
+        """The SQL to run for a generated query (LIMIT injected or tightened); raises SqlRejected."""
+        self._count("checked")
+        sql = sql.strip().rstrip(";").strip()
+        tree = None
+        if SQLGLOT_AVAILABLE:
+            try:
+                statements = [s for s in sqlglot.parse(sql, read="snowflake") if s is not None]
+            except Exception:
+                statements = None  # dialect corner sqlglot does not know: fall back to the text checks
+            if statements is not None:
+                if len(statements) != 1:
+                    self._reject("statement", f"expected one statement, got {len(statements)}")
+                tree = statements[0]
+        if tree is None:
+            return self._check_text(sql)
+        writes = tuple(getattr(exp, name) for name in ("Insert", "Update", "Delete", "Merge", "Create", "Drop",
+                                                       "Alter", "TruncateTable", "Command") if hasattr(exp, name))
+        if not isinstance(tree, exp.Query) or tree.find(*writes):
+            self._reject("statement", "only a single read-only SELECT may run")
+        self._check_joins(tree)
+        return self._limit(tree, sql)
+
+    def _check_joins(self, tree):
+        ctes = {cte.alias_or_name.upper() for cte in tree.find_all(exp.CTE)}
+        def base(source):
+            return isinstance(source, exp.Table) and source.name.upper() not in ctes
+        for select in tree.find_all(exp.Select):
+            joins = select.args.get("joins")
+            source = select.args.get("from_") or select.args.get("from")
+            if not joins or source is None:
+                continue
+            sources = [source.this]
+            where = select.args.get("where")
+            for join in joins:
+                right = join.this
+                condition = join.args.get("on")
+                unbounded = (not join.args.get("using") and not join.args.get("method")  # NATURAL joins match by name
+                             and (condition is None or not condition.find(exp.Column))  # also ON TRUE / ON 1 = 1
+                             and base(right) and not self._joined_in(where, right))
+                if unbounded:
+                    left = [s for s in sources if base(s)]
+                    big = [t.name.upper() for t in (right, *left) if self._rows(t.name) >= self.big_table_rows]
+                    if left and big:
+                        self._reject("cross_join", f"join of {right.name.upper()} with "
+                                     f"{', '.join(t.name.upper() for t in left)} has no join condition "
+                                     f"(tables of {self.big_table_rows:,}+ rows: {', '.join(big)})")
+                sources.append(right)
+
+    @staticmethod
+    def _joined_in(where, table) -> bool:
+        """A comma join whose WHERE equates a column of `table` with another table's (unqualified counts too)."""
+        if where is None:
+            return False
+        alias = table.alias_or_name.upper()
+        for eq in where.find_all(exp.EQ):
+            left, right = eq.this, eq.expression
+            if isinstance(left, exp.Column) and isinstance(right, exp.Column):
+                tables = {left.table.upper(), right.table.upper()}
+                if "" in tables or (alias in tables and len(tables) == 2):
+                    return True
+        return False
+
+    def _limit(self, tree, sql: str) -> str:
+        if tree.args.get("fetch") is not None:
+            return sql  # FETCH FIRST n ROWS: bounded already
+        # Edit the generated text where that is safe; re-rendering through sqlglot rewrites the whole query
+        limit = tree.args.get("limit")
+        if limit is None:
+            self._count("limits_injected")
+            if tree.args.get("offset") is None:
+                return f"{sql}\nLIMIT {self.max_rows}"  # own line: survives a trailing -- comment
+        else:
+            value = limit.expression
+            if isinstance(value, exp.Literal) and value.is_int and int(value.this) <= self.max_rows:
+                return sql
+            self._count("limits_tightened")
+            match = _TRAILING_LIMIT_RE.search(sql)
+            if match:
+                return f"{sql[:match.start(1)]}{self.max_rows}{sql[match.end(1):]}"
+        return tree.limit(self.max_rows, copy=False).sql(dialect="snowflake")
+
+    def _check_text(self, sql: str) -> str:
+        text = _STRING_RE.sub("''", canonicalize_sql(sql))
+        if ";" in text or not text.startswith(("select", "with")) or _WRITE_RE.search(text):
+            self._reject("statement", "only a single read-only SELECT may run")
+        big = sorted(t for t in referenced_tables(sql) if self._rows(t) >= self.big_table_rows)
+        if big and _CROSS_JOIN_RE.search(text):
+            self._reject("cross_join", f"CROSS JOIN over tables of {self.big_table_rows:,}+ rows: {', '.join(big)}")
+        match = _TRAILING_LIMIT_RE.search(sql)
+        if match and int(match.group(1)) <= self.max_rows:
+            return sql
+        self._count("limits_tightened" if match else "limits_injected")
+        return f"SELECT * FROM (\n{sql}\n) LIMIT {self.max_rows}"
+
+    # ---------- Execution ----------
+    def needs_preflight(self, sql: str) -> bool:
+        """EXPLAIN only queries over big (or unknown) tables; small ones cannot scan much."""
+        if not self.max_scan_bytes:
+            return False
+        counts = self._row_counts()
+        tables = referenced_tables(sql)
+        return not tables or any(counts.get(t, self.big_table_rows) >= self.big_table_rows for t in tables)
+
+    def preflight(self, cur, sql: str):
+        """Compile `sql` with EXPLAIN and reject it when the plan scans more than max_scan_bytes."""
+        self._count("preflights")
+        try:
+            cur.execute(f"EXPLAIN USING JSON {sql}")
+            row = cur.fetchone()
+            plan = json.loads(row[0]) if row and isinstance(row[0], str) else (row[0] if row else {})
+            stats = plan.get("GlobalStats", {})
+        except Exception as e:
+            # Let the statement itself run (and report its own compile error, if that is what this was)
+            self._count("preflight_errors")
+            logger.warning("[SQL Guard] EXPLAIN failed, running without preflight: %s", e)
+            return
+        scanned = stats.get("bytesAssigned") or 0
+        if scanned > self.max_scan_bytes:
+            self._reject("scan", f"would scan {scanned / 2**30:.1f} GiB in {stats.get('partitionsAssigned')} "
+                                 f"partitions (limit {self.max_scan_bytes / 2**30:.1f} GiB)")
+
+    def execute(self, cur, sql: str, cancel: threading.Event = None):
+        """Run `sql` on a Snowflake cursor, cancelling it in the warehouse past the statement
+        timeout (QueryTimeout) or once `cancel` is set (QueryCancelled). Results are then fetched
+        from the cursor as after cur.execute()."""
+        cur.execute_async(sql)
+        query_id, conn = cur.sfqid, cur.connection
+        deadline = time.monotonic() + self.statement_timeout if self.statement_timeout else None
+        delay = self.poll_interval
+        while conn.is_still_running(conn.get_query_status_throw_if_error(query_id)):
+            if cancel is not None and cancel.is_set():
+                self._cancel(cur, query_id)
+                self._count("cancelled")
+                raise QueryCancelled(f"query {query_id} cancelled: the client disconnected")
+            if deadline is not None and time.monotonic() >= deadline:
+                self._cancel(cur, query_id)
+                self._count("timeouts")
+                raise QueryTimeout(f"query {query_id} cancelled after the {self.statement_timeout:g}s statement timeout")
+            if cancel is not None:
+                cancel.wait(delay)
+            else:
+                time.sleep(delay)
+            delay = min(delay * 1.5, self.max_poll_interval)
+        cur.get_results_from_sfqid(query_id)
+        return cur
+
+    @staticmethod
+    def _cancel(cur, query_id: str):
+        try:
+            cur.execute("SELECT SYSTEM$CANCEL_QUERY(%s)", (query_id,))
+            logger.info("[SQL Guard] cancelled query %s", query_id)
+        except Exception as e:
+            logger.warning("[SQL Guard] could not cancel query %s: %s", query_id, e)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sqlglot": SQLGLOT_AVAILABLE,
+                "max_rows": self.max_rows,
+                "big_table_rows": self.big_table_rows,
+                "max_scan_bytes": self.max_scan_bytes,
+                "statement_timeout": self.statement_timeout,
+                "checked": self.checked,
+                "limits_injected": self.limits_injected,
+                "limits_tightened": self.limits_tightened,
+                "rejected": dict(self.rejected),
+                "preflights": self.preflights,
+                "preflight_errors": self.preflight_errors,
+                "timeouts": self.timeouts,
+                "cancelled": self.cancelled,
+            }
+
+
+def create_sql_guard(row_counts=None):
+    """The guard configured from SQL_GUARD_* settings (0 turns the scan budget / timeout off)."""
+    return SqlGuard(
+        row_counts,
+        max_rows=int(os.getenv("SQL_GUARD_MAX_ROWS", "100000")),
+        big_table_rows=int(os.getenv("SQL_GUARD_BIG_TABLE_ROWS", "1000000")),
+        max_scan_bytes=int(float(os.getenv("SQL_GUARD_MAX_SCAN_GB", "10")) * 2**30),
+        statement_timeout=float(os.getenv("SQL_GUARD_STATEMENT_TIMEOUT", "120")),
+    )
@@ -53,7 +53,7 @@ interface Message {
   chartType?: string;
   chartEngine?: string;
   insights?: any;
-  fullData?: {columns: string[], rows: any[], rowcount: number};
+  fullData?: {columns: string[], rows: any[], rowcount: number, truncated?: boolean, queryId?: string};
   tableData?: {columns: string[], rows: any[], hasMore: boolean, moreCount: number};
 }
 
@@ -342,7 +342,7 @@ const Chat = () => {
       }
 
       const data = await res.json();
-      const { sql, columns, rows, rowcount, elapsed_ms, ai_summary, chart, insights, response_text } = data;
+      const { sql, columns, rows, rowcount, elapsed_ms, ai_summary, chart, insights, response_text, truncated, query_id } = data;
 
       let reply = response_text || "";
       let fullData = undefined;
@@ -367,7 +367,7 @@ const Chat = () => {
 
         // Store full data for modal
         if (rowcount > 5) {
-          fullData = { columns, rows, rowcount };
+          fullData = { columns, rows, rowcount, truncated, queryId: query_id };
         }
       }
 
@@ -394,13 +394,19 @@ const Chat = () => {
 
       if (enableCharts && chart) {
         console.log("Chart data received:", chart);
-        if (chart.data_encoded) {
-          chartImage = `data:image/png;base64,${chart.data_encoded}`;
+        if (chart.url) {
+          chartImage = `${API_URL}${chart.url}`;
+          chartType_final = chart.type;
+          chartEngine_final = chart.engine;
+          console.log("Chart image URL received");
+        } else if (chart.data_encoded) {
+          const mime = chart.format === "svg" ? "image/svg+xml" : `image/${chart.format || "png"}`;
+          chartImage = `data:${mime};base64,${chart.data_encoded}`;
           chartType_final = chart.type;
           chartEngine_final = chart.engine;
           console.log("Chart image created successfully");
         } else {
-          console.warn("Chart object exists but no data_encoded found");
+          console.warn("Chart object exists but has neither url nor data_encoded");
         }
       } else if (enableCharts && !chart) {
         console.warn("Charts enabled but no chart returned");
@@ -593,7 +599,7 @@ const Chat = () => {
 
   /* ---------- Full Results Modal ---------- */
   const [fullResultsModalOpen, setFullResultsModalOpen] = useState(false);
-  const [fullResultsData, setFullResultsData] = useState<{columns: string[], rows: any[]}>({columns: [], rows: []});
+  const [fullResultsData, setFullResultsData] = useState<{columns: string[], rows: any[], truncated?: boolean, queryId?: string}>({columns: [], rows: []});
 
   /* ---------- Conversation item menu state ---------- */
   const [menuOpenFor, setMenuOpenFor] = useState<string | null>(null);
@@ -1313,7 +1319,18 @@ const Chat = () => {
   <DialogContent className="sm:max-w-6xl max-h-[80vh]">
     <DialogHeader>
       <DialogTitle>Complete Results</DialogTitle>
-      <DialogDescription>All {fullResultsData.rows.length} rows from your query.</DialogDescription>
+      <DialogDescription>
+        {fullResultsData.truncated && fullResultsData.queryId ? (
+          <>
+            First {fullResultsData.rows.length} rows from your query.{" "}
+            <a className="underline" href={`${API_URL}/results/${fullResultsData.queryId}/stream`} target="_blank" rel="noreferrer">
+              Download all rows (NDJSON)
+            </a>
+          </>
+        ) : (
+          <>All {fullResultsData.rows.length} rows from your query.</>
+        )}
+      </DialogDescription>
     </DialogHeader>
     <div className="overflow-auto bg-muted/30 rounded-md border border-border/50" style={{maxHeight: '60vh'}}>
       <Table>